@@ -9,7 +9,12 @@ from datetime import datetime
 from auth_firebase import get_all_users_firebase, delete_user_firebase, create_default_admin
 from analytics import get_all_users_analytics, get_global_stats
 from firebase_config import is_firebase_connected, get_firestore_db
+from admin_utils import reset_all_students_analytics, clear_all_chat_interactions, bulk_progress
+from profiling import profiled, profiling_enabled, traces
+from llm_telemetry import telemetry
+from insight_cache import insight_cache
 
+@profiled("ui")
 def show_admin_dashboard():
     """Dashboard de administração"""
     st.title("Painel de Administração - BioTutor")
@@ -41,7 +46,7 @@ def show_admin_dashboard():
     st.markdown("---")
     
     # Tabs para diferentes funcionalidades
-    tab1, tab2, tab3, tab4 = st.tabs(["Usuários", "Dados", "Estatísticas", "Sistema"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Usuários", "Dados", "Estatísticas", "Sistema", "Desempenho", "Uso da IA"])
     
     with tab1:
         show_users_management()
@@ -54,6 +59,12 @@ def show_admin_dashboard():
     
     with tab4:
         show_system_management()
+    
+    with tab5:
+        show_performance_panel()
+    
+    with tab6:
+        show_llm_usage_panel()
 
 def show_users_management():
     """Gerenciamento de usuários"""
@@ -208,14 +219,11 @@ def show_data_management():
             if st.session_state.get('confirm_delete_analytics'):
                 try:
                     if is_firebase_connected():
-                        db = get_firestore_db()
-                        # Exclui todos os documentos da coleção case_analytics
-                        docs = db.collection('case_analytics').stream()
-                        deleted_count = 0
-                        for doc in docs:
-                            doc.reference.delete()
-                            deleted_count += 1
-                        st.success(f"{deleted_count} registros de analytics excluídos!")
+                        bar = st.progress(0.0, text="Excluindo analytics...")
+                        res = reset_all_students_analytics(progress_callback=bulk_progress(bar))
+                        st.success(f"{res['deleted']} registros de analytics excluídos!")
+                        if res['errors']:
+                            st.warning(f"{res['errors']} falharam — clique de novo para retomar do último lote.")
                     else:
                         st.error("Firebase não está conectado")
                 except Exception as e:
@@ -231,14 +239,11 @@ def show_data_management():
             if st.session_state.get('confirm_delete_chat'):
                 try:
                     if is_firebase_connected():
-                        db = get_firestore_db()
-                        # Exclui todos os documentos da coleção chat_interactions
-                        docs = db.collection('chat_interactions').stream()
-                        deleted_count = 0
-                        for doc in docs:
-                            doc.reference.delete()
-                            deleted_count += 1
-                        st.success(f"{deleted_count} interações do chat excluídas!")
+                        bar = st.progress(0.0, text="Excluindo interações...")
+                        res = clear_all_chat_interactions(progress_callback=bulk_progress(bar))
+                        st.success(f"{res['deleted']} interações do chat excluídas!")
+                        if res['errors']:
+                            st.warning(f"{res['errors']} falharam — clique de novo para retomar do último lote.")
                     else:
                         st.error("Firebase não está conectado")
                 except Exception as e:
@@ -278,6 +283,22 @@ def show_data_management():
             
             with col3:
                 st.metric("Interações do Chat", chat_interactions_count)
+            
+            st.caption(f"Armazenamento estimado: {stats.get('estimated_storage_bytes', 0) / (1024 * 1024):.1f} MB")
+            
+            if len(stats.get('shards', [])) > 1:
+                with st.expander("Detalhamento por Firebase"):
+                    st.dataframe([
+                        {
+                            'Firebase': f"#{s['shard']}",
+                            'Analytics': s['case_analytics'],
+                            'Sessões de Chat': s['chat_interactions'],
+                            'Mensagens': s['chat_messages'],
+                            'Usuários': s['users'],
+                            'Estimativa (MB)': round(s['estimated_bytes'] / (1024 * 1024), 2)
+                        }
+                        for s in stats['shards']
+                    ], use_container_width=True, hide_index=True)
         
     except Exception as e:
         st.error(f"Erro ao carregar estatísticas: {e}")
@@ -382,3 +403,206 @@ def show_system_management():
                 "firebase_connected": is_firebase_connected(),
                 "current_time": datetime.now().isoformat()
             })
+    
+    # Shards do Firestore
+    st.subheader("Shards do Firestore")
+    from firebase_config import get_shard_count
+    from shard_rebalancer import plan_moves, start_background_rebalance, get_rebalance_status
+    
+    st.caption(f"{get_shard_count()} shards configurados")
+    status = get_rebalance_status()
+    if status['running']:
+        st.info(f"Rebalanceando: {status['moved_users']}/{status['planned']} usuários movidos ({status['moved_docs']} documentos)")
+    elif st.button("Rebalancear Usuários entre Shards"):
+        moves = plan_moves()
+        if not moves:
+            st.success("Todos os usuários já estão no shard-alvo.")
+        else:
+            start_background_rebalance()
+            st.info(f"Rebalanceamento iniciado em segundo plano: {len(moves)} usuários a mover.")
+    
+    # Carga e latência por shard (contadores do processo atual)
+    st.subheader("Carga por Shard (hoje)")
+    from firestore_metrics import metrics
+    
+    ops_rows = metrics.ops_table()
+    if not ops_rows:
+        st.info("Nenhuma operação no Firestore registrada ainda neste processo.")
+    else:
+        st.dataframe(pd.DataFrame(ops_rows).rename(columns={
+            'shard': 'Shard', 'collection': 'Coleção', 'read': 'Leituras', 'write': 'Escritas', 'delete': 'Deleções'
+        }), use_container_width=True, hide_index=True)
+        
+        st.markdown("**Projeção de consumo da cota diária**")
+        for row in metrics.quota_projection():
+            if not row['used_today']:
+                continue
+            label = {'read': 'Leituras', 'write': 'Escritas', 'delete': 'Deleções'}[row['kind']]
+            st.progress(
+                min(row['projected_pct'] / 100, 1.0),
+                text=f"Shard {row['shard']} · {label}: {row['used_today']} hoje → ~{row['projected']} projetadas de {row['quota']} ({row['projected_pct']:.0f}%)"
+            )
+        
+        st.markdown("**Latência por operação**")
+        st.dataframe(pd.DataFrame(metrics.latency_table()).rename(columns={
+            'shard': 'Shard', 'op': 'Operação', 'calls': 'Chamadas', 'p50_ms': 'p50 (ms)', 'p95_ms': 'p95 (ms)'
+        }), use_container_width=True, hide_index=True)
+
+def show_performance_panel():
+    """Spans por rerun coletados pelo profiling.py (reruns de todas as sessões do processo)"""
+    st.subheader("Desempenho por Rerun")
+    
+    if not profiling_enabled():
+        st.info("Perfil desligado. Habilite com `CLINTUTOR_PROFILING=1` ou `[debug] profiling = true` no secrets.toml e reinicie o app.")
+        return
+    
+    recent = traces.recent()
+    if not recent:
+        st.info("Nenhum rerun registrado ainda.")
+        return
+    
+    st.caption(f"Últimos {len(recent)} reruns (o rerun atual entra na lista quando terminar)")
+    rerun_rows = []
+    for t in recent:
+        fs = t.firestore_totals()
+        rerun_rows.append({
+            'Início': t.started_at.strftime('%H:%M:%S'),
+            'Sessão': t.session,
+            'Usuário': t.user_type,
+            'Total (ms)': round(t.total_ms, 1),
+            'Spans': sum(tot['calls'] for tot in t.totals.values()),
+            'Leituras': fs['read'],
+            'Escritas': fs['write'],
+            'Deleções': fs['delete'],
+        })
+    st.dataframe(pd.DataFrame(rerun_rows), use_container_width=True, hide_index=True)
+    
+    # Detalhe de um rerun
+    labels = [f"{t.started_at.strftime('%H:%M:%S')} · {t.user_type} · {t.total_ms:.0f} ms ({t.id})" for t in recent]
+    choice = st.selectbox("Rerun", range(len(recent)), format_func=lambda i: labels[i])
+    trace = recent[choice]
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Spans mais lentos**")
+        slowest = sorted(trace.spans, key=lambda sp: -sp['ms'])[:20]
+        st.dataframe(pd.DataFrame(slowest).rename(columns={
+            'name': 'Span', 'category': 'Categoria', 'start_ms': 'Início (ms)', 'ms': 'Duração (ms)',
+            'depth': 'Nível', 'error': 'Erro'
+        }), use_container_width=True, hide_index=True)
+        if trace.dropped:
+            st.caption(f"{trace.dropped} spans além do limite entraram só nos totais.")
+    with col2:
+        st.markdown("**Operações no Firestore**")
+        fs_rows = [{'Coleção': c, 'Tipo': k, 'Documentos': n} for (c, k), n in sorted(trace.firestore.items())]
+        if fs_rows:
+            st.dataframe(pd.DataFrame(fs_rows), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Nenhuma operação no Firestore neste rerun.")
+    
+    # Agregado de todos os reruns guardados
+    st.markdown("**Spans agregados**")
+    st.dataframe(pd.DataFrame(traces.span_summary()).rename(columns={
+        'name': 'Span', 'category': 'Categoria', 'reruns': 'Reruns', 'calls': 'Chamadas',
+        'total_ms': 'Total (ms)', 'max_ms': 'Máx (ms)', 'errors': 'Erros', 'ms_per_rerun': 'ms/rerun'
+    }).round(1), use_container_width=True, hide_index=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="Exportar JSON",
+            data=traces.export_json(),
+            file_name=f"perfil_reruns_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            use_container_width=True,
+            icon=":material/download:"
+        )
+    with col2:
+        if st.button("Limpar Registros", use_container_width=True):
+            traces.clear()
+            st.rerun()
+
+LLM_FEATURE_LABELS = {
+    'tutor_chat': 'Chat do Tutor',
+    'class_insights': 'Insights da Turma (lote)',
+    'ai_usage_preview': 'Preview de Uso da IA',
+    'class_criteria_analysis': 'Análise de Critérios da Turma',
+}
+
+def show_insight_cache_section():
+    """Entradas do cache persistente de insights (insight_cache.py)"""
+    st.markdown("**Cache de insights do professor**")
+    try:
+        rows = insight_cache.stats()
+    except Exception as e:
+        st.error(f"Erro ao ler o cache de insights: {e}")
+        return
+    if not rows:
+        st.caption("Nenhum insight em cache.")
+        return
+    for row in rows:
+        row['function'] = LLM_FEATURE_LABELS.get(row['function'], row['function'])
+        row['last_update'] = datetime.fromtimestamp(row['last_update']).strftime('%d/%m/%Y %H:%M')
+    st.dataframe(pd.DataFrame(rows).rename(columns={
+        'function': 'Funcionalidade', 'model': 'Modelo', 'entries': 'Entradas', 'fresh': 'Válidas',
+        'stale': 'Vencidas', 'last_update': 'Última Atualização'
+    }), use_container_width=True, hide_index=True)
+    st.caption("Entradas vencidas continuam sendo exibidas enquanto são recalculadas em segundo plano.")
+    if st.button("Limpar Cache de Insights"):
+        removed = insight_cache.invalidate()
+        st.success(f"{removed} insights removidos. Serão gerados novamente no próximo acesso.")
+
+def show_llm_usage_panel():
+    """Tokens, latência e custo das chamadas ao LLM nas últimas 24h (processo atual)"""
+    st.subheader("Uso da IA (últimas 24h)")
+    
+    totals = telemetry.totals()
+    if not totals['calls']:
+        st.info("Nenhuma chamada ao LLM registrada ainda neste processo.")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Chamadas", totals['calls'])
+    with col2:
+        st.metric("Falhas", totals['errors'])
+    with col3:
+        st.metric("Tokens", f"{totals['tokens']:,}".replace(",", "."))
+    with col4:
+        st.metric("Custo Estimado", f"US$ {totals['cost_usd']:.4f}")
+    
+    st.markdown("**Por funcionalidade**")
+    feature_rows = telemetry.feature_table()
+    for row in feature_rows:
+        row['feature'] = LLM_FEATURE_LABELS.get(row['feature'], row['feature'])
+    st.dataframe(pd.DataFrame(feature_rows).rename(columns={
+        'feature': 'Funcionalidade', 'models': 'Modelo', 'calls': 'Chamadas', 'errors': 'Falhas',
+        'retries': 'Retentativas', 'prompt_tokens': 'Tokens Prompt', 'completion_tokens': 'Tokens Resposta',
+        'ttft_p50_ms': '1º Token p50 (ms)', 'ttft_p95_ms': '1º Token p95 (ms)',
+        'latency_p50_ms': 'Latência p50 (ms)', 'latency_p95_ms': 'Latência p95 (ms)', 'cost_usd': 'Custo (US$)'
+    }).round(1), use_container_width=True, hide_index=True)
+    
+    st.markdown("**Por chave**")
+    st.dataframe(pd.DataFrame(telemetry.key_table()).rename(columns={
+        'key': 'Chave', 'attempts': 'Tentativas', 'errors': 'Erros', 'rate_limited': '429',
+        'calls_ok': 'Respostas', 'tokens': 'Tokens', 'cost_usd': 'Custo (US$)'
+    }).round(4), use_container_width=True, hide_index=True)
+    st.caption("Sem `usage` na resposta, os tokens de resposta são estimados pelos pedaços do streaming. "
+               "Preços de referência em `llm_telemetry.MODEL_PRICES_USD_PER_MTOK`.")
+    
+    show_insight_cache_section()
+    
+    if st.checkbox("Mostrar últimas chamadas"):
+        st.dataframe(pd.DataFrame([
+            {
+                'Horário': r['at'][11:19],
+                'Funcionalidade': LLM_FEATURE_LABELS.get(r['feature'], r['feature']),
+                'Chave': r['key'],
+                'Status': r['status'],
+                'Tentativas': len(r['attempts']),
+                'Erro': r['error'],
+                'Tokens': r['prompt_tokens'] + r['completion_tokens'],
+                'Latência (ms)': round(r['latency_ms'], 1),
+            }
+            for r in reversed(telemetry.records()[-100:])
+        ]), use_container_width=True, hide_index=True)
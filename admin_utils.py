@@ -1,9 +1,196 @@
+import os
+import json
+import time
+import uuid
+import threading
 import streamlit as st
 from datetime import datetime
-from typing import Dict, List
-from firebase_config import get_firestore_db, is_firebase_connected, get_db_for_user, get_all_dbs
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from firebase_config import get_firestore_db, is_firebase_connected, get_db_for_user, get_shards, get_shard_index_for_user
+from analytics import clear_history_page_caches
+from answer_index import get_answer_index
+from distractor_stats import get_distractor_stats
 
-def reset_student_analytics(user_id: str) -> bool:
+# =============================
+# Mutações em Massa (batched writes + checkpoint)
+# =============================
+# Cada shard é processado por um worker próprio, em lotes de até BATCH_LIMIT
+# operações por commit (limite do Firestore). Após cada lote o cursor é salvo
+# em BULK_CHECKPOINT_PATH sob um job_id gerado para aquela execução. Uma nova
+# execução sempre começa do zero; continuar um job interrompido é uma ação
+# explícita (resume_bulk_job, botão "Retomar" no painel), e checkpoints com mais
+# de BULK_CHECKPOINT_MAX_AGE_SECONDS são descartados.
+
+BATCH_LIMIT = 500
+BULK_CHECKPOINT_PATH = os.path.join(os.path.expanduser("~"), ".clintutor", "bulk_checkpoints.json")
+BULK_CHECKPOINT_MAX_AGE_SECONDS = 24 * 3600
+
+_checkpoint_lock = threading.Lock()
+
+def _load_checkpoints() -> Dict:
+    """{job_id: {'name', 'params', 'started_at', 'shards': {shard: estado}}} ainda válidos."""
+    try:
+        with open(BULK_CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            checkpoints = json.load(f)
+    except Exception:
+        return {}
+    oldest = time.time() - BULK_CHECKPOINT_MAX_AGE_SECONDS
+    return {job_id: job for job_id, job in checkpoints.items()
+            if isinstance(job, dict) and job.get('started_at', 0) >= oldest}
+
+def _write_checkpoints(checkpoints: Dict):
+    os.makedirs(os.path.dirname(BULK_CHECKPOINT_PATH), exist_ok=True)
+    with open(BULK_CHECKPOINT_PATH, "w", encoding="utf-8") as f:
+        json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+
+def _save_checkpoint(job: Dict, shard_idx: int, state: Optional[Dict]):
+    """Grava (ou remove, se state=None) o checkpoint de um shard do job."""
+    with _checkpoint_lock:
+        checkpoints = _load_checkpoints()
+        saved = checkpoints.setdefault(job['id'], {
+            'name': job['name'], 'params': job['params'], 'started_at': job['started_at'], 'shards': {}
+        })
+        if state is None:
+            saved['shards'].pop(str(shard_idx), None)
+        else:
+            saved['shards'][str(shard_idx)] = state
+        if not saved['shards']:
+            checkpoints.pop(job['id'], None)
+        _write_checkpoints(checkpoints)
+
+def get_pending_bulk_jobs() -> Dict:
+    """Jobs interrompidos (dentro do prazo) que ainda têm checkpoint salvo."""
+    return _load_checkpoints()
+
+def discard_bulk_job(job_id: str):
+    """Remove o checkpoint de um job interrompido sem retomá-lo."""
+    with _checkpoint_lock:
+        checkpoints = _load_checkpoints()
+        checkpoints.pop(job_id, None)
+        _write_checkpoints(checkpoints)
+
+def _shard_of_user(user_id: str):
+    """Retorna [(índice, db)] do shard onde ficam os dados deste usuário."""
+    return [(get_shard_index_for_user(user_id), get_db_for_user(user_id))]
+
+def _run_shard_mutation(job: Dict, shard_idx: int, db, collection: str, filters, update, progress: Dict) -> Dict[str, int]:
+    """Worker de um shard: lê só ids em páginas de BATCH_LIMIT e aplica um batch por página."""
+    state = job['resume'].get(str(shard_idx), {'cursor': None, 'done': 0})
+    done = state.get('done', 0)
+    cursor = state.get('cursor')
+    errors = 0
+    progress[shard_idx] = done
+
+    while True:
+        query = db.collection(collection)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        query = query.order_by('__name__').select([])
+        # Deleções não precisam de cursor: os docs removidos saem da consulta
+        if update is not None and cursor:
+            query = query.start_after({'__name__': cursor})
+        docs = list(query.limit(BATCH_LIMIT).get())
+        if not docs:
+            break
+
+        batch = db.batch()
+        for doc in docs:
+            if update is None:
+                batch.delete(doc.reference)
+            else:
+                batch.update(doc.reference, update)
+        try:
+            batch.commit()
+        except Exception as e:
+            # Mantém o checkpoint no último lote confirmado para retomar depois
+            print(f"ADMIN: erro no lote de {collection}[{shard_idx}]: {e}")
+            errors += len(docs)
+            return {'done': done, 'errors': errors}
+
+        done += len(docs)
+        cursor = docs[-1].id
+        progress[shard_idx] = done
+        _save_checkpoint(job, shard_idx, {'cursor': cursor, 'done': done})
+
+    _save_checkpoint(job, shard_idx, None)
+    return {'done': done, 'errors': errors}
+
+def run_bulk_mutation(job_name: str, collection: str, filters: List = None, update: Dict = None,
+                      shards: List = None, progress_callback: Callable[[int, int], None] = None,
+                      params: Dict = None, resume_job_id: str = None) -> Dict[str, int]:
+    """
+    Apaga (update=None) ou atualiza em massa os documentos de `collection` que
+    atendem aos `filters` [(campo, op, valor)], com um worker por shard.
+    - cada chamada gera um job_id próprio e começa do zero; só retoma o checkpoint
+      de um job interrompido quando resume_job_id é informado (ver resume_bulk_job)
+    - params: argumentos da função que disparou o job, para retomá-lo depois
+    - progress_callback(feitos, total) é chamado na thread do Streamlit
+    Retorna {'done': n, 'errors': n, 'job_id': id}.
+    """
+    filters = filters or []
+    shards = shards if shards is not None else get_shards()
+    saved = _load_checkpoints().get(resume_job_id, {}) if resume_job_id else {}
+    job = {
+        'id': resume_job_id if saved else f"{job_name}-{uuid.uuid4().hex[:8]}",
+        'name': job_name,
+        'params': params or {},
+        'started_at': saved.get('started_at', time.time()),
+        'resume': saved.get('shards', {}),
+    }
+    if not shards:
+        return {'done': 0, 'errors': 0, 'job_id': job['id']}
+
+    total = 0
+    if progress_callback:
+        for _, db in shards:
+            query = db.collection(collection)
+            for field, op, value in filters:
+                query = query.where(field, op, value)
+            total += _count(query)
+        # Docs já apagados na execução interrompida entram no total
+        total += sum(job['resume'].get(str(idx), {}).get('done', 0) for idx, _ in shards) if update is None else 0
+
+    progress: Dict[int, int] = {}
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        futures = [
+            pool.submit(_run_shard_mutation, job, idx, db, collection, filters, update, progress)
+            for idx, db in shards
+        ]
+        # Atualiza a barra de progresso a partir da thread principal
+        while progress_callback and not all(f.done() for f in futures):
+            progress_callback(sum(progress.values()), total)
+            time.sleep(0.3)
+        results = [f.result() for f in futures]
+
+    summary = {
+        'done': sum(r['done'] for r in results),
+        'errors': sum(r['errors'] for r in results),
+        'job_id': job['id'],
+    }
+    if progress_callback:
+        progress_callback(summary['done'], max(total, summary['done']))
+    return summary
+
+def resume_bulk_job(job_id: str, progress_callback: Callable[[int, int], None] = None):
+    """Retoma explicitamente um job interrompido chamando de novo a função que o criou."""
+    job = _load_checkpoints().get(job_id)
+    if not job:
+        return None
+    func = _RESUMABLE_JOBS.get(job['name'])
+    if func is None:
+        return None
+    return func(progress_callback=progress_callback, resume_job_id=job_id, **job.get('params', {}))
+
+def bulk_progress(bar) -> Callable[[int, int], None]:
+    """Adapta um st.progress para o progress_callback de run_bulk_mutation."""
+    def update(done: int, total: int):
+        frac = min(done / total, 1.0) if total else 1.0
+        bar.progress(frac, text=f"{done}/{total} documentos processados")
+    return update
+
+def reset_student_analytics(user_id: str, progress_callback: Callable[[int, int], None] = None,
+                            resume_job_id: str = None) -> bool:
     """
     Reseta todas as questões respondidas de um aluno específico.
     Remove todos os registros de case_analytics para o usuário.
@@ -12,36 +199,39 @@ def reset_student_analytics(user_id: str) -> bool:
         if not is_firebase_connected():
             st.error("Firebase não está conectado.")
             return False
-        db = get_db_for_user(user_id)
-        docs = db.collection('case_analytics').where('user_id', '==', user_id).get()
-        deleted_count = 0
-        for doc in docs:
-            doc.reference.delete()
-            deleted_count += 1
-        print(f"ADMIN: Deletados {deleted_count} analytics para usuário {user_id}")
-        return True
+        res = run_bulk_mutation('reset_analytics', 'case_analytics',
+                                filters=[('user_id', '==', user_id)], shards=_shard_of_user(user_id),
+                                progress_callback=progress_callback, params={'user_id': user_id},
+                                resume_job_id=resume_job_id)
+        print(f"ADMIN: Deletados {res['done']} analytics para usuário {user_id}")
+        clear_history_page_caches()
+        # Só as respostas deste aluno saem dos índices: sem reler toda a turma
+        get_answer_index().remove_user(user_id)
+        get_distractor_stats().remove_user(user_id)
+        return res['errors'] == 0
     except Exception as e:
         st.error(f"Erro ao resetar analytics: {e}")
         return False
 
-def clear_student_chat_interactions(user_id: str) -> bool:
+def clear_student_chat_interactions(user_id: str, progress_callback: Callable[[int, int], None] = None,
+                                    resume_job_id: str = None) -> bool:
     try:
         if not is_firebase_connected():
             st.error("Firebase não está conectado.")
             return False
-        db = get_db_for_user(user_id)
-        docs = db.collection('chat_interactions').where('user_id', '==', user_id).get()
-        deleted_count = 0
-        for doc in docs:
-            doc.reference.delete()
-            deleted_count += 1
-        print(f"ADMIN: Deletadas {deleted_count} interações de chat para usuário {user_id}")
-        return True
+        res = run_bulk_mutation('clear_chats', 'chat_interactions',
+                                filters=[('user_id', '==', user_id)], shards=_shard_of_user(user_id),
+                                progress_callback=progress_callback, params={'user_id': user_id},
+                                resume_job_id=resume_job_id)
+        print(f"ADMIN: Deletadas {res['done']} interações de chat para usuário {user_id}")
+        clear_history_page_caches()
+        return res['errors'] == 0
     except Exception as e:
         st.error(f"Erro ao limpar chat: {e}")
         return False
 
-def reset_all_students_analytics() -> Dict[str, int]:
+def reset_all_students_analytics(progress_callback: Callable[[int, int], None] = None,
+                                 resume_job_id: str = None) -> Dict[str, int]:
     """
     Reseta todas as questões respondidas de TODOS os alunos em TODOS os Firebases.
     """
@@ -49,23 +239,19 @@ def reset_all_students_analytics() -> Dict[str, int]:
         if not is_firebase_connected():
             st.error("Firebase não está conectado.")
             return {'deleted': 0, 'errors': 0}
-        deleted_count = 0
-        error_count = 0
-        for db in get_all_dbs():
-            docs = db.collection('case_analytics').get()
-            for doc in docs:
-                try:
-                    doc.reference.delete()
-                    deleted_count += 1
-                except Exception as e:
-                    error_count += 1
-        print(f"ADMIN: Deletados {deleted_count} registros de analytics (total)")
-        return {'deleted': deleted_count, 'errors': error_count}
+        res = run_bulk_mutation('reset_all_analytics', 'case_analytics', progress_callback=progress_callback,
+                                resume_job_id=resume_job_id)
+        print(f"ADMIN: Deletados {res['done']} registros de analytics (total)")
+        clear_history_page_caches()
+        get_answer_index().reload()
+        get_distractor_stats().reload()
+        return {'deleted': res['done'], 'errors': res['errors']}
     except Exception as e:
         st.error(f"Erro ao resetar todos os analytics: {e}")
         return {'deleted': 0, 'errors': 1}
 
-def clear_all_chat_interactions() -> Dict[str, int]:
+def clear_all_chat_interactions(progress_callback: Callable[[int, int], None] = None,
+                                resume_job_id: str = None) -> Dict[str, int]:
     """
     Limpa TODAS as interações de chat de TODOS os usuários em TODOS os Firebases.
     """
@@ -73,23 +259,17 @@ def clear_all_chat_interactions() -> Dict[str, int]:
         if not is_firebase_connected():
             st.error("Firebase não está conectado.")
             return {'deleted': 0, 'errors': 0}
-        deleted_count = 0
-        error_count = 0
-        for db in get_all_dbs():
-            docs = db.collection('chat_interactions').get()
-            for doc in docs:
-                try:
-                    doc.reference.delete()
-                    deleted_count += 1
-                except Exception as e:
-                    error_count += 1
-        print(f"ADMIN: Deletadas {deleted_count} interações de chat (total)")
-        return {'deleted': deleted_count, 'errors': error_count}
+        res = run_bulk_mutation('clear_all_chats', 'chat_interactions', progress_callback=progress_callback,
+                                resume_job_id=resume_job_id)
+        print(f"ADMIN: Deletadas {res['done']} interações de chat (total)")
+        clear_history_page_caches()
+        return {'deleted': res['done'], 'errors': res['errors']}
     except Exception as e:
         st.error(f"Erro ao limpar todos os chats: {e}")
         return {'deleted': 0, 'errors': 1}
 
-def reset_all_student_progress() -> Dict[str, int]:
+def reset_all_student_progress(progress_callback: Callable[[int, int], None] = None,
+                               resume_job_id: str = None) -> Dict[str, int]:
     """
     Remove o campo 'progress' de TODOS os usuários (reseta questão atual, score, streak).
     Usado ao trocar de conjunto de questões.
@@ -97,7 +277,6 @@ def reset_all_student_progress() -> Dict[str, int]:
     try:
         # Limpa o arquivo local de fallback (progress.json)
         try:
-            import os
             from logic import SAVE_PATH
             if os.path.exists(SAVE_PATH):
                 os.remove(SAVE_PATH)
@@ -107,28 +286,37 @@ def reset_all_student_progress() -> Dict[str, int]:
         if not is_firebase_connected():
             st.error("Firebase não está conectado, limpou apenas fallback local.")
             return {'updated': 0, 'errors': 0}
-        db = get_firestore_db()  # Usuários ficam sempre no Firebase primário
-        docs = db.collection('users').where('user_type', '==', 'aluno').get()
-        updated = 0
-        errors = 0
-        for doc in docs:
-            try:
-                from google.cloud.firestore_v1 import DELETE_FIELD
-                doc.reference.update({'progress': DELETE_FIELD})
-                updated += 1
-            except Exception:
-                # Fallback: set para None caso DELETE_FIELD não funcione
-                try:
-                    doc.reference.update({'progress': {}})
-                    updated += 1
-                except Exception as e2:
-                    errors += 1
-        print(f"ADMIN: Progress resetado para {updated} alunos")
-        return {'updated': updated, 'errors': errors}
+        from google.cloud.firestore_v1 import DELETE_FIELD
+        # Usuários ficam sempre no Firebase primário
+        res = run_bulk_mutation('reset_all_progress', 'users',
+                                filters=[('user_type', '==', 'aluno')],
+                                update={'progress': DELETE_FIELD},
+                                shards=[(0, get_firestore_db())],
+                                progress_callback=progress_callback,
+                                resume_job_id=resume_job_id)
+        print(f"ADMIN: Progress resetado para {res['done']} alunos")
+        return {'updated': res['done'], 'errors': res['errors']}
     except Exception as e:
         st.error(f"Erro ao resetar progress: {e}")
         return {'updated': 0, 'errors': 1}
 
+# Jobs que o painel pode retomar: nome do job -> função que o dispara
+_RESUMABLE_JOBS = {
+    'reset_analytics': reset_student_analytics,
+    'clear_chats': clear_student_chat_interactions,
+    'reset_all_analytics': reset_all_students_analytics,
+    'clear_all_chats': clear_all_chat_interactions,
+    'reset_all_progress': reset_all_student_progress,
+}
+
+BULK_JOB_LABELS = {
+    'reset_analytics': "Resetar analytics do aluno",
+    'clear_chats': "Limpar chats do aluno",
+    'reset_all_analytics': "Resetar analytics da turma",
+    'clear_all_chats': "Limpar interações de chat",
+    'reset_all_progress': "Resetar progresso dos alunos",
+}
+
 def log_admin_action(action: str, details: str, user_id: str = None):
     """
     Registra uma ação administrativa para auditoria.
@@ -154,40 +342,96 @@ def log_admin_action(action: str, details: str, user_id: str = None):
     except Exception as e:
         print(f"Erro ao registrar log de admin: {e}")
 
+# =============================
+# Estatísticas do Banco (agregações no servidor)
+# =============================
+# count()/sum() são resolvidos pelo Firestore: cada consulta custa ~1 leitura
+# por lote de até 1000 documentos contados, em vez de baixar todos os docs.
+
+# Tamanho médio aproximado de cada documento (bytes) para a estimativa de armazenamento
+AVG_DOC_BYTES = {
+    'case_analytics': 2500,
+    'chat_interactions': 4000,
+    'users': 600,
+    'admin_logs': 300,
+}
+
+def _count(query) -> int:
+    """Conta documentos com aggregation query; cai para leitura só de ids se não suportado."""
+    try:
+        result = query.count(alias='total').get()
+        return int(result[0][0].value)
+    except Exception as e:
+        print(f"Aviso: count() indisponível ({e}), contando por ids")
+        return len(query.select([]).get())
+
+def _sum(query, field: str) -> float:
+    """Soma um campo numérico com aggregation query (0 se não suportado)."""
+    try:
+        result = query.sum(field, alias='total').get()
+        return float(result[0][0].value or 0)
+    except Exception as e:
+        print(f"Aviso: sum({field}) indisponível: {e}")
+        return 0.0
+
+def _shard_stats(shard_idx: int, db) -> Dict:
+    """Contagens de um shard. Usuários e logs ficam só no primário (shard 0)."""
+    stats = {
+        'shard': shard_idx,
+        'case_analytics': _count(db.collection('case_analytics')),
+        'chat_interactions': _count(db.collection('chat_interactions')),
+        'chat_messages': int(_sum(db.collection('chat_interactions'), 'message_count')),
+        'users': 0,
+        'students': 0,
+        'admin_logs': 0,
+    }
+    if shard_idx == 0:
+        users = db.collection('users')
+        stats['users'] = _count(users)
+        stats['students'] = _count(users.where('user_type', '==', 'aluno'))
+        stats['admin_logs'] = _count(db.collection('admin_logs'))
+    stats['estimated_bytes'] = sum(
+        stats[key] * AVG_DOC_BYTES[coll]
+        for key, coll in (('case_analytics', 'case_analytics'), ('chat_interactions', 'chat_interactions'),
+                          ('users', 'users'), ('admin_logs', 'admin_logs'))
+    )
+    return stats
+
 @st.cache_data(ttl=300, show_spinner=False)
-def get_database_stats() -> Dict[str, int]:
+def get_database_stats() -> Dict:
     """
-    Retorna estatísticas sobre o tamanho do banco de dados.
+    Retorna estatísticas sobre o tamanho do banco de dados somando TODOS os shards.
+    Os shards são consultados em paralelo; 'shards' traz o detalhamento por Firebase.
     """
+    empty = {
+        'total_analytics': 0,
+        'total_chat_interactions': 0,
+        'total_chat_messages': 0,
+        'total_users': 0,
+        'total_students': 0,
+        'total_admin_logs': 0,
+        'estimated_storage_bytes': 0,
+        'shards': []
+    }
     try:
         if not is_firebase_connected():
-            return {
-                'total_analytics': 0,
-                'total_chat_interactions': 0,
-                'total_users': 0
-            }
-        
-        db = get_firestore_db()
-        
-        # Conta analytics
-        analytics_count = len(db.collection('case_analytics').get())
-        
-        # Conta chat interactions
-        chat_count = len(db.collection('chat_interactions').get())
-        
-        # Conta usuários
-        users_count = len(db.collection('users').get())
-        
+            return empty
+
+        shards = get_shards()
+        with ThreadPoolExecutor(max_workers=max(1, len(shards))) as pool:
+            per_shard = list(pool.map(lambda s: _shard_stats(*s), shards))
+
         return {
-            'total_analytics': analytics_count,
-            'total_chat_interactions': chat_count,
-            'total_users': users_count
+            'total_analytics': sum(s['case_analytics'] for s in per_shard),
+            'total_chat_interactions': sum(s['chat_interactions'] for s in per_shard),
+            'total_chat_messages': sum(s['chat_messages'] for s in per_shard),
+            'total_users': sum(s['users'] for s in per_shard),
+            'total_students': sum(s['students'] for s in per_shard),
+            'total_admin_logs': sum(s['admin_logs'] for s in per_shard),
+            'estimated_storage_bytes': sum(s['estimated_bytes'] for s in per_shard),
+            'shards': per_shard
         }
-        
+
     except Exception as e:
         st.error(f"Erro ao obter estatísticas: {e}")
-        return {
-            'total_analytics': 0,
-            'total_chat_interactions': 0,
-            'total_users': 0
-        }
+        return empty
@@ -1,13 +1,23 @@
 import streamlit as st
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+from firebase_admin import firestore
 from firebase_config import get_firestore_db, is_firebase_connected, get_db_for_user, get_all_dbs
+from profiling import profiled
+from answer_index import get_answer_index
+from distractor_stats import get_distractor_stats
 import json
 import os
+import threading
 
 # Configurações do banco de dados local (fallback)
 ANALYTICS_DB_PATH = os.path.join(os.path.expanduser("~"), ".clintutor", "analytics.json")
 
+# Campo canônico de tempo dos eventos (epoch em segundos, float).
+# 'timestamp' (ISO) continua sendo gravado para exibição e compatibilidade;
+# ordenações, janelas e cursores usam sempre EVENT_TS_FIELD.
+EVENT_TS_FIELD = "ts"
+
 def init_analytics_db():
     """Inicializa o banco de dados de analytics local se não existir (fallback)"""
     os.makedirs(os.path.dirname(ANALYTICS_DB_PATH), exist_ok=True)
@@ -28,7 +38,7 @@ def save_analytics_local(analytics: List[Dict]):
     """Salva analytics no banco local (fallback)"""
     try:
         with open(ANALYTICS_DB_PATH, "w", encoding="utf-8") as f:
-            json.dump(analytics, f, ensure_ascii=False, indent=2)
+            json.dump(analytics, f, ensure_ascii=False, indent=2, default=str)
     except Exception as e:
         st.error(f"Erro ao salvar analytics localmente: {e}")
 
@@ -84,7 +94,8 @@ def end_case_timer(timer_id: str, case_result: Dict) -> Optional[Dict]:
         "duration_seconds": duration,
         "duration_formatted": format_duration(duration),
         "case_result": case_result,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": end_time.isoformat(),
+        EVENT_TS_FIELD: end_time.timestamp()
     }
     
     # Salva no Firebase ou local
@@ -132,7 +143,8 @@ def log_chat_interaction(user_id: str, case_id: str, user_message: str, bot_resp
             "user_id": user_id,
             "case_id": case_id,
             "messages": [],
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            EVENT_TS_FIELD: datetime.now().timestamp()
         }
     
     # Adiciona a mensagem ao buffer (sem gravar no Firebase agora)
@@ -140,9 +152,11 @@ def log_chat_interaction(user_id: str, case_id: str, user_message: str, bot_resp
         "user_message": user_message,
         "bot_response": bot_response,
         "response_time_seconds": response_time,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        EVENT_TS_FIELD: datetime.now().timestamp()
     })
 
+@profiled("storage")
 def flush_chat_buffer(user_id: str, case_id: str):
     """
     Grava o buffer de chat em um ÚNICO documento no Firebase.
@@ -162,11 +176,14 @@ def flush_chat_buffer(user_id: str, case_id: str):
         try:
             db = get_db_for_user(user_id)
             chat_ref = db.collection('chat_interactions')
+            # message_count denormalizado: agregações contam sem baixar as mensagens
+            entry['message_count'] = len(entry['messages'])
             chat_ref.add(entry)  # 1 documento com todas as mensagens
             print(f"SUCESSO: {len(entry['messages'])} msgs de chat salvas num unico doc Firebase")
         except Exception as e:
             print(f"ERRO ao salvar buffer de chat: {e}")
     else:
+        entry['message_count'] = len(entry['messages'])
         save_chat_interaction_local(entry)
     
     n = len(entry['messages'])
@@ -179,6 +196,7 @@ def flush_chat_buffer(user_id: str, case_id: str):
 # Cálculo de Taxa de Acertos
 # =============================
 
+@profiled("aggregation")
 def calculate_accuracy_rate(case_analytics: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Calcula a taxa de acertos de um usuário"""
     
@@ -268,6 +286,7 @@ def calculate_accuracy_rate(case_analytics: List[Dict[str, Any]]) -> Dict[str, A
 # Progresso do Aluno (sem custos extras de DB)
 # =============================
 
+@profiled("storage")
 def save_student_progress(user_id: str, current_question_id: str, used_cases: list, score: int, streak: int):
     """
     Salva o progresso do aluno no próprio documento users/{user_id}.
@@ -278,27 +297,38 @@ def save_student_progress(user_id: str, current_question_id: str, used_cases: li
         return
     try:
         db = get_firestore_db()  # Usuários sempre ficam no Firebase primário
-        db.collection('users').document(user_id).update({
-            'progress': {
-                'current_question_id': current_question_id,
-                'used_cases': used_cases,
-                'score': score,
-                'streak': streak,
-                'updated_at': datetime.now().isoformat()
-            }
-        })
+        progress = {
+            'current_question_id': current_question_id,
+            'used_cases': used_cases,
+            'score': score,
+            'streak': streak,
+            'updated_at': datetime.now().isoformat()
+        }
+        db.collection('users').document(user_id).update({'progress': progress})
+        from user_directory import get_user_directory
+        get_user_directory().update(user_id, {'progress': progress})
     except Exception as e:
         print(f"Aviso: não foi possível salvar progresso: {e}")
 
+@profiled("storage")
 def load_student_progress(user_id: str) -> dict:
     """
     Carrega o progresso salvo do aluno a partir do documento users/{user_id}.
-    Custo: 1 read (o mesmo doc de login que já é buscado na autenticação).
+    Custo: zero reads quando o documento já veio na restauração da sessão ou está
+    no diretório de usuários em memória; senão 1 read.
     Retorna dict vazio se não houver progresso salvo.
     """
     if not is_firebase_connected() or not user_id:
         return {}
+    if 'prefetched_progress' in st.session_state:
+        return st.session_state.pop('prefetched_progress') or {}
     try:
+        from user_directory import get_user_directory
+        directory = get_user_directory()
+        if directory.is_ready():
+            user = directory.get_by_id(user_id)
+            if user is not None:
+                return user.get('progress', {})
         db = get_firestore_db()
         doc = db.collection('users').document(user_id).get()
         if doc.exists:
@@ -312,6 +342,7 @@ def load_student_progress(user_id: str) -> dict:
 # Armazenamento no Firebase
 # =============================
 
+@profiled("storage")
 def save_case_analytics(case_analytics: Dict):
     """Salva analytics de caso no Firebase ou local"""
     if is_firebase_connected():
@@ -320,6 +351,8 @@ def save_case_analytics(case_analytics: Dict):
         # Se Firebase não está conectado, tenta usar local
         st.warning("⚠️ Firebase não está conectado. Salvando localmente.")
         save_case_analytics_local(case_analytics)
+    get_answer_index().add(case_analytics)
+    get_distractor_stats().add(case_analytics)
 
 def save_case_analytics_firebase(case_analytics: Dict):
     """Salva analytics de caso no Firebase do usuário (roteamento dual)"""
@@ -328,6 +361,8 @@ def save_case_analytics_firebase(case_analytics: Dict):
         db = get_db_for_user(user_id)
         analytics_ref = db.collection('case_analytics')
         doc_ref = analytics_ref.add(case_analytics)
+        # Id do documento para anexar as tentativas seguintes (record_retry_attempt)
+        case_analytics['id'] = doc_ref[1].id
         print(f"SUCESSO: Analytics salvo no Firebase para user {user_id}: {doc_ref[1].id}")
         return True
     except Exception as e:
@@ -341,6 +376,43 @@ def save_case_analytics_local(case_analytics: Dict):
     analytics.append(case_analytics)
     save_analytics_local(analytics)
 
+@profiled("storage")
+def record_retry_attempt(case_analytics: Dict, retry: Dict):
+    """
+    Anexa uma nova tentativa ("Tentar Novamente") ao evento já salvo da questão,
+    em case_result.retries. A questão continua com um único evento: totais e taxas
+    de acerto seguem contando a primeira resposta, e as tentativas seguintes só
+    alimentam os histogramas de distratores.
+    retry: {'selected_option', 'attempt', 'is_correct', 'duration_seconds'}
+    """
+    if is_firebase_connected():
+        doc_id = case_analytics.get('id')
+        if not doc_id:
+            return
+        try:
+            db = get_db_for_user(case_analytics.get('user_id', ''))
+            db.collection('case_analytics').document(doc_id).update(
+                {'case_result.retries': firestore.ArrayUnion([retry])}
+            )
+        except Exception as e:
+            print(f"ERRO ao salvar tentativa: {e}")
+            return
+    else:
+        analytics = load_analytics_local()
+        ts = get_event_ts(case_analytics)
+        for entry in analytics:
+            if (entry.get('user_id') == case_analytics.get('user_id')
+                    and entry.get('case_id') == case_analytics.get('case_id')
+                    and entry.get('type') != 'chat_interaction'
+                    and get_event_ts(entry) == ts):
+                entry.setdefault('case_result', {}).setdefault('retries', []).append(retry)
+                save_analytics_local(analytics)
+                break
+        else:
+            return
+    get_distractor_stats().add_retry(case_analytics, retry)
+
+@profiled("storage")
 def save_chat_interaction(interaction: Dict):
     """Salva interação do chat no Firebase ou local"""
     if is_firebase_connected():
@@ -376,9 +448,12 @@ def save_chat_interaction_local(interaction: Dict):
 # Recuperação de Dados
 # =============================
 
-@st.cache_data(ttl=300, show_spinner=False)
+@profiled("storage")
 def get_user_case_analytics(user_id: str) -> List[Dict]:
     """Recupera analytics de casos de um usuário"""
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return mirror.get_user_case_analytics(user_id)
     if is_firebase_connected():
         return get_user_case_analytics_firebase(user_id)
     else:
@@ -399,7 +474,7 @@ def get_user_case_analytics_firebase(user_id: str) -> List[Dict]:
             data['id'] = doc.id
             analytics.append(data)
         try:
-            analytics.sort(key=get_timestamp_sort_key, reverse=True)
+            analytics.sort(key=get_event_ts, reverse=True)
         except Exception:
             pass
         print(f"DEBUG: Encontrados {len(analytics)} analytics para usuário {user_id}")
@@ -415,9 +490,12 @@ def get_user_case_analytics_local(user_id: str) -> List[Dict]:
     analytics = load_analytics_local()
     return [data for data in analytics if data.get("user_id") == user_id and data.get("type") != "chat_interaction"]
 
-@st.cache_data(ttl=300, show_spinner=False)
+@profiled("storage")
 def get_user_chat_interactions(user_id: str, case_id: str = None) -> List[Dict]:
     """Recupera interações do chat de um usuário"""
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return mirror.get_user_chat_interactions(user_id, case_id)
     if is_firebase_connected():
         return get_user_chat_interactions_firebase(user_id, case_id)
     else:
@@ -436,23 +514,9 @@ def get_user_chat_interactions_firebase(user_id: str, case_id: str = None) -> Li
         docs = query.get()
         interactions = []
         for doc in docs:
-            data = doc.to_dict()
-            if 'messages' in data and isinstance(data['messages'], list):
-                for msg in data['messages']:
-                    interactions.append({
-                        'user_id': data.get('user_id'),
-                        'case_id': data.get('case_id'),
-                        'user_message': msg.get('user_message', ''),
-                        'bot_response': msg.get('bot_response', ''),
-                        'response_time_seconds': msg.get('response_time_seconds'),
-                        'timestamp': msg.get('timestamp', data.get('timestamp')),
-                        'id': doc.id
-                    })
-            else:
-                data['id'] = doc.id
-                interactions.append(data)
+            interactions.extend(expand_chat_document(doc.to_dict(), doc.id))
         try:
-            interactions.sort(key=get_timestamp_sort_key, reverse=False)
+            interactions.sort(key=get_event_ts)
         except Exception:
             pass
         return interactions
@@ -471,29 +535,148 @@ def get_user_chat_interactions_local(user_id: str, case_id: str = None) -> List[
         
     interactions = []
     for data in raw_interactions:
-        if 'messages' in data and isinstance(data['messages'], list):
-            for msg in data['messages']:
-                interactions.append({
-                    'user_id': data.get('user_id'),
-                    'case_id': data.get('case_id'),
-                    'user_message': msg.get('user_message', ''),
-                    'bot_response': msg.get('bot_response', ''),
-                    'response_time_seconds': msg.get('response_time_seconds'),
-                    'timestamp': msg.get('timestamp', data.get('timestamp'))
-                })
-        else:
-            interactions.append(data)
+        interactions.extend(expand_chat_document(data))
             
     try:
-        interactions.sort(key=get_timestamp_sort_key, reverse=False)
+        interactions.sort(key=get_event_ts)
     except Exception:
         pass
         
     return interactions
 
+# =============================
+# Leituras Paginadas e por Janela de Tempo
+# =============================
+# Em vez de materializar todo o histórico do aluno, as funções abaixo usam
+# order_by(EVENT_TS_FIELD) + limit + cursor no Firestore. O cursor retornado é o
+# epoch do último item da página (None quando não há mais páginas).
+# Requer os índices compostos (user_id, ts) de firestore.indexes.json e o
+# backfill de scripts/backfill_event_schema.py para eventos antigos.
+
+DEFAULT_PAGE_SIZE = 20
+
+def _since_value(since) -> Optional[float]:
+    """Converte a janela 'since' para epoch (mesmo formato de EVENT_TS_FIELD)."""
+    return None if since is None else to_epoch(since)
+
+def _paginate_in_memory(items: List[Dict], limit: int, cursor=None, since: Optional[datetime] = None):
+    """Aplica a mesma semântica das consultas paginadas a uma lista em memória (mais recente primeiro)."""
+    ordered = sorted(items, key=get_event_ts, reverse=True)
+    if since is not None:
+        since_ts = _since_value(since)
+        ordered = [i for i in ordered if get_event_ts(i) >= since_ts]
+    if cursor is not None:
+        ordered = [i for i in ordered if get_event_ts(i) < cursor]
+    page = ordered[:limit] if limit else ordered
+    next_cursor = get_event_ts(page[-1]) if limit and len(ordered) > limit else None
+    return page, next_cursor
+
+@profiled("storage")
+def get_user_case_analytics_page(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor=None,
+                                 since: Optional[datetime] = None) -> Tuple[List[Dict], Any]:
+    """
+    Retorna uma página de analytics do aluno (mais recente primeiro) e o cursor da próxima.
+    - limit: tamanho da página (None/0 = sem limite, útil só com 'since')
+    - cursor: valor retornado pela página anterior
+    - since: retorna apenas eventos a partir desta data (ex: últimos 30 dias)
+    """
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return _paginate_in_memory(mirror.get_user_case_analytics(user_id), limit, cursor, since)
+    if is_firebase_connected():
+        return get_user_case_analytics_page_firebase(user_id, limit, cursor, _since_value(since))
+    return _paginate_in_memory(get_user_case_analytics_local(user_id), limit, cursor, since)
+
 @st.cache_data(ttl=300, show_spinner=False)
+def get_user_case_analytics_page_firebase(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor=None,
+                                          since: float = None) -> Tuple[List[Dict], Any]:
+    """Página de analytics de casos lida do Firebase do usuário com cursor e limit."""
+    try:
+        db = get_db_for_user(user_id)
+        query = db.collection('case_analytics').where('user_id', '==', user_id)
+        if since is not None:
+            query = query.where(EVENT_TS_FIELD, '>=', since)
+        query = query.order_by(EVENT_TS_FIELD, direction=firestore.Query.DESCENDING)
+        if cursor is not None:
+            query = query.start_after({EVENT_TS_FIELD: cursor})
+        if limit:
+            # Pede 1 a mais para saber se existe próxima página
+            query = query.limit(limit + 1)
+        analytics = []
+        for doc in query.get():
+            data = doc.to_dict()
+            data['id'] = doc.id
+            analytics.append(data)
+        has_more = bool(limit) and len(analytics) > limit
+        page = analytics[:limit] if limit else analytics
+        next_cursor = page[-1].get(EVENT_TS_FIELD) if has_more else None
+        return page, next_cursor
+    except Exception as e:
+        print(f"ERRO ao buscar página de analytics: {e}")
+        st.error(f"Erro ao buscar analytics no Firebase: {e}")
+        return [], None
+
+@profiled("storage")
+def get_user_chat_interactions_page(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor=None,
+                                    since: Optional[datetime] = None) -> Tuple[List[Dict], Any]:
+    """
+    Retorna uma página de documentos de chat do aluno (sessão mais recente primeiro)
+    e o cursor da próxima. Cada documento mantém o campo 'messages' agrupado.
+    """
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return _paginate_in_memory(mirror.get_user_chat_documents(user_id), limit, cursor, since)
+    if is_firebase_connected():
+        return get_user_chat_interactions_page_firebase(user_id, limit, cursor, _since_value(since))
+    local_docs = [d for d in load_analytics_local() if d.get('user_id') == user_id and d.get('type') == 'chat_interaction']
+    return _paginate_in_memory(local_docs, limit, cursor, since)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_user_chat_interactions_page_firebase(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor=None,
+                                             since: float = None) -> Tuple[List[Dict], Any]:
+    """Página de documentos de chat lida do Firebase do usuário com cursor e limit."""
+    try:
+        db = get_db_for_user(user_id)
+        query = db.collection('chat_interactions').where('user_id', '==', user_id)
+        if since is not None:
+            query = query.where(EVENT_TS_FIELD, '>=', since)
+        query = query.order_by(EVENT_TS_FIELD, direction=firestore.Query.DESCENDING)
+        if cursor is not None:
+            query = query.start_after({EVENT_TS_FIELD: cursor})
+        if limit:
+            query = query.limit(limit + 1)
+        docs = []
+        for doc in query.get():
+            data = doc.to_dict()
+            data['id'] = doc.id
+            docs.append(data)
+        has_more = bool(limit) and len(docs) > limit
+        page = docs[:limit] if limit else docs
+        next_cursor = page[-1].get(EVENT_TS_FIELD) if has_more else None
+        return page, next_cursor
+    except Exception as e:
+        st.error(f"Erro ao buscar interações do chat no Firebase: {e}")
+        return [], None
+
+def clear_history_page_caches():
+    """Descarta as páginas de histórico em cache (após resets e no botão "Atualizar")."""
+    get_user_case_analytics_page_firebase.clear()
+    get_user_chat_interactions_page_firebase.clear()
+
+def get_recent_user_case_analytics(user_id: str, days: int = 30) -> List[Dict]:
+    """Analytics do aluno apenas dos últimos `days` dias (janela 'since', sem limite de página)."""
+    # Início da janela truncado na hora: o epoch vira chave do st.cache_data da
+    # leitura no Firebase, e um valor em microssegundos nunca repetiria
+    since = (datetime.now() - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+    page, _ = get_user_case_analytics_page(user_id, limit=0, since=since)
+    return page
+
+@profiled("storage")
 def get_all_users_analytics() -> Dict[str, Dict]:
     """Recupera analytics de todos os usuários (apenas alunos)"""
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return mirror.get_all_users_analytics()
     if is_firebase_connected():
         return get_all_users_analytics_firebase()
     else:
@@ -508,50 +691,57 @@ def get_all_users_analytics_firebase() -> Dict[str, Dict]:
     Mescla os resultados de ambos os projetos sem duplicatas.
     """
     try:
-        student_ids = get_students_only()
-        if not student_ids:
-            return {}
+        return read_all_users_analytics_firebase()
+    except Exception as e:
+        st.error(f"Erro ao buscar analytics no Firebase: {e}")
+        return {}
 
-        all_dbs = get_all_dbs()
-        users_analytics: Dict[str, Dict] = {}
+def read_all_users_analytics_firebase() -> Dict[str, Dict]:
+    """Leitura sem cache de get_all_users_analytics_firebase (erros propagam)."""
+    student_ids = get_students_only()
+    if not student_ids:
+        return {}
 
-        for db in all_dbs:
-            # Busca casos
-            case_docs = db.collection('case_analytics').get()
-            for doc in case_docs:
-                data = doc.to_dict()
-                uid = data.get('user_id')
-                if uid not in student_ids:
-                    continue
-                if uid not in users_analytics:
-                    users_analytics[uid] = {'case_analytics': [], 'chat_interactions': []}
-                # Evita duplicatas (se secondary == primary)
-                if not any(e.get('id') == doc.id for e in users_analytics[uid]['case_analytics']):
-                    data['id'] = doc.id
-                    users_analytics[uid]['case_analytics'].append(data)
-
-            # Busca chats
-            chat_docs = db.collection('chat_interactions').get()
-            for doc in chat_docs:
-                data = doc.to_dict()
-                uid = data.get('user_id')
-                if uid not in student_ids:
-                    continue
-                if uid not in users_analytics:
-                    users_analytics[uid] = {'case_analytics': [], 'chat_interactions': []}
-                if not any(e.get('id') == doc.id for e in users_analytics[uid]['chat_interactions']):
-                    data['id'] = doc.id
-                    users_analytics[uid]['chat_interactions'].append(data)
+    all_dbs = get_all_dbs()
+    users_analytics: Dict[str, Dict] = {}
 
-        return users_analytics
+    for db in all_dbs:
+        # Busca casos
+        case_docs = db.collection('case_analytics').get()
+        for doc in case_docs:
+            data = doc.to_dict()
+            uid = data.get('user_id')
+            if uid not in student_ids:
+                continue
+            if uid not in users_analytics:
+                users_analytics[uid] = {'case_analytics': [], 'chat_interactions': []}
+            # Evita duplicatas (se secondary == primary)
+            if not any(e.get('id') == doc.id for e in users_analytics[uid]['case_analytics']):
+                data['id'] = doc.id
+                users_analytics[uid]['case_analytics'].append(data)
 
-    except Exception as e:
-        st.error(f"Erro ao buscar analytics no Firebase: {e}")
-        return {}
+        # Busca chats
+        chat_docs = db.collection('chat_interactions').get()
+        for doc in chat_docs:
+            data = doc.to_dict()
+            uid = data.get('user_id')
+            if uid not in student_ids:
+                continue
+            if uid not in users_analytics:
+                users_analytics[uid] = {'case_analytics': [], 'chat_interactions': []}
+            if not any(e.get('id') == doc.id for e in users_analytics[uid]['chat_interactions']):
+                data['id'] = doc.id
+                users_analytics[uid]['chat_interactions'].append(data)
+
+    return users_analytics
 
 @st.cache_data(ttl=300, show_spinner=False)
 def get_all_users_analytics_local() -> Dict[str, Dict]:
     """Recupera analytics de todos os usuários localmente (apenas alunos)"""
+    return read_all_users_analytics_local()
+
+def read_all_users_analytics_local() -> Dict[str, Dict]:
+    """Leitura sem cache de get_all_users_analytics_local."""
     analytics = load_analytics_local()
     users_analytics = {}
     
@@ -576,21 +766,397 @@ def get_all_users_analytics_local() -> Dict[str, Dict]:
     
     return users_analytics
 
+# =============================
+# Registros Compactos de Eventos (agregações da turma)
+# =============================
+# As agregações globais só leem alguns números de cada caso. Em vez de manter
+# em cache os dicts completos do Firestore (com feedback, why_wrong,
+# why_distractor, correct_explanation...), guardamos um CaseEvent com __slots__,
+# com o case_id e a alternativa internados em inteiros pequenos. Os textos
+# longos são buscados sob demanda com get_case_event_detail().
+
+_QUESTION_INDEX: Dict[str, int] = {}
+_QUESTION_IDS: List[str] = []
+_OPTION_INDEX: Dict[str, int] = {}
+_OPTIONS: List[str] = []
+# Sessões do Streamlit rodam em threads: o par verifica-e-acrescenta precisa ser atômico
+_INTERN_LOCK = threading.Lock()
+
+def _intern(value: str, index: Dict[str, int], values: List[str]) -> int:
+    idx = index.get(value)
+    if idx is None:
+        with _INTERN_LOCK:
+            idx = index.get(value)
+            if idx is None:
+                idx = len(values)
+                values.append(value)
+                index[value] = idx
+    return idx
+
+def intern_question_id(case_id: str) -> int:
+    """Retorna o inteiro associado a um case_id (estável durante o processo)."""
+    return _intern(case_id or '', _QUESTION_INDEX, _QUESTION_IDS)
+
+def question_id_of(idx: int) -> str:
+    return _QUESTION_IDS[idx]
+
+def option_of(idx: int) -> Optional[str]:
+    return _OPTIONS[idx] if idx >= 0 else None
+
+def _selected_option(result: Dict) -> Optional[str]:
+    """Alternativa marcada (A-D) a partir de selected_option ou do prefixo 'X.' de user_answer."""
+    opt = result.get('selected_option')
+    if not opt:
+        answer = str(result.get('user_answer', '')).strip().upper()
+        if answer.startswith('OPÇÃO '):
+            answer = answer[len('OPÇÃO '):]
+        if len(answer) == 1 or answer[1:2] in ('.', ')'):
+            opt = answer[:1]
+    return opt.upper() if isinstance(opt, str) and opt else None
+
+def _retries(retries) -> Optional[tuple]:
+    """Tentativas seguintes de case_result.retries como (option, attempt, duration)."""
+    if not retries:
+        return None
+    compact = tuple(
+        (_intern(r['selected_option'], _OPTION_INDEX, _OPTIONS), int(r.get('attempt') or 2),
+         float(r.get('duration_seconds', 0) or 0))
+        for r in retries if isinstance(r, dict) and r.get('selected_option')
+    )
+    return compact or None
+
+def _case_credit(result: Dict) -> float:
+    """Crédito do caso: 1.0 correto, 0.5 parcial, 0.0 incorreto."""
+    outcome = result.get('outcome')
+    classification = result.get("classification", "").upper()
+    return 1.0 if outcome == 'correct' else 0.5 if outcome == 'partial' else 0.0 if outcome == 'incorrect' else (1.0 if result.get('is_correct') and "PARCIAL" not in classification else 0.5 if "PARCIAL" in classification else 0.0)
+
+class CaseEvent:
+    """
+    Evento de caso compacto para agregações.
+    - question / option: índices internados (ver question_id_of / option_of)
+    - criteria: nota por componente de conhecimento da questão (-1.0 = sem critério)
+    - attempt: tentativa do aluno na questão (1 para registros antigos, sem o campo)
+    - retries: tentativas seguintes na mesma questão, (option, attempt, duration),
+      ou None; não entram nos totais, só nos histogramas de distratores
+    """
+    __slots__ = ('doc_id', 'user_id', 'question', 'option', 'ts', 'points',
+                 'credit', 'is_correct', 'duration', 'criteria', 'attempt', 'retries')
+
+    def __init__(self, doc_id, user_id, question, option, ts, points, credit, is_correct, duration, criteria,
+                 attempt=1, retries=None):
+        self.doc_id = doc_id
+        self.user_id = user_id
+        self.question = question
+        self.option = option
+        self.ts = ts
+        self.points = points
+        self.credit = credit
+        self.is_correct = is_correct
+        self.duration = duration
+        self.criteria = criteria
+        self.attempt = attempt
+        self.retries = retries
+
+    def __getstate__(self):
+        return tuple(getattr(self, f) for f in self.__slots__)
+
+    def __setstate__(self, state):
+        # estados gravados antes dos campos attempt/retries
+        self.attempt = 1
+        self.retries = None
+        for f, v in zip(self.__slots__, state):
+            setattr(self, f, v)
+
+    @property
+    def case_id(self) -> str:
+        return question_id_of(self.question)
+
+    @classmethod
+    def from_dict(cls, data: Dict, doc_id: str = None, q_map: Dict = None) -> 'CaseEvent':
+        """Constrói o evento a partir do documento bruto, descartando os textos longos."""
+        if q_map is None:
+            from logic import QUESTIONS
+            q_map = {q['id']: q for q in QUESTIONS}
+        result = data.get('case_result', {})
+        if not isinstance(result, dict):
+            result = {}
+        cid = data.get('case_id')
+        opt = _selected_option(result)
+        criterios = result.get('criterios', {})
+        comps = q_map.get(cid, {}).get('componentes_conhecimento', ['Geral'])
+        criteria = tuple(_get_criterion_score(c, criterios) for c in comps) if criterios else None
+        return cls(
+            doc_id=doc_id or data.get('id'),
+            user_id=data.get('user_id'),
+            question=intern_question_id(cid),
+            option=_intern(opt, _OPTION_INDEX, _OPTIONS) if opt else -1,
+            ts=get_event_ts(data),
+            points=float(result.get('points_gained', 0) or 0),
+            credit=_case_credit(result),
+            is_correct=bool(result.get('is_correct', False) or result.get('classification') == 'CORRETO'),
+            duration=float(data.get('duration_seconds', 0) or 0),
+            criteria=criteria,
+            attempt=int(result.get('attempt') or 1),
+            retries=_retries(result.get('retries')),
+        )
+
+# Campos lidos pelo CaseEvent — usados como projeção (select) nas consultas agregadas
+CASE_AGGREGATE_FIELDS = [
+    'user_id', 'case_id', 'duration_seconds', EVENT_TS_FIELD, 'timestamp',
+    'case_result.points_gained', 'case_result.is_correct', 'case_result.outcome',
+    'case_result.classification', 'case_result.criterios',
+    'case_result.selected_option', 'case_result.user_answer', 'case_result.attempt',
+    'case_result.retries',
+]
+
+# Campos necessários para contar mensagens de chat sem baixar o conteúdo
+CHAT_COUNT_FIELDS = ['user_id', 'case_id', 'message_count']
+
+def project_fields(query, fields: List[str]):
+    """Aplica projeção (Firestore select) para trafegar só os campos usados."""
+    return query.select(fields)
+
+def _events_from_users_analytics(users_analytics: Dict[str, Dict]) -> Dict[str, List[CaseEvent]]:
+    from logic import QUESTIONS
+    q_map = {q['id']: q for q in QUESTIONS}
+    return {
+        uid: [CaseEvent.from_dict(d, q_map=q_map) for d in data.get('case_analytics', [])]
+        for uid, data in users_analytics.items()
+    }
+
+@profiled("storage")
+def get_all_case_events() -> Dict[str, List[CaseEvent]]:
+    """Eventos de caso compactos de todos os alunos (user_id -> [CaseEvent])."""
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return _events_from_users_analytics(mirror.get_all_users_analytics())
+    if is_firebase_connected():
+        return get_all_case_events_firebase()
+    return _events_from_users_analytics(get_all_users_analytics_local())
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_all_case_events_firebase() -> Dict[str, List[CaseEvent]]:
+    """
+    Lê case_analytics de todos os Firebases e mantém só o CaseEvent de cada
+    documento. Os dicts completos são descartados logo após a conversão.
+    """
+    try:
+        return read_all_case_events_firebase()
+    except Exception as e:
+        st.error(f"Erro ao buscar analytics no Firebase: {e}")
+        return {}
+
+def read_all_case_events_firebase() -> Dict[str, List[CaseEvent]]:
+    """Leitura sem cache de get_all_case_events_firebase (erros propagam)."""
+    from logic import QUESTIONS
+    q_map = {q['id']: q for q in QUESTIONS}
+    student_ids = set(get_students_only())
+    if not student_ids:
+        return {}
+
+    events: Dict[str, List[CaseEvent]] = {}
+    seen = set()
+    for db in get_all_dbs():
+        query = project_fields(db.collection('case_analytics'), CASE_AGGREGATE_FIELDS)
+        for doc in query.get():
+            if doc.id in seen:
+                continue
+            data = doc.to_dict()
+            uid = data.get('user_id')
+            if uid not in student_ids:
+                continue
+            seen.add(doc.id)
+            events.setdefault(uid, []).append(CaseEvent.from_dict(data, doc.id, q_map))
+    return events
+
+def load_all_users_analytics() -> Dict[str, Dict]:
+    """
+    Analytics de todos os alunos direto da fonte (espelho, Firebase ou local), sem o
+    cache de 5 min. Usado na carga dos índices em memória (answer_index,
+    distractor_stats), que precisam refletir resets e respostas recentes.
+    """
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return mirror.get_all_users_analytics()
+    if is_firebase_connected():
+        return read_all_users_analytics_firebase()
+    return read_all_users_analytics_local()
+
+def load_all_case_events() -> Dict[str, List[CaseEvent]]:
+    """Como get_all_case_events, mas sem o cache de 5 min (ver load_all_users_analytics)."""
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return _events_from_users_analytics(mirror.get_all_users_analytics())
+    if is_firebase_connected():
+        return read_all_case_events_firebase()
+    return _events_from_users_analytics(read_all_users_analytics_local())
+
+def _chat_message_count(data: Dict) -> int:
+    """Quantidade de mensagens de um documento de chat (agrupado ou legado)."""
+    count = data.get('message_count')
+    if isinstance(count, int):
+        return count
+    if isinstance(data.get('messages'), list):
+        return len(data['messages'])
+    return 1
+
+@profiled("storage")
+def get_chat_message_counts() -> Dict[str, Dict[str, int]]:
+    """Totais de chat por aluno: {user_id: {'sessions': n, 'messages': m}}."""
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        users_analytics = mirror.get_all_users_analytics()
+    elif is_firebase_connected():
+        return get_chat_message_counts_firebase()
+    else:
+        users_analytics = get_all_users_analytics_local()
+    return {
+        uid: {'sessions': len(data.get('chat_interactions', [])),
+              'messages': sum(_chat_message_count(d) for d in data.get('chat_interactions', []))}
+        for uid, data in users_analytics.items()
+    }
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_chat_message_counts_firebase() -> Dict[str, Dict[str, int]]:
+    """
+    Conta sessões e mensagens de chat por aluno lendo só o message_count de cada
+    documento. Documentos antigos sem o campo contam como 1 mensagem até o backfill.
+    """
+    try:
+        student_ids = set(get_students_only())
+        counts: Dict[str, Dict[str, int]] = {}
+        seen = set()
+        for db in get_all_dbs():
+            query = project_fields(db.collection('chat_interactions'), CHAT_COUNT_FIELDS)
+            for doc in query.get():
+                if doc.id in seen:
+                    continue
+                data = doc.to_dict()
+                uid = data.get('user_id')
+                if uid not in student_ids:
+                    continue
+                seen.add(doc.id)
+                entry = counts.setdefault(uid, {'sessions': 0, 'messages': 0})
+                entry['sessions'] += 1
+                entry['messages'] += _chat_message_count(data)
+        return counts
+    except Exception as e:
+        st.error(f"Erro ao buscar interações do chat no Firebase: {e}")
+        return {}
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_case_event_detail(user_id: str, doc_id: str) -> Dict:
+    """
+    Carrega sob demanda o documento completo de um evento (feedback, justificativas,
+    resposta do aluno). Usado apenas nas telas de detalhe/transcrição.
+    """
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        for data in mirror.get_user_case_analytics(user_id):
+            if data.get('id') == doc_id:
+                return data
+    if is_firebase_connected():
+        try:
+            doc = get_db_for_user(user_id).collection('case_analytics').document(doc_id).get()
+            if doc.exists:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                return data
+        except Exception as e:
+            print(f"ERRO ao carregar detalhe do evento {doc_id}: {e}")
+        return {}
+    for data in get_user_case_analytics_local(user_id):
+        if data.get('id') == doc_id:
+            return data
+    return {}
+
 # =============================
 # Funções Auxiliares
 # =============================
 
+def _get_active_mirror():
+    """
+    Retorna o espelho em memória (listeners em tempo real) se o modo estiver
+    habilitado e pronto; caso contrário None e as consultas seguem o caminho normal.
+    """
+    try:
+        from analytics_mirror import get_active_mirror
+        return get_active_mirror()
+    except Exception as e:
+        print(f"Aviso: espelho de analytics indisponível: {e}")
+        return None
+
+def expand_chat_document(data: Dict, doc_id: str = None) -> List[Dict]:
+    """
+    Converte um documento de chat em interações individuais.
+    Documentos agrupados (campo 'messages') viram uma interação por mensagem;
+    documentos antigos (1 msg por doc) são retornados como estão.
+    """
+    if 'messages' in data and isinstance(data['messages'], list):
+        interactions = []
+        for msg in data['messages']:
+            interaction = {
+                'user_id': data.get('user_id'),
+                'case_id': data.get('case_id'),
+                'user_message': msg.get('user_message', ''),
+                'bot_response': msg.get('bot_response', ''),
+                'response_time_seconds': msg.get('response_time_seconds'),
+                'timestamp': msg.get('timestamp', data.get('timestamp')),
+                EVENT_TS_FIELD: msg.get(EVENT_TS_FIELD, data.get(EVENT_TS_FIELD))
+            }
+            if doc_id is not None:
+                interaction['id'] = doc_id
+            interactions.append(interaction)
+        return interactions
+    if doc_id is not None:
+        data['id'] = doc_id
+    return [data]
+
 def get_students_only() -> List[str]:
     """Retorna lista de IDs de usuários que são alunos"""
+    mirror = _get_active_mirror()
+    if mirror is not None:
+        return mirror.get_student_ids()
     try:
-        from auth_firebase import get_all_users
-        all_users = get_all_users()
-        return [user['id'] for user in all_users if user.get('user_type') == 'aluno']
+        from user_directory import get_user_directory
+        return get_user_directory().ids_by_type('aluno')
     except Exception:
         return []
 
+def to_epoch(value) -> float:
+    """
+    Converte um timestamp em epoch (segundos).
+    Aceita número, datetime/Timestamp do Firestore ou string ISO (eventos legados).
+    Retorna 0.0 se não for possível converter.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, str):
+            return datetime.fromisoformat(value).timestamp()
+    except (ValueError, TypeError, OverflowError, OSError):
+        pass
+    return 0.0
+
+def get_event_ts(x: Dict) -> float:
+    """
+    Epoch canônico de um evento.
+    Usa EVENT_TS_FIELD quando presente (sem parsing); só eventos legados
+    ainda não migrados caem na conversão do campo 'timestamp'.
+    """
+    ts = x.get(EVENT_TS_FIELD)
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    return to_epoch(x.get('timestamp'))
+
 def get_timestamp_sort_key(x):
     """Função auxiliar para ordenação de timestamps - versão ultra robusta"""
+    ts = x.get(EVENT_TS_FIELD) if isinstance(x, dict) else None
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(ts)
     try:
         timestamp = x.get('timestamp', datetime.min.isoformat())
         if isinstance(timestamp, str):
@@ -625,51 +1191,20 @@ def get_case_resolution_times(user_id: str) -> List[Dict[str, Any]]:
         duration_seconds = case_data.get('duration_seconds', 0)
         duration_formatted = case_data.get('duration_formatted', 'N/A')
         case_result = case_data.get('case_result', 'unknown')
-        timestamp = case_data.get('timestamp', datetime.now().isoformat())
-        
-        # Converte timestamp para datetime se necessário
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp)
+        ts = get_event_ts(case_data)
         
         resolution_times.append({
             'case_id': case_id,
             'duration_seconds': duration_seconds,
             'duration_formatted': duration_formatted,
             'case_result': case_result,
-            'timestamp': timestamp,
+            'timestamp': datetime.fromtimestamp(ts) if ts else datetime.now(),
+            EVENT_TS_FIELD: ts,
             'is_correct': case_result == 'correct'
         })
     
-    # Ordena por timestamp (mais recente primeiro) com tratamento robusto de erro
-    try:
-        def safe_timestamp_sort(x):
-            try:
-                timestamp = x.get('timestamp')
-                if timestamp is None:
-                    return datetime.min
-                
-                dt_val = datetime.min
-                if isinstance(timestamp, str):
-                    try:
-                        dt_val = datetime.fromisoformat(timestamp)
-                    except (ValueError, TypeError):
-                        pass
-                elif isinstance(timestamp, datetime):
-                    dt_val = timestamp
-                
-                # Garante que seja sempre timezone-naive para comparação segura
-                if dt_val.tzinfo is not None:
-                    dt_val = dt_val.replace(tzinfo=None)
-                
-                return dt_val
-            except Exception:
-                return datetime.min
-        
-        resolution_times.sort(key=safe_timestamp_sort, reverse=True)
-    except Exception as e:
-        # Se ainda assim der erro, mantém a lista sem ordenar
-        st.warning(f"⚠️ Erro ao ordenar tempos de resolução: {e}")
-        pass
+    # Ordena por epoch (mais recente primeiro)
+    resolution_times.sort(key=lambda r: r[EVENT_TS_FIELD], reverse=True)
     
     return resolution_times
 
@@ -718,6 +1253,7 @@ def get_resolution_time_stats(user_id: str) -> Dict[str, Any]:
 # Funções de Estatísticas
 # =============================
 
+@profiled("aggregation")
 def get_user_detailed_stats(user_id: str) -> Dict[str, Any]:
     """Retorna estatísticas detalhadas de um usuário"""
     case_analytics = get_user_case_analytics(user_id)
@@ -733,74 +1269,34 @@ def get_user_detailed_stats(user_id: str) -> Dict[str, Any]:
         response_times = [i.get('response_time_seconds', 0) for i in chat_interactions if i.get('response_time_seconds')]
         avg_response_time = sum(response_times) / len(response_times) if response_times else 0
     
-    # Casos por dia (últimos 7 dias)
-    now = datetime.now()
-    recent_cases = []
-    for c in case_analytics:
-        timestamp = c.get('timestamp', now)
-        
-        # Converte string para datetime se necessário
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp)
-        
-        # Garante que ambos tenham o mesmo timezone (timezone-naive)
-        if hasattr(timestamp, 'tzinfo') and timestamp.tzinfo is not None:
-            timestamp = timestamp.replace(tzinfo=None)
-        if hasattr(now, 'tzinfo') and now.tzinfo is not None:
-            now = now.replace(tzinfo=None)
-        
-        # Verifica se é dos últimos 7 dias
-        try:
-            if (now - timestamp).days <= 7:
-                recent_cases.append(c)
-        except (TypeError, ValueError):
-            # Se houver erro na operação, pula este caso
-            continue
+    # Casos por dia (últimos 7 dias) — comparação numérica sobre o epoch
+    now_ts = datetime.now().timestamp()
+    window_start = now_ts - 8 * 86400
+    recent_ts = [ts for ts in (get_event_ts(c) for c in case_analytics) if ts > window_start]
             
     cases_by_day = {}
-    for case_data in recent_cases:
-        timestamp = case_data.get('timestamp', datetime.now())
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp)
-        
-        # Garante timezone-naive
-        if hasattr(timestamp, 'tzinfo') and timestamp.tzinfo is not None:
-            timestamp = timestamp.replace(tzinfo=None)
-            
-        day = timestamp.strftime('%Y-%m-%d')
+    for ts in recent_ts:
+        day = datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
         cases_by_day[day] = cases_by_day.get(day, 0) + 1
     
+    last_ts = max((get_event_ts(c) for c in case_analytics + chat_interactions), default=0.0)
+    
     return {
         'user_id': user_id,
         'case_stats': case_stats,
         'total_chat_interactions': total_chat_interactions,
         'avg_chat_response_time': avg_response_time,
         'avg_chat_response_time_formatted': format_duration(avg_response_time),
-        'recent_cases_count': len(recent_cases),
+        'recent_cases_count': len(recent_ts),
         'cases_by_day': cases_by_day,
-        'last_activity': max([get_timestamp_sort_key(c) for c in case_analytics + chat_interactions], default=datetime.min)
+        'last_activity': datetime.fromtimestamp(last_ts) if last_ts else datetime.min
     }
 
-def _is_today(timestamp) -> bool:
-    """Verifica se um timestamp é de hoje"""
-    try:
-        now = datetime.now()
-        
-        # Converte string para datetime se necessário
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp)
-        
-        # Garante que ambos sejam timezone-naive
-        if hasattr(timestamp, 'tzinfo') and timestamp.tzinfo is not None:
-            timestamp = timestamp.replace(tzinfo=None)
-        if hasattr(now, 'tzinfo') and now.tzinfo is not None:
-            now = now.replace(tzinfo=None)
-        
-        # Verifica se é do mesmo dia
-        return (now - timestamp).days == 0
-    except (TypeError, ValueError, AttributeError):
-        return False
+def _is_today(ts: float) -> bool:
+    """Verifica se um epoch é das últimas 24h"""
+    return ts > 0 and datetime.now().timestamp() - ts < 86400
 
+@profiled("aggregation")
 def get_global_stats() -> Dict[str, Any]:
     """Retorna estatísticas globais do sistema"""
     all_analytics = get_all_users_analytics()
@@ -824,7 +1320,7 @@ def get_global_stats() -> Dict[str, Any]:
         'total_chat_interactions': total_chat_interactions,
         'average_accuracy_rate': avg_accuracy,
         'active_users_today': len([user_id for user_id, data in all_analytics.items() 
-                                  if any(_is_today(case.get('timestamp', datetime.min.isoformat())) 
+                                  if any(_is_today(get_event_ts(case)) 
                                         for case in data['case_analytics'] + data['chat_interactions'])])
     }
 def _get_criterion_score(comp_name: str, criterios: dict) -> float:
@@ -855,6 +1351,7 @@ def _get_criterion_score(comp_name: str, criterios: dict) -> float:
             
     return -1.0 # fallback caso a IA tenha engolido o critério
 
+@profiled("aggregation")
 def get_student_advanced_stats(user_id: str) -> Dict[str, Any]:
     """
     Gera estatísticas avançadas para o aluno:
@@ -965,6 +1462,7 @@ def get_student_advanced_stats(user_id: str) -> Dict[str, Any]:
 # Novas Funções para Dashboard Redesenhado
 # =============================
 
+@profiled("aggregation")
 def get_global_knowledge_component_stats() -> List[Dict[str, Any]]:
     """
     Calcula estatísticas agregadas por componente de conhecimento para todos os alunos.
@@ -972,30 +1470,24 @@ def get_global_knowledge_component_stats() -> List[Dict[str, Any]]:
     """
     from logic import QUESTIONS
     
-    all_analytics = get_all_users_analytics()
-    q_map = {q['id']: q for q in QUESTIONS}
+    all_events = get_all_case_events()
+    q_map = {intern_question_id(q['id']): q for q in QUESTIONS}
     
     # Estrutura para agregar dados por componente
     component_stats = {}
     
-    for user_id, user_data in all_analytics.items():
-        case_analytics = user_data.get('case_analytics', [])
-        
-        for entry in case_analytics:
-            cid = entry.get('case_id')
-            result = entry.get('case_result', {})
-            duration = entry.get('duration_seconds', 0)
+    for user_id, events in all_events.items():
+        for ev in events:
+            duration = ev.duration
             
-            q_data = q_map.get(cid)
+            q_data = q_map.get(ev.question)
             if not q_data:
                 continue
             
-            outcome = result.get('outcome')
-            cwd = 1.0 if outcome == 'correct' else 0.5 if outcome == 'partial' else 0.0 if outcome == 'incorrect' else (1.0 if result.get('is_correct') and "PARCIAL" not in result.get("classification", "").upper() else 0.5 if "PARCIAL" in result.get("classification", "").upper() else 0.0)
+            cwd = ev.credit
             components = q_data.get('componentes_conhecimento', ['Geral'])
-            criterios = result.get('criterios', {})
             
-            for comp in components:
+            for i, comp in enumerate(components):
                 if comp not in component_stats:
                     component_stats[comp] = {
                         'total': 0,
@@ -1003,7 +1495,7 @@ def get_global_knowledge_component_stats() -> List[Dict[str, Any]]:
                         'times': []
                     }
                 
-                crit_score = _get_criterion_score(comp, criterios)
+                crit_score = ev.criteria[i] if ev.criteria else -1.0
                 comp_cwd = cwd if crit_score == -1.0 else crit_score
                 
                 component_stats[comp]['total'] += 1
@@ -1031,45 +1523,38 @@ def get_global_knowledge_component_stats() -> List[Dict[str, Any]]:
     
     return results
 
+@profiled("aggregation")
 def get_question_stats() -> List[Dict[str, Any]]:
     """
     Calcula estatísticas agregadas por QUESTÃO (1 a 6) para todos os alunos.
     """
     from logic import QUESTIONS
     
-    all_analytics = get_all_users_analytics()
-    q_map = {q['id']: i+1 for i, q in enumerate(QUESTIONS)} # Mapeia ID para número 1-6
-    q_titles = {q['id']: q['pergunta'][:50] + "..." for q in QUESTIONS}
+    all_events = get_all_case_events()
+    q_map = {intern_question_id(q['id']): i+1 for i, q in enumerate(QUESTIONS)} # Mapeia ID para número 1-6
+    q_titles = {intern_question_id(q['id']): q['pergunta'][:50] + "..." for q in QUESTIONS}
+    q_max_pts = {intern_question_id(q['id']): float(q.get('pontuacao_maxima', 5.0)) for q in QUESTIONS}
     
     # Estrutura para agregar dados por questão
     question_stats = {}
     
-    for user_id, user_data in all_analytics.items():
-        case_analytics = user_data.get('case_analytics', [])
-        
-        for entry in case_analytics:
-            cid = entry.get('case_id')
-            result = entry.get('case_result', {})
-            duration = entry.get('duration_seconds', 0)
+    for user_id, events in all_events.items():
+        for ev in events:
+            duration = ev.duration
             
-            q_num = q_map.get(cid)
+            q_num = q_map.get(ev.question)
             if not q_num:
                 continue
             
-            points = float(result.get('points_gained', 0))
-            # Para as novas questões, o máximo é 3.0
-            from logic import QUESTIONS as QL
-            q_info = next((q for q in QL if q['id'] == cid), None)
-            max_pts = float(q_info.get('pontuacao_maxima', 5.0)) if q_info else 5.0
-            
-            accuracy_val = (points / max_pts) if max_pts > 0 else 0
+            max_pts = q_max_pts.get(ev.question, 5.0)
+            accuracy_val = (ev.points / max_pts) if max_pts > 0 else 0
             
             if q_num not in question_stats:
                 question_stats[q_num] = {
                     'total': 0,
                     'correct_sum': 0.0,
                     'times': [],
-                    'title': q_titles.get(cid, f"Questão {q_num}")
+                    'title': q_titles.get(ev.question, f"Questão {q_num}")
                 }
             
             question_stats[q_num]['total'] += 1
@@ -1107,47 +1592,12 @@ def get_hardest_categories(top_n: int = 5) -> List[Dict[str, Any]]:
 
 def get_all_answers_by_category(limit_per_category: int = 20) -> Dict[str, List[str]]:
     """
-    Agrupa todas as respostas (corretas, parciais e incorretas) 
-    por categoria de conhecimento, para enviar à IA.
+    Respostas de menor pontuação de cada categoria (eixos T1..T8), para enviar à IA.
+    Vem do índice por tópico mantido em memória (answer_index.py), sem varrer os eventos.
     Returns:
         Um dicionário: { "Nome da Categoria": ["Resposta ruim 1", "Resposta ruim 2"] }
     """
-    from logic import QUESTIONS
-    # Mapeamento de QID para o Tópico dos 8 Eixos
-    qid_to_axis = {q['id']: f"{q.get('topico_id', '')} — {q.get('topico_nome', '')}" for q in QUESTIONS}
-    
-    # Coleta de respostas por eixo
-    axis_answers = {}
-    
-    for user_id, user_data in all_analytics.items():
-        case_analytics = user_data.get('case_analytics', [])
-        for entry in case_analytics:
-            qid = entry.get('case_id')
-            if not qid or qid not in qid_to_axis:
-                continue
-                
-            axis = qid_to_axis[qid]
-            result = entry.get('case_result', {})
-            user_answer = result.get('user_answer')
-            points = result.get('points_gained', 0)
-            
-            if user_answer and len(user_answer) > 10:
-                if axis not in axis_answers:
-                    axis_answers[axis] = []
-                axis_answers[axis].append({
-                    'answer': user_answer,
-                    'points': points
-                })
-                    
-    # Pega as piores ordenando por pontos e trunca
-    result_dict = {}
-    for axis, answers in axis_answers.items():
-        answers.sort(key=lambda x: x['points'])
-        valid_answers = [a['answer'] for a in answers]
-        if valid_answers:
-            result_dict[axis] = valid_answers[:limit_per_category]
-            
-    return result_dict
+    return get_answer_index().worst_answers(limit_per_category)
 
 def get_average_user_level() -> Dict[str, Any]:
     """
@@ -1156,7 +1606,7 @@ def get_average_user_level() -> Dict[str, Any]:
     """
     from logic import level_from_score
     
-    all_analytics = get_all_users_analytics()
+    all_events = get_all_case_events()
     
     level_distribution = {
         1: 0,  # básico
@@ -1167,15 +1617,9 @@ def get_average_user_level() -> Dict[str, Any]:
     total_score = 0
     total_students = 0
     
-    for user_id, user_data in all_analytics.items():
-        case_analytics = user_data.get('case_analytics', [])
-        
+    for user_id, events in all_events.items():
         # Calcula pontuação total do aluno
-        user_score = 0
-        for entry in case_analytics:
-            result = entry.get('case_result', {})
-            points = result.get('points_gained', 0)
-            user_score += points
+        user_score = sum(ev.points for ev in events)
         
         # Determina nível do aluno
         user_level = level_from_score(int(user_score))
@@ -1352,6 +1796,7 @@ def get_student_weakness_analysis(user_id: str) -> Dict[str, Any]:
         'padroes_erro': error_patterns
     }
 
+@profiled("aggregation")
 def get_student_complete_profile(user_id: str) -> Dict[str, Any]:
     """
     Perfil completo do aluno incluindo:
@@ -1375,38 +1820,24 @@ def get_student_complete_profile(user_id: str) -> Dict[str, Any]:
     performance_vs_class = 'acima' if user_accuracy > class_avg_accuracy else 'abaixo' if user_accuracy < class_avg_accuracy else 'igual'
     difference = abs(user_accuracy - class_avg_accuracy)
     
-    # Evolução temporal (últimos 30 dias)
-    case_analytics = get_user_case_analytics(user_id)
+    # Evolução temporal (últimos 30 dias) — lê só a janela, não o histórico inteiro
+    case_analytics = get_recent_user_case_analytics(user_id, days=30)
     
     # Agrupa por semana
     weekly_performance = {}
-    now = datetime.now()
+    now_ts = datetime.now().timestamp()
     
     for entry in case_analytics:
-        timestamp = entry.get('timestamp')
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp)
-        
-        # Garante timezone-naive
-        if hasattr(timestamp, 'tzinfo') and timestamp.tzinfo is not None:
-            timestamp = timestamp.replace(tzinfo=None)
-        if hasattr(now, 'tzinfo') and now.tzinfo is not None:
-            now = now.replace(tzinfo=None)
-        
-        # Verifica se é dos últimos 30 dias
-        try:
-            days_ago = (now - timestamp).days
-            if days_ago <= 30:
-                week = f'Semana {days_ago // 7 + 1}'
-                if week not in weekly_performance:
-                    weekly_performance[week] = {'total': 0, 'correct': 0}
-                
-                weekly_performance[week]['total'] += 1
-                result = entry.get('case_result', {})
-                if result.get('is_correct', False):
-                    weekly_performance[week]['correct'] += 1
-        except (TypeError, ValueError):
-            continue
+        days_ago = int((now_ts - get_event_ts(entry)) // 86400)
+        if 0 <= days_ago <= 30:
+            week = f'Semana {days_ago // 7 + 1}'
+            if week not in weekly_performance:
+                weekly_performance[week] = {'total': 0, 'correct': 0}
+            
+            weekly_performance[week]['total'] += 1
+            result = entry.get('case_result', {})
+            if result.get('is_correct', False):
+                weekly_performance[week]['correct'] += 1
     
     # Calcula tendência (melhorando/piorando/estável)
     trend = 'estável'
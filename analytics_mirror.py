@@ -0,0 +1,234 @@
+"""
+Espelho em memória das coleções de analytics alimentado por listeners em tempo real.
+
+Modo opcional: quando habilitado, um único listener `on_snapshot` por coleção/shard
+mantém `case_analytics`, `chat_interactions` e `users` em memória. Os deltas são
+aplicados incrementalmente, então os dashboards leem da memória com atualização
+ao vivo e só as alterações são cobradas como leituras.
+
+Habilitar em `.streamlit/secrets.toml`:
+
+    [analytics]
+    realtime_mirror = true
+
+ou com a variável de ambiente CLINTUTOR_REALTIME_MIRROR=1.
+"""
+
+import os
+import threading
+import streamlit as st
+from typing import Dict, List, Optional, Tuple
+
+from firebase_config import get_shards, is_firebase_connected
+from analytics import expand_chat_document, get_event_ts
+
+MIRRORED_COLLECTIONS = ('case_analytics', 'chat_interactions', 'users')
+
+# Tempo máximo aguardando o snapshot inicial antes de cair no caminho de consulta
+INITIAL_SNAPSHOT_TIMEOUT = 15.0
+
+
+def realtime_mirror_enabled() -> bool:
+    """True se o modo de espelho em tempo real foi habilitado por config."""
+    env_flag = os.environ.get('CLINTUTOR_REALTIME_MIRROR', '').strip().lower()
+    if env_flag in ('1', 'true', 'yes', 'on'):
+        return True
+    try:
+        if 'analytics' in st.secrets:
+            return bool(st.secrets['analytics'].get('realtime_mirror', False))
+    except Exception:
+        pass
+    return False
+
+
+class AnalyticsMirror:
+    """
+    Mantém cópia em memória das coleções de analytics de todos os shards.
+    - Eventos são indexados por (shard, doc_id) e agrupados por user_id
+    - Usuários ficam sempre no Firebase primário (shard 0)
+    - Callbacks dos listeners rodam em threads do SDK, por isso tudo passa pelo lock
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cases: Dict[str, Dict[Tuple[int, str], Dict]] = {}   # user_id -> {(shard, doc_id): data}
+        self._chats: Dict[str, Dict[Tuple[int, str], Dict]] = {}
+        self._case_owner: Dict[Tuple[int, str], str] = {}           # (shard, doc_id) -> user_id
+        self._chat_owner: Dict[Tuple[int, str], str] = {}
+        self._users: Dict[str, Dict] = {}
+        self._watches = []
+        self._pending: set = set()
+        self._ready = threading.Event()
+        self.delta_count = 0
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Registra um listener por coleção/shard."""
+        shards = get_shards()
+        if not shards:
+            return
+        targets = []
+        for shard_idx, db in shards:
+            targets.append((shard_idx, db, 'case_analytics'))
+            targets.append((shard_idx, db, 'chat_interactions'))
+        # Usuários ficam no primário
+        targets.append((shards[0][0], shards[0][1], 'users'))
+
+        with self._lock:
+            self._pending = {(shard_idx, name) for shard_idx, _, name in targets}
+
+        for shard_idx, db, name in targets:
+            callback = self._make_callback(shard_idx, name)
+            watch = db.collection(name).on_snapshot(callback)
+            self._watches.append(watch)
+        print(f"MIRROR: {len(self._watches)} listeners registrados")
+
+    def stop(self):
+        """Cancela todos os listeners."""
+        for watch in self._watches:
+            try:
+                watch.unsubscribe()
+            except Exception:
+                pass
+        self._watches = []
+        self._ready.clear()
+
+    def wait_until_ready(self, timeout: float = INITIAL_SNAPSHOT_TIMEOUT) -> bool:
+        return self._ready.wait(timeout)
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    # ------------------------------------------------------------------
+    # Aplicação de deltas
+    # ------------------------------------------------------------------
+
+    def _make_callback(self, shard_idx: int, collection: str):
+        def on_snapshot(col_snapshot, changes, read_time):
+            try:
+                self._apply_changes(shard_idx, collection, changes)
+            except Exception as e:
+                print(f"MIRROR: erro ao aplicar deltas de {collection}[{shard_idx}]: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard((shard_idx, collection))
+                    if not self._pending:
+                        self._ready.set()
+        return on_snapshot
+
+    def _apply_changes(self, shard_idx: int, collection: str, changes):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                kind = change.type.name
+                if kind == 'REMOVED':
+                    self.remove(shard_idx, collection, doc.id)
+                else:
+                    self.upsert(shard_idx, collection, doc.id, doc.to_dict() or {})
+                self.delta_count += 1
+
+    def upsert(self, shard_idx: int, collection: str, doc_id: str, data: Dict):
+        """Insere/atualiza um documento espelhado (ADDED ou MODIFIED)."""
+        with self._lock:
+            if collection == 'users':
+                data['id'] = doc_id
+                self._users[doc_id] = data
+                return
+            by_user, owners = self._indexes(collection)
+            key = (shard_idx, doc_id)
+            # Se o documento trocou de dono, remove da lista antiga
+            self.remove(shard_idx, collection, doc_id)
+            uid = data.get('user_id')
+            data['id'] = doc_id
+            by_user.setdefault(uid, {})[key] = data
+            owners[key] = uid
+
+    def remove(self, shard_idx: int, collection: str, doc_id: str):
+        """Remove um documento espelhado (REMOVED)."""
+        with self._lock:
+            if collection == 'users':
+                self._users.pop(doc_id, None)
+                return
+            by_user, owners = self._indexes(collection)
+            key = (shard_idx, doc_id)
+            uid = owners.pop(key, None)
+            if key in by_user.get(uid, {}):
+                del by_user[uid][key]
+                if not by_user[uid]:
+                    del by_user[uid]
+
+    def _indexes(self, collection: str):
+        if collection == 'case_analytics':
+            return self._cases, self._case_owner
+        return self._chats, self._chat_owner
+
+    # ------------------------------------------------------------------
+    # Acessores (mesmo formato de retorno de analytics.py)
+    # ------------------------------------------------------------------
+
+    def get_all_users(self) -> List[Dict]:
+        with self._lock:
+            return [dict(u) for u in self._users.values()]
+
+    def get_student_ids(self) -> List[str]:
+        with self._lock:
+            return [uid for uid, u in self._users.items() if u.get('user_type') == 'aluno']
+
+    def get_user_case_analytics(self, user_id: str) -> List[Dict]:
+        with self._lock:
+            analytics = list(self._cases.get(user_id, {}).values())
+        analytics.sort(key=get_event_ts, reverse=True)
+        return analytics
+
+    def get_user_chat_documents(self, user_id: str) -> List[Dict]:
+        """Documentos de chat do aluno sem expandir (campo 'messages' agrupado)."""
+        with self._lock:
+            return list(self._chats.get(user_id, {}).values())
+
+    def get_user_chat_interactions(self, user_id: str, case_id: str = None) -> List[Dict]:
+        with self._lock:
+            docs = list(self._chats.get(user_id, {}).values())
+        interactions = []
+        for data in docs:
+            if case_id and data.get('case_id') != case_id:
+                continue
+            interactions.extend(expand_chat_document(dict(data), data.get('id')))
+        interactions.sort(key=get_event_ts)
+        return interactions
+
+    def get_all_users_analytics(self) -> Dict[str, Dict]:
+        with self._lock:
+            student_ids = set(self.get_student_ids())
+            users_analytics: Dict[str, Dict] = {}
+            for uid, docs in self._cases.items():
+                if uid in student_ids:
+                    users_analytics.setdefault(uid, {'case_analytics': [], 'chat_interactions': []})
+                    users_analytics[uid]['case_analytics'] = list(docs.values())
+            for uid, docs in self._chats.items():
+                if uid in student_ids:
+                    users_analytics.setdefault(uid, {'case_analytics': [], 'chat_interactions': []})
+                    users_analytics[uid]['chat_interactions'] = list(docs.values())
+        return users_analytics
+
+
+@st.cache_resource(show_spinner=False)
+def _get_mirror() -> AnalyticsMirror:
+    """Instância única por processo (compartilhada entre sessões)."""
+    mirror = AnalyticsMirror()
+    mirror.start()
+    mirror.wait_until_ready()
+    return mirror
+
+
+def get_active_mirror() -> Optional[AnalyticsMirror]:
+    """
+    Retorna o espelho se o modo estiver habilitado, o Firebase conectado e o
+    snapshot inicial já tiver chegado. Caso contrário None (usa consultas normais).
+    """
+    if not realtime_mirror_enabled() or not is_firebase_connected():
+        return None
+    mirror = _get_mirror()
+    return mirror if mirror.is_ready() else None
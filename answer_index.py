@@ -0,0 +1,184 @@
+"""
+Índice em memória das piores respostas por tópico (amostras para os insights da IA).
+
+Para cada tópico (eixo T1..T8) mantém um heap limitado com as TOPIC_CAPACITY
+respostas de menor pontuação (no empate, as mais recentes). O índice é montado
+uma vez por processo a partir de todos os analytics e depois atualizado por
+save_case_analytics a cada resposta nova, então amostrar um tópico custa O(k)
+em vez de varrer e ordenar todos os eventos.
+
+Compartilhado entre sessões via `st.cache_resource`, como o diretório de usuários.
+A carga lê a fonte sem o cache de 5 min (load_all_users_analytics), então um reload()
+após resetar analytics não traz de volta respostas apagadas. Resetar um aluno só usa
+remove_user(), que tira as respostas dele sem reler o banco (o tópico fica com menos
+respostas até o próximo reload). Respostas salvas durante a carga ficam num buffer e
+entram no fim dela. Respostas gravadas por outra instância do servidor só entram no
+próximo reload().
+"""
+
+import heapq
+import threading
+import streamlit as st
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Respostas guardadas por tópico (>= limite pedido por get_all_answers_by_category)
+TOPIC_CAPACITY = 50
+# Respostas curtas demais não dizem nada à IA
+MIN_ANSWER_LENGTH = 10
+
+
+def _event_key(event: Dict) -> Tuple:
+    """Identifica um evento lido do banco e o mesmo evento recebido por add()."""
+    from analytics import get_event_ts
+    return (event.get('user_id'), event.get('case_id'), get_event_ts(event))
+
+
+class TopicAnswerIndex:
+    """Heaps por tópico com as respostas de menor pontuação (thread-safe)."""
+
+    def __init__(self, loader: Callable[[], Dict[str, Dict]], capacity: int = TOPIC_CAPACITY):
+        self._loader = loader
+        self.capacity = capacity
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        # Eventos salvos enquanto a carga roda (None fora da carga) e geração da
+        # carga, incrementada por reload() para descartar uma carga em andamento
+        self._pending: Optional[List[Dict]] = None
+        self._generation = 0
+        # Alunos removidos durante a carga: a leitura pode ter pego respostas já apagadas
+        self._removed_during_load: set = set()
+        self._axis_of: Optional[Dict[str, str]] = None
+        # tópico -> heap de (-pontos, seq, resposta, user_id): o topo é a melhor
+        # resposta guardada (a primeira a sair), e no empate a mais antiga
+        self._heaps: Dict[str, List[Tuple[float, int, str, str]]] = {}
+        self._seq = 0
+
+    def _axis(self, case_id: str) -> Optional[str]:
+        if self._axis_of is None:
+            from logic import QUESTIONS
+            self._axis_of = {q['id']: f"{q.get('topico_id', '')} — {q.get('topico_nome', '')}" for q in QUESTIONS}
+        return self._axis_of.get(case_id)
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                generation = self._generation
+                self._pending = []
+                self._removed_during_load = set()
+            try:
+                # Fora do _lock: add() continua respondendo (e bufferizando) durante a leitura
+                users_analytics = self._loader()
+            except Exception as e:
+                # Não marca como carregado: a próxima consulta tenta de novo
+                with self._lock:
+                    self._pending = None
+                print(f"ANSWERS: erro ao carregar índice de respostas: {e}")
+                return
+            from analytics import get_event_ts
+            events = [e for data in users_analytics.values() for e in data.get('case_analytics', [])]
+            with self._lock:
+                if generation != self._generation:
+                    # reload() durante a carga: a leitura pode ser anterior ao reset
+                    self._pending = None
+                    return
+                removed = self._removed_during_load
+                events = [e for e in events if e.get('user_id') not in removed]
+                loaded_keys = {_event_key(e) for e in events}
+                events.extend(e for e in self._pending if _event_key(e) not in loaded_keys)
+                self._pending = None
+                events.sort(key=get_event_ts)
+                for event in events:
+                    self._push(event)
+                self._loaded = True
+            print(f"ANSWERS: índice carregado com {len(events)} eventos em {len(self._heaps)} tópicos")
+
+    def is_ready(self) -> bool:
+        return self._loaded
+
+    def reload(self):
+        """Descarta o índice; a próxima consulta recarrega do banco (ex: após resetar analytics)."""
+        with self._lock:
+            self._heaps.clear()
+            self._loaded = False
+            self._generation += 1
+            if self._pending is not None:
+                self._pending = []
+
+    # ------------------------------------------------------------------
+    # Manutenção
+    # ------------------------------------------------------------------
+
+    def _push(self, event: Dict):
+        axis = self._axis(event.get('case_id'))
+        if axis is None:
+            return
+        result = event.get('case_result') or {}
+        if not isinstance(result, dict):
+            return
+        answer = result.get('user_answer')
+        if not answer or len(answer) <= MIN_ANSWER_LENGTH:
+            return
+        self._seq += 1
+        entry = (-float(result.get('points_gained', 0) or 0), self._seq, answer, event.get('user_id'))
+        heap = self._heaps.setdefault(axis, [])
+        if len(heap) < self.capacity:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def add(self, event: Dict):
+        """
+        Incorpora um evento recém-salvo. Durante a carga, guarda no buffer; antes
+        dela não faz nada, porque a carga lê o banco sem cache e já o inclui.
+        """
+        with self._lock:
+            if self._loaded:
+                self._push(event)
+            elif self._pending is not None:
+                self._pending.append(event)
+
+    def remove_user(self, user_id: str):
+        """Tira as respostas de um aluno (reset individual) sem recarregar o índice."""
+        with self._lock:
+            for axis, heap in self._heaps.items():
+                kept = [entry for entry in heap if entry[3] != user_id]
+                if len(kept) != len(heap):
+                    heapq.heapify(kept)
+                    self._heaps[axis] = kept
+            if self._pending is not None:
+                self._pending = [e for e in self._pending if e.get('user_id') != user_id]
+                self._removed_during_load.add(user_id)
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def worst_answers(self, limit: int = 20) -> Dict[str, List[str]]:
+        """{tópico: respostas}, das menores pontuações para as maiores (empate: mais recente primeiro)."""
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                axis: [answer for _, _, answer, _ in sorted(heap, reverse=True)[:limit]]
+                for axis, heap in self._heaps.items() if heap
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _get_index(backend: str) -> TopicAnswerIndex:
+    """Uma instância por backend ('firebase' ou 'local') e por processo."""
+    from analytics import load_all_users_analytics
+    return TopicAnswerIndex(load_all_users_analytics)
+
+
+def get_answer_index() -> TopicAnswerIndex:
+    from firebase_config import is_firebase_connected
+    return _get_index('firebase' if is_firebase_connected() else 'local')
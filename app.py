@@ -14,15 +14,17 @@ from auth_firebase import (
     init_session, login_user, logout_user, is_logged_in, get_current_user,
     register_user, authenticate_user, require_login, require_professor,
     get_all_users, delete_user, migrate_local_to_firebase, is_firebase_connected,
-    create_default_admin, create_auth_token, validate_auth_token, get_user_by_id
+    bootstrap_app, create_auth_token, restore_session
 )
 from analytics import (
     start_case_timer, end_case_timer, log_chat_interaction, 
     get_user_detailed_stats, calculate_accuracy_rate,
-    save_student_progress, load_student_progress, flush_chat_buffer
+    save_student_progress, load_student_progress, flush_chat_buffer,
+    record_retry_attempt
 )
 from admin_dashboard import show_admin_dashboard
 from professor_dashboard import show_advanced_professor_dashboard
+from profiling import profiled, rerun_trace
 
 TOPIC_KEYS = list(TOPICS.keys()) # ['T1', 'T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'T8']
 
@@ -38,6 +40,7 @@ def apply_custom_style():
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
     st.markdown('<link href="https://fonts.googleapis.com/icon?family=Material+Icons|Material+Icons+Outlined|Material+Icons+Round|Material+Icons+Sharp|Material+Icons+Two+Tone" rel="stylesheet">', unsafe_allow_html=True)
 
+@profiled("ui")
 def show_login_page():
     """Exibe página de login e cadastro com visual modernizado"""
     apply_custom_style()
@@ -186,6 +189,7 @@ def show_login_page():
                         st.rerun()
     st.markdown("<div style='text-align: center; margin-top: 3rem; color: #999; font-size: 0.8em;'>Helix.AI v2.0</div>", unsafe_allow_html=True)
 
+@profiled("ui")
 def render_top_navbar():
     user = get_current_user()
     if not user:
@@ -268,6 +272,7 @@ def render_top_navbar():
     st.markdown("<hr class='nav-divider'>", unsafe_allow_html=True)
 
 
+@profiled("ui")
 def init_state():
     if "session_id" not in st.session_state: st.session_state.session_id = str(uuid.uuid4())
     user = get_current_user()
@@ -292,7 +297,7 @@ def init_state():
         "chat": [], "show_next_case_btn": False, "used_cases": [],
         "current_timer_id": None, "case_counter": 0, "current_evaluation": None,
         "submitted_answer": False, "selected_option": None, "insistence_count": 0,
-        "topic_attempts": 0
+        "topic_attempts": 0, "current_case_event": None
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -342,6 +347,7 @@ def start_new_case(forced_topic=None, forced_diff=None):
         st.session_state.current_difficulty = forced_diff
         
     st.session_state.topic_attempts = 0
+    st.session_state.current_case_event = None
     diff = st.session_state.get("current_difficulty", "Fácil")
     topic = st.session_state.get("topic_filter", "T1")
     
@@ -383,15 +389,12 @@ def main():
     st.set_page_config(page_title="Helix.AI", page_icon="biotech", layout="wide")
     apply_custom_style()
     init_session()
-    create_default_admin()
+    bootstrap_app()
     
     if not is_logged_in():
         token = st.context.cookies.get('auth_token')
-        if token:
-            uid = validate_auth_token(token)
-            if uid:
-                u_data = get_user_by_id(uid)
-                if u_data: login_user(u_data); st.rerun()
+        if token and restore_session(token):
+            st.rerun()
 
     if not is_logged_in():
         show_login_page()
@@ -532,8 +535,18 @@ def main():
                         # Analytics & Timer
                         user = get_current_user()
                         try:
-                            result_log = finalize_question_response(case, eval_res["user_answer"], eval_res)
-                            end_case_timer(st.session_state.current_timer_id, result_log)
+                            case_event = st.session_state.get("current_case_event")
+                            if attempts > 1 and case_event:
+                                # Nova tentativa: anexada ao evento da questão (não conta nos totais)
+                                record_retry_attempt(case_event, {
+                                    "selected_option": eval_res["selected_option"],
+                                    "attempt": attempts,
+                                    "is_correct": eval_res["is_correct"],
+                                    "duration_seconds": time.time() - st.session_state.get("retry_started_at", time.time()),
+                                })
+                            else:
+                                result_log = finalize_question_response(case, eval_res["user_answer"], eval_res, attempt=attempts)
+                                st.session_state.current_case_event = end_case_timer(st.session_state.current_timer_id, result_log)
                         except Exception as e:
                             print(f"Erro ao encerrar timer: {e}")
                             
@@ -613,6 +626,8 @@ def main():
                             st.session_state.submitted_answer = False
                             st.session_state.selected_option = None
                             st.session_state.current_evaluation = None
+                            # Tempo da nova tentativa (vai para case_result.retries do evento da questão)
+                            st.session_state.retry_started_at = time.time()
                             st.rerun()
                     with btn_col2:
                         if st.button("Praticar Outra Questão deste Bloco", use_container_width=True, icon=":material/shuffle:"):
@@ -696,4 +711,5 @@ Tem dúvida sobre algum conceito, termo ou mecanismo? Pode me perguntar!"""
             st.rerun()
 
 if __name__ == "__main__":
-    main()
+    with rerun_trace("app.main"):
+        main()
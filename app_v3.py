@@ -14,7 +14,7 @@ from auth_firebase import (
     init_session, login_user, logout_user, is_logged_in, get_current_user,
     register_user, authenticate_user, require_login, require_professor,
     get_all_users, delete_user, migrate_local_to_firebase, is_firebase_connected,
-    create_default_admin, create_auth_token, validate_auth_token, get_user_by_id
+    bootstrap_app, create_auth_token, restore_session
 )
 from analytics import (
     start_case_timer, end_case_timer, log_chat_interaction, 
@@ -22,6 +22,7 @@ from analytics import (
 )
 from admin_dashboard import show_admin_dashboard
 from professor_dashboard import show_advanced_professor_dashboard
+from profiling import profiled, rerun_trace
 
 # --- DEBUG MARKER ---
 # st.toast("Versão V3 Carregada Corretamente!", icon="✅")
@@ -42,6 +43,7 @@ def apply_custom_style():
         pass
     st.markdown('<link href="https://fonts.googleapis.com/icon?family=Material+Icons|Material+Icons+Outlined|Material+Icons+Round|Material+Icons+Sharp|Material+Icons+Two+Tone" rel="stylesheet">', unsafe_allow_html=True)
 
+@profiled("ui")
 def show_login_page():
     """Exibe página de login e cadastro com visual modernizado"""
     apply_custom_style()
@@ -125,6 +127,7 @@ def show_user_profile():
             st.rerun()
         st.markdown("---")
 
+@profiled("ui")
 def init_state():
     if "session_id" not in st.session_state: st.session_state.session_id = str(uuid.uuid4())
     user = get_current_user()
@@ -181,16 +184,13 @@ def main():
     # st.toast("Versão V3 Carregada!", icon="✅")
     apply_custom_style()
     init_session()
-    create_default_admin()
+    bootstrap_app()
     
     if not is_logged_in():
         # Lendo de forma nativa e ultra-rapida a partir do contexto do streamlit
         token = st.context.cookies.get('auth_token')
-        if token:
-            uid = validate_auth_token(token)
-            if uid:
-                u_data = get_user_by_id(uid)
-                if u_data: login_user(u_data); st.rerun()
+        if token and restore_session(token):
+            st.rerun()
 
     if not is_logged_in():
         show_login_page()
@@ -332,4 +332,5 @@ def main():
                 st.rerun()
 
 if __name__ == "__main__":
-    main()
+    with rerun_trace("app.main"):
+        main()
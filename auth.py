@@ -1,9 +1,9 @@
 import json
 import os
-import hashlib
 import streamlit as st
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
+from password_hasher import hash_password as _scrypt_hash, verify_password, needs_rehash
 
 # Configurações do banco de dados de usuários
 USERS_DB_PATH = os.path.join(os.path.expanduser("~"), ".clintutor", "users.json")
@@ -33,8 +33,8 @@ def save_users(users: List[Dict]):
         st.error(f"Erro ao salvar usuários: {e}")
 
 def hash_password(password: str) -> str:
-    """Cria hash da senha usando SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Cria hash da senha (scrypt com salt)"""
+    return _scrypt_hash(password)
 
 def validate_email(email: str) -> bool:
     """Valida formato do email"""
@@ -101,12 +101,13 @@ def authenticate_user(email: str, password: str) -> Tuple[bool, str, Optional[Di
         return False, "Email e senha são obrigatórios", None
     
     users = load_users()
-    hashed_password = hash_password(password)
     
     for user in users:
-        if user["email"].lower() == email.lower() and user["password"] == hashed_password:
-            # Atualiza último login
+        if user["email"].lower() == email.lower() and verify_password(password, user["password"]):
+            # Atualiza último login (e migra hash legado para scrypt)
             user["last_login"] = datetime.now().isoformat()
+            if needs_rehash(user["password"]):
+                user["password"] = hash_password(password)
             save_users(users)
             return True, "Login realizado com sucesso!", user
     
@@ -169,7 +170,7 @@ def change_password(user_id: int, current_password: str, new_password: str) -> T
         return False, "Usuário não encontrado"
     
     # Verifica senha atual
-    if user["password"] != hash_password(current_password):
+    if not verify_password(current_password, user["password"]):
         return False, "Senha atual incorreta"
     
     # Valida nova senha
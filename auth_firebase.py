@@ -2,39 +2,86 @@ import hashlib
 import streamlit as st
 import hmac
 import base64
+import time
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from firebase_config import get_firestore_db, is_firebase_connected
+from user_directory import get_user_directory
+from password_hasher import get_password_verifier, verify_password
+from profiling import profiled
 import json
 import os
 
-# Segredo para assinatura de cookies (em produção, usar env var)
-SECRET_KEY = "auth_cookie_signature_fallback_key"
+# Validade do cookie "Manter conectado"
+AUTH_TOKEN_TTL_SECONDS = 7 * 24 * 60 * 60
 
 # Configurações do banco de dados local (fallback)
 USERS_DB_PATH = os.path.join(os.path.expanduser("~"), ".clintutor", "users.json")
 
+_cookie_secret: Optional[str] = None
+
+def _get_cookie_secret() -> str:
+    """
+    Segredo de assinatura dos cookies: CLINTUTOR_COOKIE_SECRET ou [auth] cookie_secret
+    no secrets.toml. Sem configuração, usa um segredo aleatório do processo (os
+    cookies "Manter conectado" deixam de valer quando o servidor reinicia).
+    """
+    global _cookie_secret
+    if _cookie_secret is None:
+        secret = os.environ.get('CLINTUTOR_COOKIE_SECRET', '').strip()
+        if not secret:
+            try:
+                if 'auth' in st.secrets:
+                    secret = str(st.secrets['auth'].get('cookie_secret', '') or '').strip()
+            except Exception:
+                pass
+        if not secret:
+            import secrets
+            secret = secrets.token_hex(32)
+            print("AUTH: [auth] cookie_secret não configurado; usando segredo temporário do processo")
+        _cookie_secret = secret
+    return _cookie_secret
+
+def _sign(msg: str) -> str:
+    return hmac.new(_get_cookie_secret().encode(), msg.encode(), hashlib.sha256).hexdigest()
+
 def create_auth_token(user_id: str) -> str:
-    """Gera um token assinado para persistência de login"""
-    msg = str(user_id).encode()
-    signature = hmac.new(SECRET_KEY.encode(), msg, hashlib.sha256).hexdigest()
-    return f"{user_id}.{signature}"
+    """
+    Gera um token assinado e com expiração para persistência de login.
+    O token só identifica o usuário: nome e tipo sempre vêm do banco na restauração.
+    """
+    claims = {'id': str(user_id), 'exp': int(time.time()) + AUTH_TOKEN_TTL_SECONDS}
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip('=')
+    return f"v2.{payload}.{_sign(payload)}"
 
-def validate_auth_token(token: str) -> Optional[str]:
-    """Valida um token assinado e retorna o user_id se válido"""
+def decode_auth_token(token: str) -> Optional[Dict]:
+    """
+    Valida a assinatura (e a expiração) e retorna as claims do token ({'id', 'exp'}).
+    Tokens antigos ("<user_id>.<assinatura>") retornam só {'id': user_id}.
+    """
     try:
         if not token or '.' not in token: return None
-        user_id, received_sig = token.split('.', 1)
+        if token.startswith('v2.'):
+            _, payload, received_sig = token.split('.', 2)
+            if not hmac.compare_digest(_sign(payload), received_sig):
+                return None
+            claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+            if claims.get('exp', 0) < time.time():
+                return None
+            return claims
         
-        msg = str(user_id).encode()
-        expected_sig = hmac.new(SECRET_KEY.encode(), msg, hashlib.sha256).hexdigest()
-        
-        if hmac.compare_digest(expected_sig, received_sig):
-            return user_id
+        user_id, received_sig = token.split('.', 1)
+        if hmac.compare_digest(_sign(str(user_id)), received_sig):
+            return {'id': user_id}
         return None
-    except:
+    except Exception:
         return None
 
+def validate_auth_token(token: str) -> Optional[str]:
+    """Valida um token assinado e retorna o user_id se válido"""
+    claims = decode_auth_token(token)
+    return claims['id'] if claims else None
+
 def init_users_db():
     """Inicializa o banco de dados local se não existir (fallback)"""
     os.makedirs(os.path.dirname(USERS_DB_PATH), exist_ok=True)
@@ -60,8 +107,25 @@ def save_users_local(users: List[Dict]):
         st.error(f"Erro ao salvar usuários localmente: {e}")
 
 def hash_password(password: str) -> str:
-    """Cria hash da senha usando SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Cria hash da senha (scrypt com salt, calculado no pool de verificação)"""
+    from password_hasher import hash_password as _scrypt_hash
+    return get_password_verifier().hash(password) or _scrypt_hash(password)
+
+def _client_ip() -> Optional[str]:
+    """
+    IP do cliente da sessão atual (para throttling de login).
+    Do X-Forwarded-For vale só a última entrada, acrescentada pelo proxy da
+    hospedagem; as anteriores vêm do próprio cliente e podem ser forjadas.
+    """
+    try:
+        forwarded = st.context.headers.get('X-Forwarded-For')
+        if forwarded:
+            last_hop = forwarded.split(',')[-1].strip()
+            if last_hop:
+                return last_hop
+        return st.context.ip_address
+    except Exception:
+        return None
 
 def validate_email(email: str) -> bool:
     """Valida formato do email"""
@@ -109,24 +173,32 @@ def validate_email_domain(email: str) -> Tuple[bool, str]:
         return False, ""
 
 def email_exists_firebase(email: str) -> bool:
-    """Verifica se email já está cadastrado no Firebase"""
+    """
+    Verifica se email já está cadastrado no Firebase. Consulta o índice em memória e,
+    se não achar, o Firestore (cadastro feito por outra instância ainda não recarregada).
+    """
     if not is_firebase_connected():
         return False
     
     try:
-        db = get_firestore_db()
-        users_ref = db.collection('users')
-        query = users_ref.where('email', '==', email.lower().strip()).limit(1)
-        docs = query.get()
-        return len(docs) > 0
+        directory = get_user_directory()
+        if directory.email_exists(email):
+            return True
+        normalized = email.lower().strip()
+        docs = get_firestore_db().collection('users').where('email', '==', normalized).limit(1).get()
+        for doc in docs:
+            user_data = doc.to_dict()
+            user_data['id'] = doc.id
+            directory.upsert(user_data)
+            return True
+        return False
     except Exception as e:
         st.error(f"Erro ao verificar email no Firebase: {e}")
         return False
 
 def email_exists_local(email: str) -> bool:
     """Verifica se email já está cadastrado no banco local"""
-    users = load_users_local()
-    return any(user["email"].lower() == email.lower() for user in users)
+    return get_user_directory().email_exists(email)
 
 def email_exists(email: str) -> bool:
     """Verifica se email já está cadastrado (Firebase ou local)"""
@@ -170,6 +242,7 @@ def register_user_firebase(name: str, email: str, password: str, user_type: str,
             user_data['turma'] = turma
         
         users_ref.document(auth_uid).set(user_data)
+        get_user_directory().upsert({**user_data, 'id': auth_uid})
         
         return True, f"Cadastro realizado com sucesso! Você já pode fazer login."
         
@@ -204,9 +277,11 @@ def register_user_local(name: str, email: str, password: str, user_type: str, ra
     users = load_users_local()
     users.append(new_user)
     save_users_local(users)
+    get_user_directory().upsert(new_user)
     
     return True, "Usuário cadastrado com sucesso localmente!"
 
+@profiled("auth")
 def register_user(name: str, email: str, password: str, user_type: str, ra: str = None, turma: str = None) -> Tuple[bool, str]:
     """Registra um novo usuário (Firebase ou local) com validação de domínio"""
     # Validação de nome completo
@@ -257,34 +332,53 @@ def authenticate_user_firebase(email: str, password: str) -> Tuple[bool, str, Op
         from firebase_config import get_firebase_user_by_email
         
         db = get_firestore_db()
-        
-        # Busca usuário no Firebase Auth
-        auth_user = get_firebase_user_by_email(email.lower().strip())
-        
-        if not auth_user:
-            return False, "Email ou senha incorretos", None
-        
-        # Busca dados do usuário no Firestore
-        user_doc = db.collection('users').document(auth_user.uid).get()
-        
-        if not user_doc.exists:
-            return False, "Usuário não encontrado no sistema", None
-        
-        user_data = user_doc.to_dict()
+        directory = get_user_directory()
+        
+        # O documento do usuário tem o mesmo id do Firebase Auth: o índice por email
+        # evita a chamada ao Auth. O documento é sempre relido para conferir o hash e o
+        # tipo atuais (podem ter mudado em outra instância do servidor)
+        user_data = None
+        cached = directory.get_by_email(email)
+        if cached is not None:
+            user_doc = db.collection('users').document(cached['id']).get()
+            if user_doc.exists:
+                user_data = user_doc.to_dict()
+                user_data['id'] = user_doc.id
+                directory.upsert(user_data)
+            else:
+                directory.remove(cached['id'])
+        if user_data is None:
+            # Busca usuário no Firebase Auth
+            auth_user = get_firebase_user_by_email(email.lower().strip())
+            
+            if not auth_user:
+                return False, "Email ou senha incorretos", None
+            
+            # Busca dados do usuário no Firestore
+            user_doc = db.collection('users').document(auth_user.uid).get()
+            
+            if not user_doc.exists:
+                return False, "Usuário não encontrado no sistema", None
+            
+            user_data = user_doc.to_dict()
+            user_data['id'] = auth_user.uid
+            directory.upsert(user_data)
         
         # O Firebase Auth sem API Key no client side ou REST não permite verificar senha.
         # Por isso verificamos o hash salvo no Firestore (foi salvo no registro)
-        stored_hash = user_data.get('password')
-        if not stored_hash or stored_hash != hash_password(password):
-            return False, "Email ou senha incorretos", None
-        
-        # Atualiza último login
-        user_doc.reference.update({
-            'last_login': datetime.now()
-        })
-        
-        # Adiciona ID do documento
-        user_data['id'] = auth_user.uid
+        ok, new_hash, error = get_password_verifier().check(
+            password, user_data.get('password'), email, _client_ip()
+        )
+        if not ok:
+            return False, error, None
+        
+        # Atualiza último login (e migra hash legado para scrypt)
+        updates = {'last_login': datetime.now()}
+        if new_hash:
+            updates['password'] = new_hash
+        db.collection('users').document(user_data['id']).update(updates)
+        directory.update(user_data['id'], updates)
+        user_data.update(updates)
         
         return True, "Login realizado com sucesso!", user_data
         
@@ -293,18 +387,29 @@ def authenticate_user_firebase(email: str, password: str) -> Tuple[bool, str, Op
 
 def authenticate_user_local(email: str, password: str) -> Tuple[bool, str, Optional[Dict]]:
     """Autentica usuário no banco local"""
+    directory = get_user_directory()
+    user = directory.get_by_email(email)
+    if user is None:
+        return False, "Email ou senha incorretos", None
+    ok, new_hash, error = get_password_verifier().check(password, user["password"], email, _client_ip())
+    if not ok:
+        return False, error, None
+    
+    # Atualiza último login (e migra hash legado para scrypt)
+    updates = {"last_login": datetime.now().isoformat()}
+    if new_hash:
+        updates["password"] = new_hash
     users = load_users_local()
-    hashed_password = hash_password(password)
-    
-    for user in users:
-        if user["email"].lower() == email.lower() and user["password"] == hashed_password:
-            # Atualiza último login
-            user["last_login"] = datetime.now().isoformat()
+    for stored in users:
+        if stored["id"] == user["id"]:
+            stored.update(updates)
             save_users_local(users)
-            return True, "Login realizado com sucesso!", user
-    
-    return False, "Email ou senha incorretos", None
+            directory.update(user["id"], updates)
+            break
+    user.update(updates)
+    return True, "Login realizado com sucesso!", user
 
+@profiled("auth")
 def authenticate_user(email: str, password: str) -> Tuple[bool, str, Optional[Dict]]:
     """Autentica um usuário (Firebase ou local)"""
     if not email.strip() or not password.strip():
@@ -316,14 +421,20 @@ def authenticate_user(email: str, password: str) -> Tuple[bool, str, Optional[Di
         return authenticate_user_local(email, password)
 
 def get_user_by_id_firebase(user_id: str) -> Optional[Dict]:
-    """Busca usuário por ID no Firebase"""
+    """Busca usuário por ID (índice em memória; lê o Firestore só se não estiver indexado)"""
     try:
+        directory = get_user_directory()
+        user_data = directory.get_by_id(user_id)
+        if user_data is not None:
+            return user_data
+        
         db = get_firestore_db()
         user_doc = db.collection('users').document(user_id).get()
         
         if user_doc.exists:
             user_data = user_doc.to_dict()
             user_data['id'] = user_doc.id
+            directory.upsert(user_data)
             return user_data
         return None
     except Exception:
@@ -331,12 +442,9 @@ def get_user_by_id_firebase(user_id: str) -> Optional[Dict]:
 
 def get_user_by_id_local(user_id: int) -> Optional[Dict]:
     """Busca usuário por ID no banco local"""
-    users = load_users_local()
-    for user in users:
-        if user["id"] == user_id:
-            return user
-    return None
+    return get_user_directory().get_by_id(user_id)
 
+@profiled("auth")
 def get_user_by_id(user_id) -> Optional[Dict]:
     """Busca usuário por ID (Firebase ou local)"""
     if is_firebase_connected():
@@ -344,33 +452,64 @@ def get_user_by_id(user_id) -> Optional[Dict]:
     else:
         return get_user_by_id_local(int(user_id))
 
-@st.cache_data(ttl=300, show_spinner=False)
+def load_all_users_firebase() -> List[Dict]:
+    """Lê a coleção de usuários inteira do Firebase (carga do diretório em memória)"""
+    db = get_firestore_db()
+    users_ref = db.collection('users')
+    docs = users_ref.get()
+    
+    users = []
+    for doc in docs:
+        user_data = doc.to_dict()
+        user_data['id'] = doc.id
+        users.append(user_data)
+    
+    return users
+
+@profiled("auth")
+def restore_session(token: str) -> bool:
+    """
+    Restaura o login a partir do cookie `auth_token`, uma vez por sessão e token.
+    O token só fornece o id: os dados do usuário (inclusive o tipo) vêm sempre do
+    diretório de usuários ou do banco, então remoções e mudanças de papel valem na hora.
+    Quando há leitura do documento, ela também traz o progresso salvo (evita a
+    segunda leitura em load_student_progress).
+    """
+    if st.session_state.get('restored_token') == token:
+        return False
+    st.session_state.restored_token = token
+    
+    claims = decode_auth_token(token)
+    if not claims:
+        return False
+    
+    u_data = get_user_by_id(claims['id'])
+    if not u_data:
+        return False
+    if 'progress' in u_data:
+        st.session_state.prefetched_progress = u_data['progress']
+    
+    login_user(u_data)
+    return True
+
 def get_all_users_firebase() -> List[Dict]:
     """Retorna todos os usuários do Firebase"""
-    try:
-        db = get_firestore_db()
-        users_ref = db.collection('users')
-        docs = users_ref.get()
-        
-        users = []
-        for doc in docs:
-            user_data = doc.to_dict()
-            user_data['id'] = doc.id
-            users.append(user_data)
-        
-        return users
-    except Exception as e:
-        st.error(f"Erro ao buscar usuários no Firebase: {e}")
-        return []
+    return get_user_directory().all_users()
 
-@st.cache_data(ttl=300, show_spinner=False)
 def get_all_users_local() -> List[Dict]:
     """Retorna todos os usuários do banco local"""
-    return load_users_local()
+    return get_user_directory().all_users()
 
-@st.cache_data(ttl=300, show_spinner=False)
+@profiled("auth")
 def get_all_users() -> List[Dict]:
-    """Retorna lista de todos os usuários (Firebase ou local)"""
+    """Retorna lista de todos os usuários (espelho em tempo real, Firebase ou local)"""
+    try:
+        from analytics_mirror import get_active_mirror
+        mirror = get_active_mirror()
+        if mirror is not None:
+            return mirror.get_all_users()
+    except Exception as e:
+        print(f"Aviso: espelho de usuários indisponível: {e}")
     if is_firebase_connected():
         return get_all_users_firebase()
     else:
@@ -385,6 +524,7 @@ def delete_user_firebase(user_id: str) -> Tuple[bool, str]:
         
         # Remove do Firestore
         db.collection('users').document(user_id).delete()
+        get_user_directory().remove(user_id)
         
         # Remove do Firebase Authentication
         auth_deleted = delete_firebase_auth_user(user_id)
@@ -404,6 +544,7 @@ def delete_user_local(user_id: int) -> Tuple[bool, str]:
     users = load_users_local()
     users = [user for user in users if user["id"] != user_id]
     save_users_local(users)
+    get_user_directory().remove(user_id)
     import streamlit as st
     st.cache_data.clear()
     return True, "Usuário removido com sucesso!"
@@ -429,6 +570,7 @@ def update_user_profile_firebase(user_id: str, name: str = None, email: str = No
         
         if update_data:
             user_ref.update(update_data)
+            get_user_directory().update(user_id, update_data)
         
         return True, "Perfil atualizado com sucesso!"
     except Exception as e:
@@ -453,6 +595,7 @@ def update_user_profile_local(user_id: int, name: str = None, email: str = None)
         users[user_index]["email"] = email.lower().strip()
     
     save_users_local(users)
+    get_user_directory().upsert(users[user_index])
     return True, "Perfil atualizado com sucesso!"
 
 def update_user_profile(user_id, name: str = None, email: str = None) -> Tuple[bool, str]:
@@ -473,13 +616,15 @@ def change_password_firebase(user_id: str, current_password: str, new_password:
         
         user_data = user_doc.to_dict()
         
-        if user_data['password'] != hash_password(current_password):
+        if not verify_password(current_password, user_data['password']):
             return False, "Senha atual incorreta"
         
         if len(new_password) < 6:
             return False, "Nova senha deve ter pelo menos 6 caracteres"
         
-        user_doc.reference.update({'password': hash_password(new_password)})
+        new_hash = hash_password(new_password)
+        user_doc.reference.update({'password': new_hash})
+        get_user_directory().update(user_id, {'password': new_hash})
         return True, "Senha alterada com sucesso!"
         
     except Exception as e:
@@ -498,7 +643,7 @@ def change_password_local(user_id: int, current_password: str, new_password: str
     if user_index is None:
         return False, "Usuário não encontrado"
     
-    if users[user_index]["password"] != hash_password(current_password):
+    if not verify_password(current_password, users[user_index]["password"]):
         return False, "Senha atual incorreta"
     
     if len(new_password) < 6:
@@ -506,6 +651,7 @@ def change_password_local(user_id: int, current_password: str, new_password: str
     
     users[user_index]["password"] = hash_password(new_password)
     save_users_local(users)
+    get_user_directory().upsert(users[user_index])
     
     return True, "Senha alterada com sucesso!"
 
@@ -550,7 +696,7 @@ def logout_user():
     keys_to_clear = [
         "score", "streak", "unlocked_level", "current_case_id", "case_scored",
         "last_result", "chat", "show_next_case_btn", "used_cases",
-        "current_timer_id", "case_counter", "progress_loaded"
+        "current_timer_id", "case_counter", "progress_loaded", "prefetched_progress"
     ]
     for key in keys_to_clear:
         if key in st.session_state:
@@ -618,20 +764,16 @@ def migrate_local_to_firebase():
     except Exception as e:
         return False, f"Erro na migração: {e}"
 
+@profiled("auth")
 def create_default_admin():
     """Cria o administrador padrão se não existir"""
     try:
-        # Verifica se já existe um admin
-        if is_firebase_connected():
-            db = get_firestore_db()
-            admin_query = db.collection('users').where('user_type', '==', 'admin').limit(1).get()
-            if admin_query:
-                return True, "Administrador já existe"
-        else:
-            # Verifica localmente também
-            users = load_users_local()
-            if any(user.get('user_type') == 'admin' for user in users):
-                return True, "Administrador já existe"
+        # Verifica se já existe um admin (índice em memória, sem consulta ao Firestore)
+        directory = get_user_directory()
+        if not directory.is_loaded():
+            return False, "Diretório de usuários indisponível; verificação do administrador adiada"
+        if directory.ids_by_type('admin'):
+            return True, "Administrador já existe"
         
         # Cria o admin padrão
         admin_data = {
@@ -646,7 +788,8 @@ def create_default_admin():
         if is_firebase_connected():
             db = get_firestore_db()
             users_ref = db.collection('users')
-            doc_ref = users_ref.add(admin_data)
+            _, doc_ref = users_ref.add(admin_data)
+            directory.upsert({**admin_data, 'id': doc_ref.id})
             return True, f"Administrador criado! Login: admin@biotutor.com | Senha: admin123"
         else:
             # Salva localmente se Firebase não estiver conectado
@@ -654,7 +797,26 @@ def create_default_admin():
             admin_data['id'] = len(users) + 1
             users.append(admin_data)
             save_users_local(users)
+            directory.upsert(admin_data)
             return True, f"Administrador criado localmente! Login: admin@biotutor.com | Senha: admin123"
             
     except Exception as e:
         return False, f"Erro ao criar administrador: {e}"
+
+@st.cache_resource(show_spinner=False)
+def _bootstrap_process() -> Tuple[bool, str]:
+    """Tarefas de inicialização executadas uma única vez por processo do servidor"""
+    success, message = create_default_admin()
+    print(f"BOOTSTRAP: {message}")
+    return success, message
+
+@profiled("auth")
+def bootstrap_app():
+    """
+    Chamado no início de cada rerun: só o primeiro custa algo, os demais leem o
+    resultado guardado. Em caso de falha o resultado é descartado e o próximo
+    rerun tenta de novo.
+    """
+    success, _ = _bootstrap_process()
+    if not success:
+        _bootstrap_process.clear()
@@ -0,0 +1,279 @@
+"""
+Benchmark das agregações de analytics com dados sintéticos (backend local).
+
+Para cada tamanho de turma gera users.json/analytics.json num diretório
+temporário (CLINTUTOR_DATA_BACKEND=local, sem Firebase) e mede tempo e pico de
+memória (tracemalloc) de:
+
+- calculate_accuracy_rate (todos os alunos)
+- get_global_stats
+- get_global_knowledge_component_stats
+- get_student_complete_profile (um aluno)
+- agregação do painel do professor (get_all_case_events + get_chat_message_counts
+  + aggregate_class_dashboard)
+- histogramas de distratores (carga do DistractorStats + distrator mais escolhido por tópico)
+
+Os resultados são comparados com benchmarks/baselines.json; o script sai com
+código 1 se algum caso ficar acima da tolerância.
+
+Com CLINTUTOR_DATA_BACKEND=memory (ou emulator) os dados são gravados em batches
+nos shards simulados, roteados por get_db_for_user, e as mesmas funções rodam
+pelos caminhos do Firestore (consultas por shard, projeções, fan-out).
+
+Uso:
+    python benchmarks/bench_analytics.py                     # 100 e 1000 alunos
+    CLINTUTOR_DATA_BACKEND=memory CLINTUTOR_MEMORY_LATENCY_MS=20 python benchmarks/bench_analytics.py
+    python benchmarks/bench_analytics.py --sizes 100 1000 10000     # 10k: só os casos lineares
+    python benchmarks/bench_analytics.py --update-baseline   # grava nova referência
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault('CLINTUTOR_DATA_BACKEND', 'local')
+BACKEND = os.environ['CLINTUTOR_DATA_BACKEND']
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import streamlit as st  # noqa: E402
+from streamlit.logger import set_log_level  # noqa: E402
+
+import analytics  # noqa: E402
+import auth_firebase  # noqa: E402
+from firebase_config import get_all_dbs, get_db_for_user, get_firestore_db  # noqa: E402
+from distractor_stats import DistractorStats  # noqa: E402
+from professor_dashboard import aggregate_class_dashboard  # noqa: E402
+from user_directory import _get_directory  # noqa: E402
+from synthetic_data import generate_dataset  # noqa: E402
+
+# Fora do `streamlit run` os st.warning/st.cache só geram avisos de contexto
+# (depois dos imports: a leitura da configuração redefine o nível)
+set_log_level("error")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_SIZES = [100, 1000]
+TIME_TOLERANCE = 1.5      # até 50% mais lento que a referência
+MEMORY_TOLERANCE = 1.25   # até 25% mais memória que a referência
+# get_global_stats relê o analytics.json uma vez por aluno no backend local
+# (custo quadrático: ~8s com 100 alunos, ~15 min com 1000), então por padrão
+# ele e o perfil completo (que o chama) só rodam até este tamanho
+QUADRATIC_LIMIT = 100
+# Diferenças abaixo disso são ruído de medição e não contam como regressão
+MIN_TIME_DELTA_S = 0.05
+MIN_MEMORY_DELTA_MB = 1.0
+
+
+def _dashboard_aggregation():
+    return aggregate_class_dashboard(analytics.get_all_case_events(), analytics.get_chat_message_counts())
+
+
+def _distractor_histograms():
+    # Instância nova a cada medição: inclui a carga dos histogramas, não só a consulta
+    return DistractorStats(analytics.get_all_case_events).most_chosen_distractor_by_topic()
+
+
+def _accuracy_for_all(grouped: Dict[int, List[Dict]]):
+    return [analytics.calculate_accuracy_rate(cases) for cases in grouped.values()]
+
+
+# (nome, função, maior turma em que roda por padrão)
+def build_cases(grouped: Dict[int, List[Dict]], sample_user: int):
+    return [
+        ("calculate_accuracy_rate", lambda: _accuracy_for_all(grouped), None),
+        ("get_global_stats", analytics.get_global_stats, QUADRATIC_LIMIT),
+        ("get_global_knowledge_component_stats", analytics.get_global_knowledge_component_stats, None),
+        ("get_student_complete_profile", lambda: analytics.get_student_complete_profile(sample_user), QUADRATIC_LIMIT),
+        ("dashboard_aggregation", _dashboard_aggregation, None),
+        ("distractor_histograms", _distractor_histograms, None),
+    ]
+
+
+def reset_caches():
+    """Descarta caches entre medições para cada execução partir do disco."""
+    st.cache_data.clear()
+    _get_directory.clear()
+    gc.collect()
+
+
+class BatchWriter:
+    """Acumula escritas por shard e faz commit a cada 500 (limite do Firestore)."""
+
+    def __init__(self):
+        self._batches = {}   # id(db) -> (batch, operações pendentes)
+
+    def _add(self, db, op: str, *args):
+        batch, n = self._batches.get(id(db), (None, 0))
+        if batch is None:
+            batch = db.batch()
+        getattr(batch, op)(*args)
+        n += 1
+        if n == 500:
+            batch.commit()
+            batch, n = None, 0
+        self._batches[id(db)] = (batch, n)
+
+    def set(self, db, ref, data: Dict):
+        self._add(db, 'set', ref, data)
+
+    def delete(self, db, ref):
+        self._add(db, 'delete', ref)
+
+    def flush(self):
+        for batch, n in self._batches.values():
+            if batch is not None and n:
+                batch.commit()
+        self._batches = {}
+
+
+def clear_firestore():
+    writer = BatchWriter()
+    for db in get_all_dbs():
+        for name in ('users', 'case_analytics', 'chat_interactions'):
+            for doc in db.collection(name).select([]).get():
+                writer.delete(db, doc.reference)
+    writer.flush()
+
+
+def write_firestore(users: List[Dict], events: List[Dict]):
+    """Usuários no primário; eventos no shard de cada aluno (mesmo roteamento do app)."""
+    clear_firestore()
+    writer = BatchWriter()
+    primary = get_firestore_db()
+    for user in users:
+        data = {k: v for k, v in user.items() if k != 'id'}
+        writer.set(primary, primary.collection('users').document(user['id']), data)
+    for event in events:
+        db = get_db_for_user(event['user_id'])
+        if event.get('type') == 'chat_interaction':
+            data = {k: v for k, v in event.items() if k != 'type'}
+            writer.set(db, db.collection('chat_interactions').document(), data)
+        else:
+            writer.set(db, db.collection('case_analytics').document(), event)
+    writer.flush()
+
+
+def install_dataset(data_dir: str, n_students: int, seed: int):
+    users, events = generate_dataset(n_students, seed, string_ids=BACKEND != 'local')
+    analytics.ANALYTICS_DB_PATH = os.path.join(data_dir, "analytics.json")
+    auth_firebase.USERS_DB_PATH = os.path.join(data_dir, "users.json")
+    if BACKEND == 'local':
+        analytics.save_analytics_local(events)
+        auth_firebase.save_users_local(users)
+    else:
+        write_firestore(users, events)
+    grouped: Dict[int, List[Dict]] = {}
+    for e in events:
+        if e.get("type") != "chat_interaction":
+            grouped.setdefault(e["user_id"], []).append(e)
+    return users, events, grouped
+
+
+def measure(fn: Callable, repeat: int) -> Dict[str, float]:
+    """Melhor tempo em `repeat` execuções e pico de memória numa execução à parte."""
+    best = float("inf")
+    for _ in range(repeat):
+        reset_caches()
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+
+    reset_caches()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(best, 4), "peak_mb": round(peak / 2 ** 20, 2)}
+
+
+def run(sizes: List[int], repeat: int, seed: int, no_limits: bool) -> Dict[str, Dict]:
+    results: Dict[str, Dict] = {}
+    for n in sizes:
+        with tempfile.TemporaryDirectory(prefix="clintutor-bench-") as data_dir:
+            started = time.perf_counter()
+            users, events, grouped = install_dataset(data_dir, n, seed)
+            if BACKEND == 'local':
+                size_mb = os.path.getsize(analytics.ANALYTICS_DB_PATH) / 2 ** 20
+                print(f"\n== {n} alunos: {len(events)} documentos, analytics.json {size_mb:.1f} MB ==")
+            else:
+                print(f"\n== {n} alunos: {len(events)} documentos gravados em "
+                      f"{len(get_all_dbs())} shards ({BACKEND}) em {time.perf_counter() - started:.1f}s ==")
+            for name, fn, limit in build_cases(grouped, users[0]["id"]):
+                key = f"{name}@{n}" if BACKEND == 'local' else f"{name}@{n}[{BACKEND}]"
+                if limit is not None and n > limit and not no_limits:
+                    print(f"  {name:<40} pulado (> {limit} alunos, use --no-limits)")
+                    continue
+                results[key] = measure(fn, repeat)
+                print(f"  {name:<40} {results[key]['seconds']:>9.4f}s  {results[key]['peak_mb']:>9.2f} MB")
+        reset_caches()
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> List[str]:
+    regressions = []
+    for key, current in results.items():
+        ref = baseline.get(key)
+        if not ref:
+            continue
+        if (current["seconds"] > ref["seconds"] * TIME_TOLERANCE
+                and current["seconds"] - ref["seconds"] > MIN_TIME_DELTA_S):
+            regressions.append(f"{key}: tempo {ref['seconds']:.4f}s -> {current['seconds']:.4f}s")
+        if (current["peak_mb"] > ref["peak_mb"] * MEMORY_TOLERANCE
+                and current["peak_mb"] - ref["peak_mb"] > MIN_MEMORY_DELTA_MB):
+            regressions.append(f"{key}: memória {ref['peak_mb']:.2f} MB -> {current['peak_mb']:.2f} MB")
+    return regressions
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Dict]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(path: str, results: Dict[str, Dict], merge_with: Optional[Dict[str, Dict]]):
+    merged = dict(merge_with or {})
+    merged.update(results)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"python": sys.version.split()[0], "results": dict(sorted(merged.items()))},
+                  f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark das agregações de analytics.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Tamanhos de turma")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por caso (usa o melhor tempo)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Grava os resultados como referência")
+    parser.add_argument("--no-limits", action="store_true", help="Roda também os casos quadráticos em turmas grandes")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.seed, args.no_limits)
+    baseline = load_baseline(args.baseline)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results, baseline)
+        print(f"\nReferência gravada em {args.baseline}")
+        sys.exit(0)
+
+    if baseline is None:
+        print(f"\nSem referência em {args.baseline}; rode com --update-baseline para criar.")
+        sys.exit(0)
+
+    regressions = compare(results, baseline)
+    if regressions:
+        print("\nRegressões em relação à referência:")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("\nSem regressões em relação à referência.")
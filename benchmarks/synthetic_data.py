@@ -0,0 +1,112 @@
+"""
+Gerador de dados sintéticos na escala de um semestre para os benchmarks.
+
+Produz usuários (formato do users.json local), eventos de caso (case_analytics,
+com o case_result real de evaluate_mcq_answer) e documentos de chat agrupados
+(type='chat_interaction', como grava flush_chat_buffer). Mesma semente, mesmos dados.
+"""
+
+import os
+import sys
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+# Semestre de ~18 semanas terminando "agora" (parte dos eventos cai nas últimas 24h)
+SEMESTER_DAYS = 126
+CASES_PER_STUDENT = (8, 24)
+CHAT_SESSION_PROB = 0.35
+MESSAGES_PER_SESSION = (1, 6)
+PROFESSORS = 3
+TURMAS = ["Turma A", "Turma B", "Turma C", "Turma D"]
+
+
+def make_users(n_students: int, rng: random.Random, string_ids: bool = False) -> List[Dict]:
+    """
+    Alunos e alguns professores. Ids inteiros como em register_user_local, ou
+    strings (como os uids do Firebase Auth) para os backends Firestore.
+    """
+    users = []
+    for i in range(n_students + PROFESSORS):
+        is_student = i < n_students
+        user = {
+            "id": f"bench{i + 1:06d}" if string_ids else i + 1,
+            "name": f"Aluno Sintetico {i + 1}" if is_student else f"Professor Sintetico {i + 1}",
+            "email": f"bench{i + 1}@santacasasp.edu.br",
+            "password": "",
+            "user_type": "aluno" if is_student else "professor",
+            "created_at": datetime.now().isoformat(),
+            "last_login": None,
+        }
+        if is_student:
+            user["ra"] = f"{100000 + i}"
+            user["turma"] = rng.choice(TURMAS)
+        users.append(user)
+    return users
+
+
+def make_case_event(user_id, question: Dict, when: datetime, rng: random.Random, skill: float) -> Dict:
+    from logic import evaluate_mcq_answer
+    if rng.random() < skill:
+        option = question["gabarito"]
+    else:
+        option = rng.choice([o for o in "ABCD" if o != question["gabarito"]])
+    duration = max(5.0, rng.lognormvariate(4.0, 0.6))
+    start = when - timedelta(seconds=duration)
+    return {
+        "user_id": user_id,
+        "case_id": question["id"],
+        "start_time": start.isoformat(),
+        "end_time": when.isoformat(),
+        "duration_seconds": duration,
+        "duration_formatted": f"{duration:.1f}s",
+        "case_result": evaluate_mcq_answer(question, option),
+        "timestamp": when.isoformat(),
+        "ts": when.timestamp(),
+    }
+
+
+def make_chat_document(user_id, case_id: str, when: datetime, rng: random.Random) -> Dict:
+    messages = []
+    for k in range(rng.randint(*MESSAGES_PER_SESSION)):
+        at = when + timedelta(seconds=20 * k)
+        messages.append({
+            "user_message": "Não entendi por que essa alternativa está errada.",
+            "bot_response": "Pense no gradiente de concentração e no tipo de transporte envolvido. " * 3,
+            "response_time_seconds": round(rng.uniform(0.8, 4.0), 2),
+            "timestamp": at.isoformat(),
+            "ts": at.timestamp(),
+        })
+    return {
+        "user_id": user_id,
+        "case_id": case_id,
+        "messages": messages,
+        "message_count": len(messages),
+        "timestamp": when.isoformat(),
+        "ts": when.timestamp(),
+        "type": "chat_interaction",
+    }
+
+
+def generate_dataset(n_students: int, seed: int = 42, string_ids: bool = False) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Retorna (usuários, analytics) no formato dos arquivos locais
+    (users.json e analytics.json).
+    """
+    from logic import QUESTIONS
+    rng = random.Random(seed)
+    users = make_users(n_students, rng, string_ids)
+    now = datetime.now()
+    analytics = []
+    for user in users[:n_students]:
+        skill = rng.uniform(0.3, 0.9)
+        n_cases = rng.randint(*CASES_PER_STUDENT)
+        for question in rng.sample(QUESTIONS, min(n_cases, len(QUESTIONS))):
+            when = now - timedelta(seconds=rng.uniform(0, SEMESTER_DAYS * 86400))
+            if rng.random() < CHAT_SESSION_PROB:
+                analytics.append(make_chat_document(user["id"], question["id"], when - timedelta(minutes=2), rng))
+            analytics.append(make_case_event(user["id"], question, when, rng, skill))
+    return users, analytics
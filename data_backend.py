@@ -0,0 +1,96 @@
+"""
+Backend de dados usado pelo DualFirebaseManager.
+
+- "firebase" (padrão): projetos reais, com as credenciais de st.secrets
+- "local": sem Firestore; tudo cai no fallback em ~/.clintutor/*.json
+- "memory": Firestore e Auth em memória no próprio processo (firestore_memory.py),
+  com N shards independentes — roteamento, batches e leituras em fan-out rodam
+  sem rede e sem credenciais
+- "emulator": emulador local do Firestore (`firebase emulators:start --only firestore,auth`),
+  um projectId por shard
+
+Seleção por variável de ambiente ou `.streamlit/secrets.toml`:
+
+    CLINTUTOR_DATA_BACKEND=memory
+    CLINTUTOR_DATA_SHARDS=2
+    CLINTUTOR_MEMORY_LATENCY_MS=30
+    FIRESTORE_EMULATOR_HOST=127.0.0.1:8080
+
+    [data_backend]
+    backend = "emulator"
+    shards = 2
+    emulator_host = "127.0.0.1:8080"
+    project_id = "clintutor-dev"
+"""
+
+import os
+import streamlit as st
+from typing import Dict, List
+
+BACKENDS = ('firebase', 'local', 'memory', 'emulator')
+SIMULATED_BACKENDS = ('memory', 'emulator')
+DEFAULT_SHARDS = 2
+DEFAULT_EMULATOR_HOST = "127.0.0.1:8080"
+DEFAULT_EMULATOR_PROJECT = "clintutor-dev"
+
+
+def get_data_backend_settings() -> Dict:
+    """{'backend', 'shards', 'latency_ms', 'emulator_host', 'project_id'}"""
+    conf = {}
+    try:
+        if 'data_backend' in st.secrets:
+            conf = dict(st.secrets['data_backend'])
+    except Exception:
+        pass
+    backend = (os.environ.get('CLINTUTOR_DATA_BACKEND') or str(conf.get('backend', ''))).strip().lower()
+    if backend not in BACKENDS:
+        if backend:
+            print(f"FIREBASE: backend de dados desconhecido '{backend}', usando firebase")
+        backend = 'firebase'
+    return {
+        'backend': backend,
+        'shards': max(1, int(os.environ.get('CLINTUTOR_DATA_SHARDS') or conf.get('shards', DEFAULT_SHARDS))),
+        'latency_ms': float(os.environ.get('CLINTUTOR_MEMORY_LATENCY_MS') or conf.get('latency_ms', 0)),
+        'emulator_host': (os.environ.get('FIRESTORE_EMULATOR_HOST')
+                          or conf.get('emulator_host') or DEFAULT_EMULATOR_HOST),
+        'project_id': (os.environ.get('CLINTUTOR_EMULATOR_PROJECT')
+                       or conf.get('project_id') or DEFAULT_EMULATOR_PROJECT),
+    }
+
+
+def local_backend_forced() -> bool:
+    """True com backend "local": ignora as credenciais e usa o fallback local."""
+    return get_data_backend_settings()['backend'] == 'local'
+
+
+def shard_project_id(settings: Dict, idx: int) -> str:
+    """projectId do shard no emulador (o emulador separa os dados por projeto)."""
+    return settings['project_id'] if idx == 0 else f"{settings['project_id']}-shard{idx + 1}"
+
+
+def make_simulated_clients(settings: Dict) -> List:
+    """Um cliente Firestore independente por shard, em memória ou no emulador."""
+    if settings['backend'] == 'memory':
+        from firestore_memory import MemoryFirestore
+        return [MemoryFirestore(f"memory-shard-{i + 1}", settings['latency_ms'])
+                for i in range(settings['shards'])]
+
+    # O SDK detecta o emulador pela variável de ambiente e dispensa credenciais
+    os.environ['FIRESTORE_EMULATOR_HOST'] = settings['emulator_host']
+    from google.cloud import firestore as gcloud_firestore
+    return [gcloud_firestore.Client(project=shard_project_id(settings, i))
+            for i in range(settings['shards'])]
+
+
+def make_emulator_auth_app(settings: Dict):
+    """
+    App do firebase_admin apontando para o emulador de Auth, se
+    FIREBASE_AUTH_EMULATOR_HOST estiver definido; senão None (cadastro via Auth indisponível).
+    """
+    if not os.environ.get('FIREBASE_AUTH_EMULATOR_HOST'):
+        return None
+    from firebase_admin import initialize_app, get_app
+    try:
+        return get_app('firebase-primary')
+    except ValueError:
+        return initialize_app(options={'projectId': settings['project_id']}, name='firebase-primary')
@@ -0,0 +1,294 @@
+"""
+Histogramas de alternativas por questão (análise de distratores do painel do professor).
+
+Para cada questão guarda, em arrays numpy, quantas vezes cada alternativa (A-D) foi
+marcada e a soma dos tempos de resposta, separadas pela tentativa do aluno na questão
+(1ª, 2ª, 3ª ou mais). A primeira resposta é o próprio evento de case_analytics; as
+seguintes ("Tentar Novamente") ficam em case_result.retries do mesmo evento (ver
+analytics.record_retry_attempt) e só entram aqui, não nos totais do painel.
+
+Os histogramas são montados uma vez por processo a partir dos eventos compactos
+(CaseEvent), lidos sem o cache de 5 min (load_all_case_events), e depois atualizados
+a cada resposta salva usando os campos selected_option e attempt — a leitura não
+interpreta o texto de user_answer nem percorre os eventos. Respostas salvas durante
+a carga ficam num buffer e entram no fim dela.
+
+Cada aluno também tem suas células somadas à parte (dict esparso), para que o reset
+de um aluno subtraia só as respostas dele (remove_user) sem reler o banco.
+
+Compartilhado entre sessões via `st.cache_resource`, como o índice de respostas.
+Respostas gravadas por outra instância do servidor só entram no próximo reload().
+"""
+
+import threading
+import numpy as np
+import streamlit as st
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+OPTIONS = ("A", "B", "C", "D")
+# Tentativas separadas: 1ª, 2ª e 3ª em diante
+ATTEMPT_BUCKETS = 3
+
+_OPTION_COL = {opt: i for i, opt in enumerate(OPTIONS)}
+
+# (chave, case_id, alternativa, tentativa, segundos); a chave identifica a mesma
+# resposta vinda da carga e de add()/add_retry()
+Observation = Tuple[tuple, str, Optional[str], int, float]
+
+
+def _attempt_bucket(attempt) -> int:
+    try:
+        attempt = int(attempt or 1)
+    except (TypeError, ValueError):
+        attempt = 1
+    return min(max(attempt, 1), ATTEMPT_BUCKETS) - 1
+
+
+def _event_observations(ev) -> List[Observation]:
+    """Respostas de um CaseEvent: a do próprio evento e as tentativas seguintes."""
+    from analytics import option_of
+    base = (ev.user_id, ev.case_id, ev.ts)
+    obs = [(base + (ev.attempt,), ev.case_id, option_of(ev.option), ev.attempt, ev.duration)]
+    for option, attempt, duration in ev.retries or ():
+        obs.append((base + (attempt,), ev.case_id, option_of(option), attempt, duration))
+    return obs
+
+
+def _dict_observations(event: Dict, retries: Iterable[Dict] = None) -> List[Observation]:
+    """Respostas de um evento recém-salvo (dict), pelos campos tipados do case_result."""
+    from analytics import get_event_ts
+    result = event.get('case_result') or {}
+    if not isinstance(result, dict):
+        return []
+    base = (event.get('user_id'), event.get('case_id'), get_event_ts(event))
+    if retries is None:
+        attempt = int(result.get('attempt') or 1)
+        obs = [(base + (attempt,), event.get('case_id'), result.get('selected_option'), attempt,
+                float(event.get('duration_seconds', 0) or 0))]
+        retries = result.get('retries') or ()
+    else:
+        obs = []
+    for r in retries:
+        attempt = int(r.get('attempt') or 2)
+        obs.append((base + (attempt,), event.get('case_id'), r.get('selected_option'), attempt,
+                    float(r.get('duration_seconds', 0) or 0)))
+    return obs
+
+
+class DistractorStats:
+    """
+    counts[q, t, o]: vezes que a alternativa o foi marcada na questão q, na tentativa t
+    seconds[q, t, o]: soma dos tempos de resposta dessas marcações
+    As questões ficam ordenadas por tópico, então cada tópico é uma fatia contínua.
+    """
+
+    def __init__(self, loader: Callable[[], Dict[str, List]], questions: Optional[List[Dict]] = None):
+        if questions is None:
+            from logic import QUESTIONS
+            questions = QUESTIONS
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        # Respostas salvas enquanto a carga roda (None fora da carga) e geração da
+        # carga, incrementada por reload() para descartar uma carga em andamento
+        self._pending: Optional[List[Observation]] = None
+        self._generation = 0
+        # Alunos removidos durante a carga: a leitura pode ter pego respostas já apagadas
+        self._removed_during_load: set = set()
+
+        ordered = sorted(questions, key=lambda q: q.get('topico_id', ''))
+        self._questions = ordered
+        self._row: Dict[str, int] = {q['id']: i for i, q in enumerate(ordered)}
+        self._correct_col = np.array([_OPTION_COL.get(str(q.get('gabarito', '')).upper(), -1) for q in ordered])
+        # tópico -> (início, fim) da fatia de linhas
+        self._topic_slices: Dict[str, tuple] = {}
+        for i, q in enumerate(ordered):
+            tk = q.get('topico_id', '')
+            start, _ = self._topic_slices.get(tk, (i, i))
+            self._topic_slices[tk] = (start, i + 1)
+
+        shape = (len(ordered), ATTEMPT_BUCKETS, len(OPTIONS))
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.seconds = np.zeros(shape, dtype=np.float64)
+        # user_id -> {(q, t, o): [marcações, segundos]}: o que cada aluno somou nos arrays
+        self._by_user: Dict[str, Dict[Tuple[int, int, int], List]] = {}
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def _apply(self, observations: List[Observation]) -> int:
+        """Soma as respostas nos arrays (chamar com _lock). Retorna quantas entraram."""
+        rows, buckets, cols, durations = [], [], [], []
+        for key, case_id, option, attempt, duration in observations:
+            row = self._row.get(case_id)
+            col = _OPTION_COL.get(option)
+            if row is None or col is None:
+                continue
+            bucket = _attempt_bucket(attempt)
+            rows.append(row)
+            buckets.append(bucket)
+            cols.append(col)
+            durations.append(duration)
+            cell = self._by_user.setdefault(key[0], {}).setdefault((row, bucket, col), [0, 0.0])
+            cell[0] += 1
+            cell[1] += duration
+        if rows:
+            index = (np.array(rows), np.array(buckets), np.array(cols))
+            np.add.at(self.counts, index, 1)
+            np.add.at(self.seconds, index, np.array(durations, dtype=np.float64))
+        return len(rows)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                generation = self._generation
+                self._pending = []
+                self._removed_during_load = set()
+            try:
+                # Fora do _lock: add() continua respondendo (e bufferizando) durante a leitura
+                all_events = self._loader()
+            except Exception as e:
+                # Não marca como carregado: a próxima consulta tenta de novo
+                with self._lock:
+                    self._pending = None
+                print(f"DISTRACTORS: erro ao carregar histogramas: {e}")
+                return
+            observations = [o for events in all_events.values() for ev in events for o in _event_observations(ev)]
+            with self._lock:
+                if generation != self._generation:
+                    # reload() durante a carga: a leitura pode ser anterior ao reset
+                    self._pending = None
+                    return
+                removed = self._removed_during_load
+                observations = [o for o in observations if o[0][0] not in removed]
+                loaded_keys = {o[0] for o in observations}
+                observations.extend(o for o in self._pending if o[0] not in loaded_keys)
+                self._pending = None
+                total = self._apply(observations)
+                self._loaded = True
+            print(f"DISTRACTORS: histogramas carregados com {total} respostas em {len(self._row)} questões")
+
+    def is_ready(self) -> bool:
+        return self._loaded
+
+    def reload(self):
+        """Zera os histogramas; a próxima consulta recarrega do banco (ex: após resetar analytics)."""
+        with self._lock:
+            self.counts[:] = 0
+            self.seconds[:] = 0.0
+            self._by_user.clear()
+            self._loaded = False
+            self._generation += 1
+            if self._pending is not None:
+                self._pending = []
+
+    # ------------------------------------------------------------------
+    # Manutenção
+    # ------------------------------------------------------------------
+
+    def _add_observations(self, observations: List[Observation]):
+        with self._lock:
+            if self._loaded:
+                self._apply(observations)
+            elif self._pending is not None:
+                self._pending.extend(observations)
+
+    def add(self, event: Dict):
+        """
+        Incorpora um evento recém-salvo. Durante a carga, guarda no buffer; antes
+        dela não faz nada, porque a carga lê o banco sem cache e já o inclui.
+        """
+        self._add_observations(_dict_observations(event))
+
+    def add_retry(self, event: Dict, retry: Dict):
+        """Incorpora uma tentativa seguinte anexada ao evento (analytics.record_retry_attempt)."""
+        self._add_observations(_dict_observations(event, [retry]))
+
+    def remove_user(self, user_id: str):
+        """Subtrai as respostas de um aluno (reset individual) sem recarregar os histogramas."""
+        with self._lock:
+            for (row, bucket, col), (count, seconds) in self._by_user.pop(user_id, {}).items():
+                self.counts[row, bucket, col] -= count
+                self.seconds[row, bucket, col] -= seconds
+            if self._pending is not None:
+                self._pending = [o for o in self._pending if o[0][0] != user_id]
+                self._removed_during_load.add(user_id)
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def question_histogram(self, question_id: str) -> Dict[str, Dict]:
+        """
+        {alternativa: {'count', 'first_attempt', 'avg_seconds'}} de uma questão
+        (vazio se a questão não existe).
+        """
+        self._ensure_loaded()
+        row = self._row.get(question_id)
+        if row is None:
+            return {}
+        with self._lock:
+            counts = self.counts[row].copy()
+            seconds = self.seconds[row].sum(axis=0)
+        totals = counts.sum(axis=0)
+        avg = np.divide(seconds, totals, out=np.zeros_like(seconds), where=totals > 0)
+        return {
+            opt: {'count': int(totals[i]), 'first_attempt': int(counts[0, i]), 'avg_seconds': float(avg[i])}
+            for i, opt in enumerate(OPTIONS)
+        }
+
+    def most_chosen_distractor_by_topic(self) -> Dict[str, Dict]:
+        """
+        Para cada tópico com erros registrados, a alternativa errada mais marcada
+        entre todas as questões do tópico, com sua participação nos erros do tópico.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            totals = self.counts.sum(axis=1)
+            first = self.counts[:, 0, :].copy()
+            seconds = self.seconds.sum(axis=1)
+        # Zera a coluna do gabarito: sobram só os distratores
+        is_answer = np.arange(len(OPTIONS))[None, :] == self._correct_col[:, None]
+        wrong = np.where(is_answer, 0, totals)
+
+        result = {}
+        for tk, (start, end) in self._topic_slices.items():
+            block = wrong[start:end]
+            topic_wrong = int(block.sum())
+            if topic_wrong == 0:
+                continue
+            r, c = np.unravel_index(int(block.argmax()), block.shape)
+            row = start + r
+            q = self._questions[row]
+            count = int(wrong[row, c])
+            result[tk] = {
+                'topico_id': tk,
+                'topico_nome': q.get('topico_nome', ''),
+                'question_id': q['id'],
+                'codigo': q.get('codigo', ''),
+                'option': OPTIONS[c],
+                'count': count,
+                'first_attempt': int(first[row, c]),
+                'share_of_errors': count / topic_wrong,
+                'topic_errors': topic_wrong,
+                'avg_seconds': float(seconds[row, c]) / count,
+            }
+        return result
+
+
+@st.cache_resource(show_spinner=False)
+def _get_stats(backend: str) -> DistractorStats:
+    """Uma instância por backend ('firebase' ou 'local') e por processo."""
+    from analytics import load_all_case_events
+    return DistractorStats(load_all_case_events)
+
+
+def get_distractor_stats() -> DistractorStats:
+    from firebase_config import is_firebase_connected
+    return _get_stats('firebase' if is_firebase_connected() else 'local')
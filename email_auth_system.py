@@ -4,17 +4,143 @@ Suporta apenas domínios específicos: fcmsantacasasp.edu.br e aluno.fcmsantacas
 """
 
 import streamlit as st
-import smtplib
-import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import random
 import string
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Optional, Tuple
+from contextlib import contextmanager
 import json
 import os
+import hmac
+import time
+import sqlite3
+
+# Validade do código de verificação
+CODE_TTL_SECONDS = 10 * 60
+
+# Banco SQLite dos códigos (compartilhado entre sessões e processos do servidor)
+CODES_DB_PATH = os.path.join(os.path.expanduser("~"), ".clintutor", "verification_codes.db")
+# Arquivo do formato antigo, importado uma única vez se existir
+LEGACY_CODES_PATH = 'verification_codes.json'
+
+class VerificationCodeStore:
+    """
+    Códigos de verificação em SQLite, indexados por email e por expiração.
+    - Cada operação roda numa transação (BEGIN IMMEDIATE): pedidos simultâneos
+      não sobrescrevem o código um do outro nem corrompem o arquivo
+    - A limpeza usa o índice de expires_at: remove só os vencidos, sem varrer a tabela
+    """
+
+    def __init__(self, db_path: str = CODES_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS verification_codes (
+                    email TEXT PRIMARY KEY,
+                    code TEXT NOT NULL,
+                    user_type TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    verified INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_codes_expires_at ON verification_codes (expires_at)")
+        self._import_legacy_file()
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _import_legacy_file(self):
+        """Migra códigos ainda válidos do verification_codes.json antigo"""
+        if not os.path.exists(LEGACY_CODES_PATH):
+            return
+        try:
+            with open(LEGACY_CODES_PATH, 'r') as f:
+                data = json.load(f)
+            with self._transaction() as conn:
+                for email, info in data.items():
+                    created = datetime.fromisoformat(info['timestamp']).timestamp()
+                    conn.execute(
+                        "INSERT OR IGNORE INTO verification_codes VALUES (?, ?, ?, ?, ?, ?)",
+                        (email, info['code'], info['user_type'], created,
+                         created + CODE_TTL_SECONDS, int(info.get('verified', False)))
+                    )
+            os.replace(LEGACY_CODES_PATH, LEGACY_CODES_PATH + '.migrated')
+        except Exception as e:
+            print(f"Aviso: não foi possível importar {LEGACY_CODES_PATH}: {e}")
+
+    @staticmethod
+    def _purge(conn, now: float) -> int:
+        return conn.execute("DELETE FROM verification_codes WHERE expires_at <= ?", (now,)).rowcount
+
+    def issue(self, email: str, code: str, user_type: str, ttl: float = CODE_TTL_SECONDS) -> Tuple[bool, float]:
+        """
+        Grava um código novo se não houver um válido para o email.
+        Retorna (criado, segundos_restantes_do_código_existente).
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._purge(conn, now)
+            row = conn.execute(
+                "SELECT expires_at FROM verification_codes WHERE email = ?", (email,)
+            ).fetchone()
+            if row:
+                return False, row[0] - now
+            conn.execute(
+                "INSERT INTO verification_codes VALUES (?, ?, ?, ?, ?, 0)",
+                (email, code, user_type, now, now + ttl)
+            )
+        return True, 0.0
+
+    def verify(self, email: str, code: str) -> Tuple[str, Optional[str]]:
+        """Retorna (status, user_type) com status em 'missing', 'expired', 'wrong' ou 'ok'"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT code, user_type, expires_at FROM verification_codes WHERE email = ?", (email,)
+            ).fetchone()
+            if not row:
+                return 'missing', None
+            stored_code, user_type, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM verification_codes WHERE email = ?", (email,))
+                return 'expired', None
+            if not hmac.compare_digest(stored_code, code):
+                return 'wrong', None
+            conn.execute("UPDATE verification_codes SET verified = 1 WHERE email = ?", (email,))
+        return 'ok', user_type
+
+    def get_verified_user_type(self, email: str) -> Optional[str]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT user_type FROM verification_codes WHERE email = ? AND verified = 1 AND expires_at > ?",
+                (email, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def purge_expired(self) -> int:
+        with self._transaction() as conn:
+            return self._purge(conn, time.time())
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM verification_codes")
 
 class EmailAuthSystem:
     def __init__(self):
@@ -22,39 +148,8 @@ class EmailAuthSystem:
             'professor': 'fcmsantacasasp.edu.br',
             'aluno': 'aluno.fcmsantacasasp.edu.br'
         }
-        self.verification_codes = {}  # email -> {code, timestamp, user_type}
-        self.load_verification_codes()
+        self.codes = VerificationCodeStore()
         
-    def load_verification_codes(self):
-        """Carrega códigos de verificação salvos"""
-        try:
-            if os.path.exists('verification_codes.json'):
-                with open('verification_codes.json', 'r') as f:
-                    data = json.load(f)
-                    # Converte timestamps de string para datetime
-                    for email, info in data.items():
-                        if 'timestamp' in info:
-                            info['timestamp'] = datetime.fromisoformat(info['timestamp'])
-                    self.verification_codes = data
-        except Exception as e:
-            st.error(f"Erro ao carregar códigos: {e}")
-            self.verification_codes = {}
-    
-    def save_verification_codes(self):
-        """Salva códigos de verificação"""
-        try:
-            # Converte timestamps para string para JSON
-            data_to_save = {}
-            for email, info in self.verification_codes.items():
-                data_to_save[email] = info.copy()
-                if 'timestamp' in data_to_save[email]:
-                    data_to_save[email]['timestamp'] = data_to_save[email]['timestamp'].isoformat()
-            
-            with open('verification_codes.json', 'w') as f:
-                json.dump(data_to_save, f)
-        except Exception as e:
-            st.error(f"Erro ao salvar códigos: {e}")
-    
     def validate_email_domain(self, email: str) -> Tuple[bool, str]:
         """
         Valida se o email pertence aos domínios permitidos
@@ -77,51 +172,13 @@ class EmailAuthSystem:
         return ''.join(random.choices(string.digits, k=6))
     
     def send_verification_email(self, email: str, code: str, user_type: str) -> bool:
-        """Envia código de verificação por email"""
-        try:
-            # Configurações do email
-            smtp_server = "smtp.gmail.com"
-            smtp_port = 587
-            sender_email = st.secrets['email_sender']['email']
-            sender_password = st.secrets['email_sender']['password']
-            
-            # Cria mensagem
-            msg = MIMEMultipart()
-            msg['From'] = sender_email
-            msg['To'] = email
-            msg['Subject'] = "Código de Verificação - ClinTutor"
-            
-            # Corpo do email
-            user_type_pt = "Professor" if user_type == "professor" else "Aluno"
-            body = f"""
-            <html>
-            <body>
-                <h2>🔐 Código de Verificação - ClinTutor</h2>
-                <p>Olá!</p>
-                <p>Você está tentando criar uma conta como <strong>{user_type_pt}</strong> no ClinTutor.</p>
-                <p>Seu código de verificação é:</p>
-                <h1 style="color: #4CAF50; font-size: 32px; text-align: center; background: #f0f0f0; padding: 20px; border-radius: 10px;">{code}</h1>
-                <p><strong>Este código expira em 10 minutos.</strong></p>
-                <p>Se você não solicitou este código, ignore este email.</p>
-                <hr>
-                <p><small>Sistema ClinTutor - Faculdade de Ciências Médicas Santa Casa de São Paulo</small></p>
-            </body>
-            </html>
-            """
-            
-            msg.attach(MIMEText(body, 'html'))
-            
-            # Envia email
-            context = ssl.create_default_context()
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls(context=context)
-                server.login(sender_email, sender_password)
-                server.send_message(msg)
-            
-            return True
-            
-        except Exception as e:
-            st.error(f"Erro ao enviar email: {e}")
+        """
+        Enfileira o código de verificação para envio em segundo plano.
+        Retorna False (e mostra o código na tela) se o SMTP não estiver configurado.
+        """
+        from mail_queue import get_mail_queue, smtp_configured
+        
+        if not smtp_configured():
             # Fallback: mostra código na tela para desenvolvimento
             st.warning("⚠️ Email não enviado - Modo de desenvolvimento")
             st.info(f"**Código de verificação para {email}:**")
@@ -140,7 +197,34 @@ class EmailAuthSystem:
             </div>
             """, unsafe_allow_html=True)
             st.info("💡 Use este código para continuar o cadastro")
-            return True  # Retorna True para permitir continuar
+            return False
+        
+        # Cria mensagem (o remetente é preenchido pela fila)
+        msg = MIMEMultipart()
+        msg['To'] = email
+        msg['Subject'] = "Código de Verificação - ClinTutor"
+        
+        # Corpo do email
+        user_type_pt = "Professor" if user_type == "professor" else "Aluno"
+        body = f"""
+        <html>
+        <body>
+            <h2>🔐 Código de Verificação - ClinTutor</h2>
+            <p>Olá!</p>
+            <p>Você está tentando criar uma conta como <strong>{user_type_pt}</strong> no ClinTutor.</p>
+            <p>Seu código de verificação é:</p>
+            <h1 style="color: #4CAF50; font-size: 32px; text-align: center; background: #f0f0f0; padding: 20px; border-radius: 10px;">{code}</h1>
+            <p><strong>Este código expira em 10 minutos.</strong></p>
+            <p>Se você não solicitou este código, ignore este email.</p>
+            <hr>
+            <p><small>Sistema ClinTutor - Faculdade de Ciências Médicas Santa Casa de São Paulo</small></p>
+        </body>
+        </html>
+        """
+        
+        msg.attach(MIMEText(body, 'html'))
+        get_mail_queue().enqueue(msg)
+        return True
     
     def request_verification_code(self, email: str) -> Tuple[bool, str]:
         """
@@ -152,31 +236,15 @@ class EmailAuthSystem:
         if not is_valid:
             return False, f"❌ Email não permitido! Use apenas emails da Santa Casa:\n• Professores: @{self.allowed_domains['professor']}\n• Alunos: @{self.allowed_domains['aluno']}"
         
-        # Limpa códigos expirados primeiro
-        self.cleanup_expired_codes()
-        
-        # Verifica se já existe código válido (não expirado)
-        if email in self.verification_codes:
-            code_info = self.verification_codes[email]
-            time_diff = datetime.now() - code_info['timestamp']
-            if time_diff < timedelta(minutes=10):
-                remaining_minutes = 10 - int(time_diff.total_seconds() / 60)
-                return False, f"⏰ Código já enviado! Aguarde {remaining_minutes} minutos para solicitar um novo."
-        
-        # Gera novo código
+        # Gera e grava o código atomicamente (já limpa os expirados)
         code = self.generate_verification_code()
+        created, remaining = self.codes.issue(email, code, user_type)
+        if not created:
+            remaining_minutes = max(1, int(remaining // 60) + 1)
+            return False, f"⏰ Código já enviado! Aguarde {remaining_minutes} minutos para solicitar um novo."
         
-        # Salva código
-        self.verification_codes[email] = {
-            'code': code,
-            'timestamp': datetime.now(),
-            'user_type': user_type,
-            'verified': False
-        }
-        
-        # Envia email (sempre retorna True agora com fallback)
+        # Envia email em segundo plano (False = código mostrado na tela)
         email_sent = self.send_verification_email(email, code, user_type)
-        self.save_verification_codes()
         
         if email_sent:
             return True, f"✅ Código enviado para {email}!\nVerifique sua caixa de entrada (e spam)."
@@ -188,54 +256,27 @@ class EmailAuthSystem:
         Verifica código de verificação
         Retorna: (success, message)
         """
-        if email not in self.verification_codes:
+        status, user_type = self.codes.verify(email, code)
+        if status == 'missing':
             return False, "❌ Email não encontrado. Solicite um novo código."
-        
-        code_info = self.verification_codes[email]
-        
-        # Verifica expiração
-        if datetime.now() - code_info['timestamp'] > timedelta(minutes=10):
-            del self.verification_codes[email]
-            self.save_verification_codes()
+        if status == 'expired':
             return False, "⏰ Código expirado! Solicite um novo código."
-        
-        # Verifica código
-        if code_info['code'] != code:
+        if status == 'wrong':
             return False, "❌ Código incorreto! Verifique e tente novamente."
         
-        # Marca como verificado
-        code_info['verified'] = True
-        self.save_verification_codes()
-        
-        return True, f"✅ Email verificado com sucesso! Tipo: {code_info['user_type']}"
+        return True, f"✅ Email verificado com sucesso! Tipo: {user_type}"
     
     def get_verified_user_type(self, email: str) -> Optional[str]:
         """Retorna o tipo de usuário se o email foi verificado"""
-        if email in self.verification_codes:
-            code_info = self.verification_codes[email]
-            if code_info.get('verified', False):
-                return code_info['user_type']
-        return None
+        return self.codes.get_verified_user_type(email)
     
     def cleanup_expired_codes(self):
-        """Remove códigos expirados"""
-        current_time = datetime.now()
-        expired_emails = []
-        
-        for email, code_info in self.verification_codes.items():
-            if current_time - code_info['timestamp'] > timedelta(minutes=10):
-                expired_emails.append(email)
-        
-        for email in expired_emails:
-            del self.verification_codes[email]
-        
-        if expired_emails:
-            self.save_verification_codes()
+        """Remove códigos expirados (consulta pelo índice de expiração)"""
+        self.codes.purge_expired()
     
     def clear_all_codes(self):
         """Limpa todos os códigos (para desenvolvimento)"""
-        self.verification_codes = {}
-        self.save_verification_codes()
+        self.codes.clear()
         return True
 
 # Instância global
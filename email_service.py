@@ -1,10 +1,30 @@
-import smtplib
 import requests
 import streamlit as st
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Tuple, Optional
 
+from mail_queue import get_mail_queue, get_smtp_settings
+
+# Timeout (conexão, leitura) das chamadas à API REST do Firebase
+HTTP_TIMEOUT = (5, 15)
+
+@st.cache_resource(show_spinner=False)
+def get_http_session() -> requests.Session:
+    """
+    Sessão HTTP compartilhada (pool de conexões keep-alive).
+    Só repete falhas de conexão, quando a requisição não chegou ao servidor:
+    accounts:signUp e sendOobCode não são idempotentes (repetir após um 5xx pode
+    voltar EMAIL_EXISTS ou mandar o email de verificação em dobro), então
+    429/5xx vão direto para quem chamou.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5, raise_on_status=False)
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
 def get_firebase_api_key():
     """Obtém a API Key do Firebase dos secrets"""
     try:
@@ -16,12 +36,10 @@ def get_firebase_api_key():
 
 def get_smtp_credentials():
     """Obtém credenciais SMTP dos secrets"""
-    try:
-        if 'email_sender' in st.secrets:
-            return st.secrets['email_sender']['email'], st.secrets['email_sender']['password']
-        return None, None
-    except:
-        return None, None
+    settings = get_smtp_settings()
+    if settings:
+        return settings['sender'], settings.get('password')
+    return None, None
 
 def send_verification_email_firebase_rest(email: str, password: str, display_name: str) -> Tuple[bool, str, Optional[str]]:
     """
@@ -44,7 +62,11 @@ def send_verification_email_firebase_rest(email: str, password: str, display_nam
             "returnSecureToken": True
         }
         
-        response = requests.post(url, json=payload)
+        session = get_http_session()
+        response = session.post(url, json=payload, timeout=HTTP_TIMEOUT)
+        if response.status_code == 429 or response.status_code >= 500:
+            # A conta pode ter sido criada mesmo assim: não repete automaticamente
+            return False, f"Serviço de cadastro indisponível (HTTP {response.status_code}), tente novamente em instantes", None
         data = response.json()
         
         if response.status_code == 200:
@@ -58,7 +80,7 @@ def send_verification_email_firebase_rest(email: str, password: str, display_nam
                 "idToken": id_token
             }
             
-            verify_response = requests.post(verify_url, json=verify_payload)
+            verify_response = session.post(verify_url, json=verify_payload, timeout=HTTP_TIMEOUT)
             
             if verify_response.status_code == 200:
                 return True, "Email de verificação enviado com sucesso!", user_id
@@ -81,13 +103,14 @@ def send_verification_email_firebase_rest(email: str, password: str, display_nam
 
 def send_verification_email_smtp(email: str, verification_link: str, user_name: str) -> Tuple[bool, str]:
     """
-    Envia email de verificação via SMTP do Gmail
+    Enfileira email de verificação para envio via SMTP em segundo plano
     Retorna: (success, message)
     """
-    sender_email, sender_password = get_smtp_credentials()
+    settings = get_smtp_settings()
     
-    if not sender_email or not sender_password:
+    if not settings:
         return False, "Credenciais SMTP não configuradas"
+    sender_email = settings['sender']
     
     try:
         # Cria mensagem
@@ -160,15 +183,13 @@ def send_verification_email_smtp(email: str, verification_link: str, user_name:
         msg.attach(part1)
         msg.attach(part2)
         
-        # Envia email
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
+        # Envia email (fila com conexão reaproveitada, retries e dead-letter)
+        get_mail_queue().enqueue(msg)
         
-        return True, "Email enviado com sucesso via SMTP!"
+        return True, "Email enfileirado para envio via SMTP!"
         
     except Exception as e:
-        return False, f"Erro ao enviar email via SMTP: {str(e)}"
+        return False, f"Erro ao enfileirar email via SMTP: {str(e)}"
 
 def resend_verification_email_rest(email: str) -> Tuple[bool, str]:
     """
@@ -1,9 +1,52 @@
 import os
 import json
+import bisect
 import hashlib
+import time
 import streamlit as st
+from functools import lru_cache
 from firebase_admin import credentials, firestore, auth, initialize_app, get_app
-from typing import Optional
+from typing import Dict, Optional, Tuple
+from firestore_metrics import instrument_client
+from data_backend import (
+    SIMULATED_BACKENDS, get_data_backend_settings, make_simulated_clients, make_emulator_auth_app
+)
+
+# =============================
+# Roteamento por hash
+# =============================
+
+@lru_cache(maxsize=65536)
+def _hash_user(user_id: str) -> int:
+    """md5 do user_id como inteiro (memoizado: o digest não é recalculado a cada chamada)."""
+    return int(hashlib.md5(user_id.encode()).hexdigest(), 16)
+
+
+class HashRing:
+    """
+    Anel de hashing consistente com nós virtuais.
+    Ao adicionar um shard, só ~1/N dos usuários mudam de lugar.
+    """
+
+    def __init__(self, shard_indexes, virtual_nodes: int = 64):
+        points = []
+        for idx in shard_indexes:
+            for v in range(virtual_nodes):
+                points.append((_hash_user(f"shard-{idx}#{v}"), idx))
+        points.sort()
+        self._hashes = [h for h, _ in points]
+        self._shards = [idx for _, idx in points]
+
+    def lookup(self, user_id: str) -> int:
+        pos = bisect.bisect(self._hashes, _hash_user(user_id)) % len(self._hashes)
+        return self._shards[pos]
+
+
+# Com routing_table, a rota de cada usuário vale por este tempo em cada processo e
+# depois é relida de shard_routes; o rebalanceador espera esse prazo após trocar a
+# rota antes de apagar os documentos da origem (ver shard_rebalancer.move_users)
+ROUTE_TTL_SECONDS = 30
+
 
 # =============================
 # Dual Firebase Manager
@@ -11,10 +54,21 @@ from typing import Optional
 
 class DualFirebaseManager:
     """
-    Gerencia dois projetos Firebase em paralelo.
+    Gerencia N projetos Firebase em paralelo (2 por padrão).
     - Autenticação (Firebase Auth) sempre no app primário (índice 0)
-    - Firestore é roteado por hash(user_id) % 2 para distribuir writes
+    - Firestore é roteado por hash(user_id) para distribuir writes
     - Todos os dados de um mesmo usuário ficam sempre no mesmo Firebase
+
+    Shards extras: firebase_credentials_3, firebase_credentials_4, ... em st.secrets.
+    Estratégia em [firebase_sharding]:
+        strategy = "modulo"      # padrão: md5(user_id) % 2 (compatível com o layout original)
+        strategy = "consistent"  # anel de hashing consistente (adicionar shard move só ~1/N)
+        virtual_nodes = 64
+        routing_table = true     # rotas fixas por usuário na coleção shard_routes (primário)
+    Com mais de 2 shards, "consistent" + routing_table são obrigatórios: o app não
+    inicia sem eles (exceto no backend memory, que começa vazio).
+
+    Backend de dados (ver data_backend.py): "firebase", "local", "memory" ou "emulator".
     """
 
     _instance = None
@@ -27,10 +81,21 @@ class DualFirebaseManager:
 
     def __init__(self):
         if not self._initialized:
-            self.dbs = [None, None]   # Dois Firebases
+            self.dbs = [None, None]   # Dois Firebases (+ extras configurados)
             self.apps = [None, None]
-            self._init_primary()
-            self._init_secondary()
+            self.auth = auth
+            settings = get_data_backend_settings()
+            self.backend = settings['backend']
+            if self.backend == 'local':
+                print("FIREBASE: backend local, usando armazenamento local")
+            elif self.backend in SIMULATED_BACKENDS:
+                self._init_simulated(settings)
+            else:
+                self._init_primary()
+                self._init_secondary()
+                self._init_extra_shards()
+            self._instrument_dbs()
+            self._init_routing()
             DualFirebaseManager._initialized = True
 
     # ------------------------------------------------------------------
@@ -117,6 +182,136 @@ class DualFirebaseManager:
                 self.apps[1] = self.apps[0]
                 self.dbs[1] = self.dbs[0]
 
+    def _init_extra_shards(self):
+        """Inicializa shards extras (índice 2 em diante) enquanto houver credenciais."""
+        idx = 2
+        while True:
+            try:
+                cred_dict = self._load_cred_dict(f'firebase_credentials_{idx + 1}')
+            except Exception:
+                cred_dict = None
+            if not cred_dict:
+                break
+            app_name = f'firebase-shard-{idx}'
+            try:
+                try:
+                    app = get_app(app_name)
+                except ValueError:
+                    app = initialize_app(credentials.Certificate(cred_dict), name=app_name)
+                self.apps.append(app)
+                self.dbs.append(firestore.client(app=app))
+            except Exception as e:
+                st.error(f"❌ Erro ao conectar Firebase do shard {idx}: {e}")
+                break
+            idx += 1
+
+    def _init_simulated(self, settings: Dict):
+        """Shards em memória ou no emulador: cada um é um projeto Firestore separado."""
+        try:
+            self.dbs = make_simulated_clients(settings)
+            self.apps = [None] * len(self.dbs)
+            if self.backend == 'memory':
+                from firestore_memory import MemoryAuth
+                self.auth = MemoryAuth()
+            else:
+                self.apps[0] = make_emulator_auth_app(settings)
+            print(f"FIREBASE: backend {self.backend} com {len(self.dbs)} shards simulados")
+        except Exception as e:
+            self.dbs = [None, None]
+            self.apps = [None, None]
+            st.error(f"❌ Erro ao iniciar o backend {self.backend}: {e}")
+
+    def _instrument_dbs(self):
+        """Embrulha os clientes para medir leituras/escritas e latência por shard."""
+        wrapped = {}
+        for idx, db in enumerate(self.dbs):
+            if db is None:
+                continue
+            if id(db) not in wrapped:
+                wrapped[id(db)] = instrument_client(db, idx)
+            self.dbs[idx] = wrapped[id(db)]
+
+    def _init_routing(self):
+        """Lê a estratégia de roteamento de st.secrets['firebase_sharding']."""
+        cfg = {}
+        try:
+            if 'firebase_sharding' in st.secrets:
+                cfg = dict(st.secrets['firebase_sharding'])
+        except Exception:
+            pass
+        self.strategy = cfg.get('strategy', 'modulo')
+        self.use_routing_table = bool(cfg.get('routing_table', False))
+        if (len(self.dbs) > 2 and self.backend != 'memory'
+                and (self.strategy != 'consistent' or not self.use_routing_table)):
+            # md5 % N com N > 2 remapearia ~2/3 dos usuários para shards sem os dados
+            # deles; o backend memory começa vazio a cada processo e fica de fora
+            msg = (f"{len(self.dbs)} shards configurados: defina strategy = \"consistent\" e "
+                   "routing_table = true em [firebase_sharding] (ver shard_rebalancer.py)")
+            st.error(f"❌ {msg}")
+            raise RuntimeError(msg)
+        self._ring = HashRing(range(len(self.dbs)), int(cfg.get('virtual_nodes', 64)))
+        # user_id -> (shard, instante em que a rota deve ser relida)
+        self._route_memo: Dict[str, Tuple[int, float]] = {}
+
+    # ------------------------------------------------------------------
+    # Roteamento
+    # ------------------------------------------------------------------
+
+    def _read_route(self, user_id: str) -> Optional[int]:
+        """Rota gravada para o usuário em shard_routes (None se não houver)."""
+        doc = self.dbs[0].collection('shard_routes').document(user_id).get()
+        if not doc.exists:
+            return None
+        return int(doc.to_dict().get('shard', 0))
+
+    def target_shard(self, user_id: str) -> int:
+        """Shard calculado pela estratégia atual (ignora a tabela de rotas)."""
+        if self.strategy == 'consistent':
+            return self._ring.lookup(user_id)
+        return _hash_user(user_id) % len(self.dbs)
+
+    def shard_index_for_user(self, user_id: str) -> int:
+        """
+        Índice do shard deste usuário (tabela de rotas > estratégia de hash).
+        Com routing_table, a rota é relida a cada ROUTE_TTL_SECONDS para enxergar
+        usuários movidos pelo rebalanceador em outro processo.
+        """
+        if not user_id:
+            return 0
+        now = time.monotonic()
+        cached = self._route_memo.get(user_id)
+        if cached is not None and (not self.use_routing_table or now < cached[1]):
+            return cached[0]
+        idx = None
+        if self.use_routing_table and self.dbs[0] is not None:
+            try:
+                idx = self._read_route(user_id)
+            except Exception as e:
+                if cached is not None:
+                    # Sem acesso à tabela: a última rota conhecida é mais segura que o hash
+                    return cached[0]
+                print(f"Aviso: rota de {user_id} indisponível: {e}")
+        if idx is None or idx >= len(self.dbs):
+            idx = self.target_shard(user_id)
+        self._route_memo[user_id] = (idx, now + ROUTE_TTL_SECONDS)
+        return idx
+
+    def set_user_route(self, user_id: str, shard_idx: int):
+        """Fixa o shard de um usuário na tabela de rotas (usado pelo rebalanceador)."""
+        self.dbs[0].collection('shard_routes').document(user_id).set({'shard': shard_idx})
+        self._route_memo[user_id] = (shard_idx, time.monotonic() + ROUTE_TTL_SECONDS)
+
+    def get_routes(self) -> Dict[str, int]:
+        """Tabela de rotas completa, lida agora do primário (rebalanceador/admin)."""
+        routes = {}
+        try:
+            if self.dbs[0] is not None:
+                for doc in self.dbs[0].collection('shard_routes').get():
+                    routes[doc.id] = int(doc.to_dict().get('shard', 0))
+        except Exception as e:
+            print(f"Aviso: tabela de rotas indisponível: {e}")
+        return routes
+
     # ------------------------------------------------------------------
     # API pública
     # ------------------------------------------------------------------
@@ -126,10 +321,7 @@ class DualFirebaseManager:
         Retorna o cliente Firestore correto para este user_id.
         O roteamento é determinístico: mesmo user_id → mesmo Firebase sempre.
         """
-        if not user_id:
-            return self.dbs[0]
-        idx = int(hashlib.md5(user_id.encode()).hexdigest(), 16) % 2
-        db = self.dbs[idx]
+        db = self.dbs[self.shard_index_for_user(user_id)]
         return db if db is not None else self.dbs[0]
 
     def get_all_dbs(self):
@@ -142,6 +334,19 @@ class DualFirebaseManager:
                 seen.add(id(db))
         return unique
 
+    def get_shards(self):
+        """
+        Retorna lista de (índice, cliente Firestore) sem duplicatas.
+        Útil para quem precisa identificar de qual shard veio cada documento.
+        """
+        shards = []
+        seen = set()
+        for idx, db in enumerate(self.dbs):
+            if db is not None and id(db) not in seen:
+                shards.append((idx, db))
+                seen.add(id(db))
+        return shards
+
     def get_primary_db(self):
         """Retorna Firestore do Firebase primário (índice 0)."""
         return self.dbs[0]
@@ -177,9 +382,21 @@ def get_all_dbs():
     """Retorna todos os Firestores ativos (para leituras globais do professor)."""
     return _manager.get_all_dbs()
 
+def get_shards():
+    """Retorna [(índice_do_shard, Firestore)] de todos os Firestores ativos."""
+    return _manager.get_shards()
+
 def is_firebase_connected() -> bool:
     return _manager.is_connected()
 
+def get_shard_index_for_user(user_id: str) -> int:
+    """Índice do shard onde ficam os dados deste user_id."""
+    return _manager.shard_index_for_user(user_id)
+
+def get_shard_count() -> int:
+    """Quantidade de shards configurados (inclui secundário que aponta para o primário)."""
+    return len(_manager.dbs)
+
 def dual_firebase_active() -> bool:
     """True quando o segundo Firebase está separado e operacional."""
     return _manager.secondary_is_configured()
@@ -204,20 +421,20 @@ def test_firebase_connection():
 # =============================
 
 def _auth():
-    """Retorna o módulo auth apontando para o app primário."""
-    return auth
+    """Retorna o módulo auth (ou o Auth em memória do backend "memory")."""
+    return _manager.auth
 
 def create_firebase_user(email: str, password: str, display_name: str):
     """Cria usuário no Firebase Authentication e envia email de verificação."""
     try:
-        user = auth.create_user(
+        user = _auth().create_user(
             email=email,
             password=password,
             display_name=display_name,
             email_verified=False,
             app=_manager.apps[0]
         )
-        link = auth.generate_email_verification_link(email, app=_manager.apps[0])
+        link = _auth().generate_email_verification_link(email, app=_manager.apps[0])
         return True, user.uid, link
     except auth.EmailAlreadyExistsError:
         return False, None, "Email já cadastrado"
@@ -227,7 +444,7 @@ def create_firebase_user(email: str, password: str, display_name: str):
 def verify_firebase_user(email: str, password: str):
     """Verifica credenciais e status de verificação do email."""
     try:
-        user = auth.get_user_by_email(email, app=_manager.apps[0])
+        user = _auth().get_user_by_email(email, app=_manager.apps[0])
         return True, user.uid, user.email_verified
     except auth.UserNotFoundError:
         return False, None, False
@@ -237,10 +454,10 @@ def verify_firebase_user(email: str, password: str):
 def send_verification_email_firebase(email: str):
     """Reenvia email de verificação."""
     try:
-        link = auth.generate_email_verification_link(email, app=_manager.apps[0])
+        link = _auth().generate_email_verification_link(email, app=_manager.apps[0])
         try:
             from email_service import send_verification_email_smtp
-            user = auth.get_user_by_email(email, app=_manager.apps[0])
+            user = _auth().get_user_by_email(email, app=_manager.apps[0])
             display_name = user.display_name or email.split('@')[0]
             success, message = send_verification_email_smtp(email, link, display_name)
             if success:
@@ -254,14 +471,14 @@ def send_verification_email_firebase(email: str):
 def get_firebase_user_by_email(email: str):
     """Busca usuário no Firebase Auth por email."""
     try:
-        return auth.get_user_by_email(email, app=_manager.apps[0])
+        return _auth().get_user_by_email(email, app=_manager.apps[0])
     except Exception:
         return None
 
 def delete_firebase_auth_user(uid: str):
     """Remove usuário do Firebase Authentication."""
     try:
-        auth.delete_user(uid, app=_manager.apps[0])
+        _auth().delete_user(uid, app=_manager.apps[0])
         return True
     except Exception:
         return False
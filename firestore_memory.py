@@ -0,0 +1,808 @@
+"""
+Firestore (e Firebase Auth) em memória, no mesmo processo.
+
+Implementa o subconjunto da API do SDK usado pelo app — coleções, documentos,
+where/order_by/limit/offset/cursores/select, count/sum/avg, batches de até 500
+escritas, sentinelas (SERVER_TIMESTAMP, DELETE_FIELD, Increment, ArrayUnion...)
+e on_snapshot — para rodar os caminhos do Firestore (roteamento entre shards,
+escritas em lote, leituras em fan-out, espelho em tempo real) sem rede e sem
+credenciais. Cada shard é um MemoryFirestore independente.
+
+Os documentos guardados nunca são alterados no lugar (cada escrita grava uma
+cópia nova) e to_dict() devolve uma cópia, como numa serialização de verdade.
+`latency_ms` simula o tempo de ida e volta de cada chamada ao servidor.
+"""
+
+import copy
+import queue
+import random
+import string
+import threading
+import time
+from datetime import datetime, timezone
+from functools import cmp_to_key
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+from firebase_admin import auth as firebase_auth
+
+MAX_BATCH_WRITES = 500
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+_MISSING = object()
+_ID_CHARS = string.ascii_letters + string.digits
+
+
+def _auto_id() -> str:
+    return ''.join(random.choice(_ID_CHARS) for _ in range(20))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# =============================
+# Valores e caminhos de campo
+# =============================
+
+def _split(field_path: str) -> List[str]:
+    return field_path.split('.')
+
+
+def _get_field(data: Dict, field_path: str):
+    value = data
+    for part in _split(field_path):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data: Dict, field_path: str, value):
+    parts = _split(field_path)
+    for part in parts[:-1]:
+        child = data.get(part)
+        if not isinstance(child, dict):
+            child = data[part] = {}
+        data = child
+    data[parts[-1]] = value
+
+
+def _delete_field(data: Dict, field_path: str):
+    parts = _split(field_path)
+    for part in parts[:-1]:
+        data = data.get(part)
+        if not isinstance(data, dict):
+            return
+    data.pop(parts[-1], None)
+
+
+def _type_rank(value) -> int:
+    """Ordem entre tipos do Firestore: null < bool < número < data < texto < bytes < ref < array < map."""
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, MemoryDocumentReference):
+        return 6
+    if isinstance(value, (list, tuple)):
+        return 8
+    return 9
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 3:
+        value = value.timestamp()
+    elif rank == 6:
+        value = value.path
+    elif rank == 8:
+        value = tuple(_sort_key(v) for v in value)
+    elif rank == 9:
+        value = tuple(sorted((k, _sort_key(v)) for k, v in value.items()))
+    return rank, value
+
+
+def _compare(a, b) -> int:
+    ka, kb = _sort_key(a), _sort_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def _matches(value, op: str, target) -> bool:
+    if value is _MISSING:
+        return False
+    if op == '==':
+        return _compare(value, target) == 0
+    if op == '!=':
+        return value is not None and _compare(value, target) != 0
+    if op in ('<', '<=', '>', '>='):
+        if _type_rank(value) != _type_rank(target):
+            return False
+        c = _compare(value, target)
+        return {'<': c < 0, '<=': c <= 0, '>': c > 0, '>=': c >= 0}[op]
+    if op == 'in':
+        return any(_compare(value, t) == 0 for t in target)
+    if op == 'not-in':
+        return value is not None and all(_compare(value, t) != 0 for t in target)
+    if op == 'array_contains':
+        return isinstance(value, list) and any(_compare(v, target) == 0 for v in value)
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(_compare(v, t) == 0 for v in value for t in target)
+    raise ValueError(f"Operador não suportado: {op}")
+
+
+def _apply_value(current, value):
+    """Resolve sentinelas e transformações contra o valor atual do campo."""
+    if value is transforms.SERVER_TIMESTAMP:
+        return _now()
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, transforms.Maximum):
+        return value.value if not isinstance(current, (int, float)) else max(current, value.value)
+    if isinstance(value, transforms.Minimum):
+        return value.value if not isinstance(current, (int, float)) else min(current, value.value)
+    if isinstance(value, transforms.ArrayUnion):
+        items = list(current) if isinstance(current, list) else []
+        for v in value.values:
+            if not any(_compare(v, x) == 0 for x in items):
+                items.append(copy.deepcopy(v))
+        return items
+    if isinstance(value, transforms.ArrayRemove):
+        items = list(current) if isinstance(current, list) else []
+        return [x for x in items if not any(_compare(v, x) == 0 for v in value.values)]
+    if isinstance(value, dict):
+        base = current if isinstance(current, dict) else {}
+        return {k: _apply_value(base.get(k, _MISSING), v) for k, v in value.items()}
+    return copy.deepcopy(value)
+
+
+def _merge(target: Dict, updates: Dict):
+    for key, value in updates.items():
+        if value is transforms.DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = _apply_value(target.get(key, _MISSING), value)
+
+
+# =============================
+# Snapshots e referências
+# =============================
+
+class MemoryDocumentSnapshot:
+    def __init__(self, reference: 'MemoryDocumentReference', data: Optional[Dict],
+                 create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        if self._data is None:
+            return None
+        value = _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class MemoryDocumentReference:
+    def __init__(self, client: 'MemoryFirestore', collection_path: str, doc_id: str):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_path}/{self.id}"
+
+    @property
+    def parent(self) -> 'MemoryCollectionReference':
+        return MemoryCollectionReference(self._client, self._collection_path)
+
+    def collection(self, name: str) -> 'MemoryCollectionReference':
+        return MemoryCollectionReference(self._client, f"{self.path}/{name}")
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and other._client is self._client and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None) -> MemoryDocumentSnapshot:
+        self._client._rpc()
+        snapshot = self._client._snapshot(self)
+        if field_paths is not None and snapshot.exists:
+            snapshot._data = _project(snapshot._data, field_paths)
+        return snapshot
+
+    def create(self, document_data: Dict):
+        return self._client._commit([('create', self, document_data, None)])[0]
+
+    def set(self, document_data: Dict, merge: bool = False):
+        return self._client._commit([('set', self, document_data, merge)])[0]
+
+    def update(self, field_updates: Dict, option=None):
+        return self._client._commit([('update', self, field_updates, None)])[0]
+
+    def delete(self, option=None):
+        return self._client._commit([('delete', self, None, None)])[0].update_time
+
+
+def _project(data: Dict, field_paths) -> Dict:
+    projected: Dict = {}
+    for path in field_paths:
+        value = _get_field(data, path)
+        if value is not _MISSING:
+            _set_field(projected, path, value)
+    return projected
+
+
+class MemoryWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+# =============================
+# Consultas
+# =============================
+
+class MemoryQuery:
+    """Consulta imutável: cada encadeamento devolve uma cópia."""
+
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def __init__(self, client: 'MemoryFirestore', collection_path: str):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._orders: List[Tuple[str, str]] = []
+        self._projection: Optional[List[str]] = None
+        self._limit: Optional[int] = None
+        self._limit_to_last = False
+        self._offset = 0
+        self._start: Optional[Tuple[Any, bool]] = None   # (cursor, inclusivo)
+        self._end: Optional[Tuple[Any, bool]] = None
+
+    def _copy(self) -> 'MemoryQuery':
+        clone = MemoryQuery.__new__(MemoryQuery)
+        clone.__dict__.update(self.__dict__)
+        clone._filters = list(self._filters)
+        clone._orders = list(self._orders)
+        return clone
+
+    # Encadeamentos ----------------------------------------------------
+
+    def where(self, field_path: str = None, op_string: str = None, value=None, *, filter=None) -> 'MemoryQuery':
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        clone = self._copy()
+        clone._filters.append((field_path, op_string, value))
+        return clone
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._orders.append((field_path, direction))
+        return clone
+
+    def limit(self, count: int) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._limit, clone._limit_to_last = count, False
+        return clone
+
+    def limit_to_last(self, count: int) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._limit, clone._limit_to_last = count, True
+        return clone
+
+    def offset(self, num_to_skip: int) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._offset = num_to_skip
+        return clone
+
+    def select(self, field_paths) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._projection = list(field_paths)
+        return clone
+
+    def start_at(self, document_fields) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._start = (document_fields, True)
+        return clone
+
+    def start_after(self, document_fields) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._start = (document_fields, False)
+        return clone
+
+    def end_at(self, document_fields) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._end = (document_fields, True)
+        return clone
+
+    def end_before(self, document_fields) -> 'MemoryQuery':
+        clone = self._copy()
+        clone._end = (document_fields, False)
+        return clone
+
+    # Agregações -------------------------------------------------------
+
+    def count(self, alias: str = None) -> 'MemoryAggregationQuery':
+        return MemoryAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref: str, alias: str = None) -> 'MemoryAggregationQuery':
+        return MemoryAggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref: str, alias: str = None) -> 'MemoryAggregationQuery':
+        return MemoryAggregationQuery(self).avg(field_ref, alias)
+
+    # Execução ---------------------------------------------------------
+
+    def get(self, transaction=None, **kwargs) -> List[MemoryDocumentSnapshot]:
+        return list(self.stream(transaction))
+
+    def stream(self, transaction=None, **kwargs):
+        self._client._rpc()
+        for snapshot in self._run():
+            yield snapshot
+
+    def on_snapshot(self, callback: Callable) -> 'MemoryWatch':
+        return self._client._watch(self, callback)
+
+    def _value(self, snapshot: MemoryDocumentSnapshot, field_path: str):
+        if field_path == '__name__':
+            return snapshot.id
+        return _get_field(snapshot._data, field_path)
+
+    def _effective_orders(self) -> List[Tuple[str, str]]:
+        """Ordenação explícita + campos de desigualdade + __name__ como desempate."""
+        orders = list(self._orders)
+        ordered = {f for f, _ in orders}
+        for field, op, _ in self._filters:
+            if op in ('<', '<=', '>', '>=', '!=', 'not-in') and field not in ordered:
+                orders.append((field, ASCENDING))
+                ordered.add(field)
+        if '__name__' not in ordered:
+            orders.append(('__name__', orders[-1][1] if orders else ASCENDING))
+        return orders
+
+    def _accepts(self, snapshot: MemoryDocumentSnapshot) -> bool:
+        for field, op, value in self._filters:
+            target = _doc_id(value) if field == '__name__' and op != 'in' else value
+            if not _matches(self._value(snapshot, field), op, target):
+                return False
+        for field, _ in self._orders:
+            if self._value(snapshot, field) is _MISSING:
+                return False
+        return True
+
+    def _cursor_values(self, cursor, orders) -> List:
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            return [self._value(cursor, f) for f, _ in orders]
+        if isinstance(cursor, dict):
+            values = []
+            for field, _ in orders:
+                if field not in cursor:
+                    break
+                values.append(_doc_id(cursor[field]) if field == '__name__' else cursor[field])
+            return values
+        return list(cursor)
+
+    def _run(self) -> List[MemoryDocumentSnapshot]:
+        orders = self._effective_orders()
+        docs = [s for s in self._client._scan(self._collection_path) if self._accepts(s)]
+
+        def compare(a_values, b_values) -> int:
+            for (field, direction), a, b in zip(orders, a_values, b_values):
+                c = _compare(a, b)
+                if c:
+                    return -c if direction == DESCENDING else c
+            return 0
+
+        keyed = [([self._value(s, f) for f, _ in orders], s) for s in docs]
+        keyed.sort(key=cmp_to_key(lambda x, y: compare(x[0], y[0])))
+
+        if self._start is not None:
+            cursor, inclusive = self._start
+            values = self._cursor_values(cursor, orders)
+            keyed = [(k, s) for k, s in keyed
+                     if (compare(k[:len(values)], values) >= 0 if inclusive else compare(k[:len(values)], values) > 0)]
+        if self._end is not None:
+            cursor, inclusive = self._end
+            values = self._cursor_values(cursor, orders)
+            keyed = [(k, s) for k, s in keyed
+                     if (compare(k[:len(values)], values) <= 0 if inclusive else compare(k[:len(values)], values) < 0)]
+
+        results = [s for _, s in keyed][self._offset:]
+        if self._limit is not None:
+            results = results[-self._limit:] if self._limit_to_last else results[:self._limit]
+        if self._projection is not None:
+            for s in results:
+                s._data = _project(s._data, self._projection)
+        return results
+
+
+def _doc_id(value):
+    if isinstance(value, MemoryDocumentReference):
+        return value.id
+    if isinstance(value, str) and '/' in value:
+        return value.rsplit('/', 1)[1]
+    return value
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client: 'MemoryFirestore', collection_path: str):
+        super().__init__(client, collection_path)
+
+    @property
+    def id(self) -> str:
+        return self._collection_path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self) -> Optional[MemoryDocumentReference]:
+        if '/' not in self._collection_path:
+            return None
+        parent_path, doc_id = self._collection_path.rsplit('/', 1)[0].rsplit('/', 1)
+        return MemoryDocumentReference(self._client, parent_path, doc_id)
+
+    def document(self, document_id: str = None) -> MemoryDocumentReference:
+        return MemoryDocumentReference(self._client, self._collection_path, document_id or _auto_id())
+
+    def add(self, document_data: Dict, document_id: str = None):
+        ref = self.document(document_id)
+        result = ref.create(document_data)
+        return result.update_time, ref
+
+    def list_documents(self, page_size: int = None):
+        self._client._rpc()
+        return [self.document(doc_id) for doc_id in self._client._ids(self._collection_path)]
+
+
+class MemoryAggregationQuery:
+    def __init__(self, query: MemoryQuery):
+        self._query = query
+        self._aggregations: List[Tuple[str, Optional[str], Optional[str]]] = []
+
+    def _add(self, kind: str, field: Optional[str], alias: Optional[str]) -> 'MemoryAggregationQuery':
+        self._aggregations.append((kind, field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias: str = None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_ref: str, alias: str = None):
+        return self._add('sum', field_ref, alias)
+
+    def avg(self, field_ref: str, alias: str = None):
+        return self._add('avg', field_ref, alias)
+
+    def get(self, transaction=None, **kwargs) -> List[List[AggregationResult]]:
+        self._query._client._rpc()
+        docs = self._query._run()
+        read_time = _now()
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == 'count':
+                value = len(docs)
+            else:
+                numbers = [v for v in (_get_field(d._data, field) for d in docs)
+                           if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == 'sum':
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(AggregationResult(alias=alias, value=value, read_time=read_time))
+        return [results]
+
+
+class MemoryWriteBatch:
+    def __init__(self, client: 'MemoryFirestore'):
+        self._client = client
+        self._ops: List[Tuple] = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def create(self, reference, document_data: Dict):
+        self._ops.append(('create', reference, document_data, None))
+
+    def set(self, reference, document_data: Dict, merge: bool = False):
+        self._ops.append(('set', reference, document_data, merge))
+
+    def update(self, reference, field_updates: Dict, option=None):
+        self._ops.append(('update', reference, field_updates, None))
+
+    def delete(self, reference, option=None):
+        self._ops.append(('delete', reference, None, None))
+
+    def commit(self, **kwargs) -> List[MemoryWriteResult]:
+        if len(self._ops) > MAX_BATCH_WRITES:
+            raise gexc.InvalidArgument(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+        ops, self._ops = self._ops, []
+        return self._client._commit(ops)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+
+
+class MemoryWatch:
+    def __init__(self, client: 'MemoryFirestore', query: MemoryQuery, callback: Callable):
+        self._client = client
+        self.query = query
+        self.callback = callback
+
+    def unsubscribe(self):
+        self._client._unwatch(self)
+
+
+# =============================
+# Cliente
+# =============================
+
+class MemoryFirestore:
+    """Um "projeto" Firestore em memória (um por shard)."""
+
+    def __init__(self, project: str = "memory", latency_ms: float = 0.0):
+        self.project = project
+        self.latency_ms = latency_ms
+        self._lock = threading.RLock()
+        # caminho da coleção -> {doc_id: (dados, create_time, update_time)}
+        self._store: Dict[str, Dict[str, Tuple[Dict, datetime, datetime]]] = {}
+        self._watches: List[MemoryWatch] = []
+        self._events: Optional[queue.Queue] = None
+
+    def collection(self, collection_path: str) -> MemoryCollectionReference:
+        return MemoryCollectionReference(self, collection_path)
+
+    def document(self, document_path: str) -> MemoryDocumentReference:
+        collection_path, doc_id = document_path.rsplit('/', 1)
+        return MemoryDocumentReference(self, collection_path, doc_id)
+
+    def collections(self) -> List[MemoryCollectionReference]:
+        with self._lock:
+            return [self.collection(p) for p in self._store if '/' not in p]
+
+    def batch(self) -> MemoryWriteBatch:
+        return MemoryWriteBatch(self)
+
+    def close(self):
+        pass
+
+    def reset(self):
+        """Apaga todos os documentos (listeners continuam registrados)."""
+        with self._lock:
+            self._store.clear()
+
+    def document_count(self, collection_path: str = None) -> int:
+        with self._lock:
+            if collection_path is not None:
+                return len(self._store.get(collection_path, {}))
+            return sum(len(docs) for docs in self._store.values())
+
+    # Internos ---------------------------------------------------------
+
+    def _rpc(self):
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+    def _snapshot(self, ref: MemoryDocumentReference) -> MemoryDocumentSnapshot:
+        with self._lock:
+            entry = self._store.get(ref._collection_path, {}).get(ref.id)
+        read_time = _now()
+        if entry is None:
+            return MemoryDocumentSnapshot(ref, None, read_time=read_time)
+        data, created, updated = entry
+        return MemoryDocumentSnapshot(ref, data, created, updated, read_time)
+
+    def _scan(self, collection_path: str) -> List[MemoryDocumentSnapshot]:
+        with self._lock:
+            entries = list(self._store.get(collection_path, {}).items())
+        read_time = _now()
+        return [MemoryDocumentSnapshot(MemoryDocumentReference(self, collection_path, doc_id),
+                                       data, created, updated, read_time)
+                for doc_id, (data, created, updated) in entries]
+
+    def _ids(self, collection_path: str) -> List[str]:
+        with self._lock:
+            return list(self._store.get(collection_path, {}))
+
+    def _commit(self, ops: List[Tuple]) -> List[MemoryWriteResult]:
+        """Aplica as escritas de forma atômica (tudo ou nada) e notifica os listeners."""
+        self._rpc()
+        with self._lock:
+            staged: Dict[Tuple[str, str], Optional[Tuple[Dict, datetime, datetime]]] = {}
+
+            def current(ref):
+                key = (ref._collection_path, ref.id)
+                if key in staged:
+                    return staged[key]
+                return self._store.get(ref._collection_path, {}).get(ref.id)
+
+            now = _now()
+            touched: List[Tuple[str, str]] = []
+            for kind, ref, data, merge in ops:
+                ref = getattr(ref, '_target', ref)
+                key = (ref._collection_path, ref.id)
+                entry = current(ref)
+                if kind == 'create':
+                    if entry is not None:
+                        raise gexc.AlreadyExists(f"Document already exists: {ref.path}")
+                    new_data: Dict = {}
+                    _merge(new_data, data)
+                    staged[key] = (new_data, now, now)
+                elif kind == 'set':
+                    new_data = copy.deepcopy(entry[0]) if (merge and entry is not None) else {}
+                    _merge(new_data, data)
+                    staged[key] = (new_data, entry[1] if entry else now, now)
+                elif kind == 'update':
+                    if entry is None:
+                        raise gexc.NotFound(f"No document to update: {ref.path}")
+                    new_data = copy.deepcopy(entry[0])
+                    for field_path, value in data.items():
+                        if value is transforms.DELETE_FIELD:
+                            _delete_field(new_data, field_path)
+                        else:
+                            old = _get_field(new_data, field_path)
+                            _set_field(new_data, field_path, _apply_value(old, value))
+                    staged[key] = (new_data, entry[1], now)
+                else:
+                    staged[key] = None
+                touched.append(key)
+
+            before = {key: self._store.get(key[0], {}).get(key[1]) for key in staged}
+            for (collection_path, doc_id), entry in staged.items():
+                docs = self._store.setdefault(collection_path, {})
+                if entry is None:
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = entry
+            if self._watches:
+                self._notify(before, staged)
+        return [MemoryWriteResult(now) for _ in touched]
+
+    # Listeners --------------------------------------------------------
+
+    def _watch(self, query: MemoryQuery, callback: Callable) -> MemoryWatch:
+        watch = MemoryWatch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            docs = query._run()
+            changes = [DocumentChange(ChangeType.ADDED, s, -1, i) for i, s in enumerate(docs)]
+            self._dispatch(watch, docs, changes)
+        return watch
+
+    def _unwatch(self, watch: MemoryWatch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self, before: Dict, after: Dict):
+        for watch in list(self._watches):
+            query = watch.query
+            changes = []
+            for (collection_path, doc_id), new_entry in after.items():
+                if collection_path != query._collection_path:
+                    continue
+                ref = MemoryDocumentReference(self, collection_path, doc_id)
+                old_entry = before[(collection_path, doc_id)]
+                old = MemoryDocumentSnapshot(ref, old_entry[0]) if old_entry else None
+                new = MemoryDocumentSnapshot(ref, new_entry[0], new_entry[1], new_entry[2], _now()) \
+                    if new_entry else None
+                was_in = old is not None and query._accepts(old)
+                is_in = new is not None and query._accepts(new)
+                if is_in and not was_in:
+                    changes.append(DocumentChange(ChangeType.ADDED, new, -1, 0))
+                elif is_in:
+                    changes.append(DocumentChange(ChangeType.MODIFIED, new, 0, 0))
+                elif was_in:
+                    changes.append(DocumentChange(ChangeType.REMOVED, old, 0, -1))
+            if changes:
+                self._dispatch(watch, None, changes)
+
+    def _dispatch(self, watch: MemoryWatch, docs, changes):
+        """Entrega os eventos numa thread própria, como os listeners do SDK."""
+        if self._events is None:
+            self._events = queue.Queue()
+            threading.Thread(target=self._deliver, name=f"memory-firestore-{self.project}", daemon=True).start()
+        self._events.put((watch, docs, changes, _now()))
+
+    def _deliver(self):
+        while True:
+            watch, docs, changes, read_time = self._events.get()
+            with self._lock:
+                active = watch in self._watches
+            if not active:
+                continue
+            if docs is None:
+                docs = watch.query._run()
+            try:
+                watch.callback(docs, changes, read_time)
+            except Exception as e:
+                print(f"MEMORY FIRESTORE: erro no listener: {e}")
+
+
+# =============================
+# Firebase Auth em memória
+# =============================
+
+class MemoryUserRecord:
+    def __init__(self, uid: str, email: str, display_name: str = None, email_verified: bool = False):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+        self.email_verified = email_verified
+
+
+class MemoryAuth:
+    """Mesmas funções do módulo firebase_admin.auth usadas pelo app (o argumento app é ignorado)."""
+
+    EmailAlreadyExistsError = firebase_auth.EmailAlreadyExistsError
+    UserNotFoundError = firebase_auth.UserNotFoundError
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users: Dict[str, MemoryUserRecord] = {}
+
+    def create_user(self, uid: str = None, email: str = None, password: str = None,
+                    display_name: str = None, email_verified: bool = False, app=None, **kwargs):
+        with self._lock:
+            email = (email or '').lower()
+            if email and any(u.email == email for u in self._users.values()):
+                raise firebase_auth.EmailAlreadyExistsError(
+                    "The user with the provided email already exists", None, None)
+            record = MemoryUserRecord(uid or _auto_id(), email, display_name, email_verified)
+            self._users[record.uid] = record
+            return record
+
+    def get_user(self, uid: str, app=None) -> MemoryUserRecord:
+        with self._lock:
+            if uid not in self._users:
+                raise firebase_auth.UserNotFoundError(f"No user record found for the provided user ID: {uid}")
+            return self._users[uid]
+
+    def get_user_by_email(self, email: str, app=None) -> MemoryUserRecord:
+        with self._lock:
+            for record in self._users.values():
+                if record.email == (email or '').lower():
+                    return record
+        raise firebase_auth.UserNotFoundError(f"No user record found for the provided email: {email}")
+
+    def delete_user(self, uid: str, app=None):
+        with self._lock:
+            if self._users.pop(uid, None) is None:
+                raise firebase_auth.UserNotFoundError(f"No user record found for the provided user ID: {uid}")
+
+    def generate_email_verification_link(self, email: str, action_code_settings=None, app=None) -> str:
+        record = self.get_user_by_email(email)
+        return f"http://localhost/verify?uid={record.uid}&oobCode={_auto_id()}"
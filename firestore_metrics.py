@@ -0,0 +1,375 @@
+"""
+Instrumentação dos clientes Firestore por shard.
+
+Os clientes retornados pelo DualFirebaseManager são embrulhados em proxies que
+contam leituras/escritas/deleções por (shard, coleção), registram histogramas de
+latência por operação e projetam o consumo diário da cota gratuita.
+
+As contagens são do processo atual (servidor Streamlit) e zeram à meia-noite do
+horário do Pacífico, quando a cota do Firestore é renovada.
+"""
+
+import math
+import time
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Tuple
+from zoneinfo import ZoneInfo
+
+from profiling import note_firestore
+
+# Cota diária do plano gratuito (Spark) por projeto
+FREE_TIER_DAILY_QUOTA = {'read': 50000, 'write': 20000, 'delete': 20000}
+
+# Limites superiores dos buckets de latência (ms); o último bucket é "acima de"
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+
+
+class FirestoreMetrics:
+    """Contadores e histogramas thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = self._today()
+        self.ops: Dict[Tuple[int, str, str], int] = {}          # (shard, coleção, tipo) -> docs
+        self.latency: Dict[Tuple[int, str], List[int]] = {}     # (shard, operação) -> buckets
+
+    @staticmethod
+    def _today():
+        return datetime.now(QUOTA_TZ).date()
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.ops.clear()
+            self.latency.clear()
+
+    def record(self, shard: int, collection: str, kind: str, count: int, op: str = None, elapsed_ms: float = None):
+        """Soma `count` operações do tipo `kind`; se `op` vier, registra também a latência."""
+        with self._lock:
+            self._roll_day()
+            key = (shard, collection, kind)
+            self.ops[key] = self.ops.get(key, 0) + count
+            if op is not None:
+                buckets = self.latency.setdefault((shard, op), [0] * (len(LATENCY_BUCKETS_MS) + 1))
+                buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        # Operações do rerun atual, para o painel de desempenho (thread do script)
+        note_firestore(collection, kind, count)
+
+    # ------------------------------------------------------------------
+    # Relatórios
+    # ------------------------------------------------------------------
+
+    def ops_table(self) -> List[Dict]:
+        """Linhas (shard, coleção, leituras, escritas, deleções)."""
+        with self._lock:
+            rows: Dict[Tuple[int, str], Dict] = {}
+            for (shard, collection, kind), n in self.ops.items():
+                row = rows.setdefault((shard, collection), {'shard': shard, 'collection': collection,
+                                                            'read': 0, 'write': 0, 'delete': 0})
+                row[kind] += n
+        return sorted(rows.values(), key=lambda r: (r['shard'], r['collection']))
+
+    def latency_table(self) -> List[Dict]:
+        """p50/p95 aproximados (limite superior do bucket) por shard e operação."""
+        result = []
+        with self._lock:
+            items = [(k, list(v)) for k, v in self.latency.items()]
+        for (shard, op), buckets in sorted(items):
+            total = sum(buckets)
+            result.append({
+                'shard': shard,
+                'op': op,
+                'calls': total,
+                'p50_ms': _percentile(buckets, total, 0.50),
+                'p95_ms': _percentile(buckets, total, 0.95),
+            })
+        return result
+
+    def quota_projection(self) -> List[Dict]:
+        """Consumo de hoje e projeção até o fim do dia (ritmo atual) por shard."""
+        now = datetime.now(QUOTA_TZ)
+        elapsed = max((now - now.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds(), 60.0)
+        factor = 86400.0 / elapsed
+        totals: Dict[int, Dict[str, int]] = {}
+        with self._lock:
+            for (shard, _, kind), n in self.ops.items():
+                totals.setdefault(shard, {'read': 0, 'write': 0, 'delete': 0})[kind] += n
+        result = []
+        for shard, used in sorted(totals.items()):
+            for kind, quota in FREE_TIER_DAILY_QUOTA.items():
+                projected = int(used[kind] * factor)
+                result.append({
+                    'shard': shard,
+                    'kind': kind,
+                    'used_today': used[kind],
+                    'projected': projected,
+                    'quota': quota,
+                    'projected_pct': projected / quota * 100,
+                })
+        return result
+
+
+def _percentile(buckets: List[int], total: int, q: float):
+    if not total:
+        return 0
+    target = q * total
+    acc = 0
+    for i, n in enumerate(buckets):
+        acc += n
+        if acc >= target:
+            return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}"
+    return 0
+
+
+metrics = FirestoreMetrics()
+
+
+# =============================
+# Proxies instrumentados
+# =============================
+
+def _unwrap(obj):
+    return obj._target if isinstance(obj, _Instrumented) else obj
+
+
+class _Instrumented:
+    """Base: delega tudo ao objeto real e mede as chamadas de rede."""
+
+    def __init__(self, target, shard: int, collection: str = ''):
+        self._target = target
+        self._shard = shard
+        self._collection = collection
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_target':
+            # Evita recursão em cópia/pickle antes de _target existir
+            raise AttributeError(name)
+        return getattr(self._target, name)
+
+    def _timed(self, op: str, kind: str, call, count_of=None):
+        started = time.perf_counter()
+        result = call()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        count = count_of(result) if count_of else 1
+        metrics.record(self._shard, self._collection, kind, count, op, elapsed_ms)
+        return result
+
+
+def _unwrap_args(args, kwargs):
+    """Cursores (snapshots) e refs vindos de proxies voltam a ser os objetos reais."""
+    return [_unwrap(a) for a in args], {k: _unwrap(v) for k, v in kwargs.items()}
+
+
+class InstrumentedQuery(_Instrumented):
+    """
+    CollectionReference/Query: encadeamentos devolvem proxy; get/stream contam leituras
+    e devolvem snapshots cujo `reference` também é instrumentado.
+    """
+
+    def _wrap(self, value):
+        return InstrumentedQuery(value, self._shard, self._collection)
+
+    def _snapshot(self, doc):
+        return InstrumentedSnapshot(doc, self._shard, self._collection)
+
+    def _cursor(self, method, args, kwargs):
+        args, kwargs = _unwrap_args(args, kwargs)
+        return self._wrap(method(*args, **kwargs))
+
+    def where(self, *args, **kwargs):
+        return self._wrap(self._target.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return self._wrap(self._target.order_by(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return self._wrap(self._target.limit(*args, **kwargs))
+
+    def limit_to_last(self, *args, **kwargs):
+        return self._wrap(self._target.limit_to_last(*args, **kwargs))
+
+    def select(self, *args, **kwargs):
+        return self._wrap(self._target.select(*args, **kwargs))
+
+    def start_after(self, *args, **kwargs):
+        return self._cursor(self._target.start_after, args, kwargs)
+
+    def start_at(self, *args, **kwargs):
+        return self._cursor(self._target.start_at, args, kwargs)
+
+    def end_before(self, *args, **kwargs):
+        return self._cursor(self._target.end_before, args, kwargs)
+
+    def end_at(self, *args, **kwargs):
+        return self._cursor(self._target.end_at, args, kwargs)
+
+    def offset(self, *args, **kwargs):
+        return self._wrap(self._target.offset(*args, **kwargs))
+
+    def get(self, *args, **kwargs):
+        # Consulta vazia ainda custa 1 leitura
+        docs = self._timed('query', 'read', lambda: self._target.get(*args, **kwargs),
+                           lambda docs: max(len(docs), 1))
+        return [self._snapshot(doc) for doc in docs]
+
+    def stream(self, *args, **kwargs):
+        started = time.perf_counter()
+        count = 0
+        try:
+            for doc in self._target.stream(*args, **kwargs):
+                count += 1
+                yield self._snapshot(doc)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.record(self._shard, self._collection, 'read', max(count, 1), 'query', elapsed_ms)
+
+    def count(self, *args, **kwargs):
+        return InstrumentedAggregation(self._target.count(*args, **kwargs), self._shard, self._collection,
+                                       counts_entries=True)
+
+    def sum(self, *args, **kwargs):
+        return InstrumentedAggregation(self._target.sum(*args, **kwargs), self._shard, self._collection)
+
+    def on_snapshot(self, callback, *args, **kwargs):
+        return self._target.on_snapshot(_metered_callback(callback, self._shard, self._collection), *args, **kwargs)
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._target.document(*args, **kwargs), self._shard, self._collection)
+
+    def add(self, *args, **kwargs):
+        update_time, ref = self._timed('add', 'write', lambda: self._target.add(*args, **kwargs))
+        return update_time, InstrumentedDocument(ref, self._shard, self._collection)
+
+    def list_documents(self, *args, **kwargs):
+        # Listar refs não lê os documentos; as operações sobre elas é que contam
+        for ref in self._target.list_documents(*args, **kwargs):
+            yield InstrumentedDocument(ref, self._shard, self._collection)
+
+
+def _metered_callback(callback, shard: int, collection: str):
+    """
+    Listener (on_snapshot): cada documento adicionado, alterado ou removido do
+    resultado conta 1 leitura — o snapshot inicial conta a coleção inteira.
+    """
+    def on_snapshot(snapshot, changes, read_time):
+        if changes:
+            metrics.record(shard, collection, 'read', len(changes))
+        return callback(snapshot, changes, read_time)
+    return on_snapshot
+
+
+class InstrumentedAggregation(_Instrumented):
+    """
+    Agregações cobram 1 leitura por lote de até 1000 entradas de índice. Em count()
+    o próprio resultado diz quantas entradas casaram; em sum() esse número não vem
+    na resposta e a contagem registrada (1) é um limite inferior.
+    """
+
+    def __init__(self, target, shard: int, collection: str = '', counts_entries: bool = False):
+        super().__init__(target, shard, collection)
+        self._counts_entries = counts_entries
+
+    def _billed_reads(self, result) -> int:
+        if not self._counts_entries:
+            return 1
+        try:
+            matched = sum(int(r.value or 0) for row in result for r in row)
+        except Exception:
+            return 1
+        return max(math.ceil(matched / 1000), 1)
+
+    def get(self, *args, **kwargs):
+        return self._timed('aggregation', 'read', lambda: self._target.get(*args, **kwargs), self._billed_reads)
+
+
+class InstrumentedDocument(_Instrumented):
+    def get(self, *args, **kwargs):
+        doc = self._timed('doc_get', 'read', lambda: self._target.get(*args, **kwargs))
+        return InstrumentedSnapshot(doc, self._shard, self._collection)
+
+    def set(self, *args, **kwargs):
+        return self._timed('doc_set', 'write', lambda: self._target.set(*args, **kwargs))
+
+    def update(self, *args, **kwargs):
+        return self._timed('doc_update', 'write', lambda: self._target.update(*args, **kwargs))
+
+    def delete(self, *args, **kwargs):
+        return self._timed('doc_delete', 'delete', lambda: self._target.delete(*args, **kwargs))
+
+    def collection(self, name):
+        return InstrumentedQuery(self._target.collection(name), self._shard, name)
+
+    def on_snapshot(self, callback, *args, **kwargs):
+        return self._target.on_snapshot(_metered_callback(callback, self._shard, self._collection), *args, **kwargs)
+
+
+class InstrumentedSnapshot(_Instrumented):
+    """Snapshot lido por um proxy: escritas via `doc.reference` também são contadas."""
+
+    @property
+    def reference(self):
+        return InstrumentedDocument(self._target.reference, self._shard, self._collection)
+
+
+class InstrumentedBatch(_Instrumented):
+    """Acumula as operações do lote e registra tudo no commit."""
+
+    def __init__(self, target, shard: int):
+        super().__init__(target, shard, '')
+        self._pending: List[Tuple[str, str]] = []   # (coleção, tipo)
+
+    def _track(self, ref, kind: str):
+        raw = _unwrap(ref)
+        collection = getattr(getattr(raw, 'parent', None), 'id', '') or ''
+        self._pending.append((collection, kind))
+        return raw
+
+    def set(self, ref, *args, **kwargs):
+        return self._target.set(self._track(ref, 'write'), *args, **kwargs)
+
+    def update(self, ref, *args, **kwargs):
+        return self._target.update(self._track(ref, 'write'), *args, **kwargs)
+
+    def delete(self, ref, *args, **kwargs):
+        return self._target.delete(self._track(ref, 'delete'), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._target.commit(*args, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        by_key: Dict[Tuple[str, str], int] = {}
+        for key in self._pending:
+            by_key[key] = by_key.get(key, 0) + 1
+        for i, ((collection, kind), n) in enumerate(by_key.items()):
+            # A latência do commit é registrada uma única vez
+            if i == 0:
+                metrics.record(self._shard, collection, kind, n, 'batch_commit', elapsed_ms)
+            else:
+                metrics.record(self._shard, collection, kind, n)
+        self._pending = []
+        return result
+
+
+class InstrumentedClient(_Instrumented):
+    """Cliente Firestore de um shard."""
+
+    def __init__(self, target, shard: int):
+        super().__init__(target, shard, '')
+
+    def collection(self, name):
+        return InstrumentedQuery(self._target.collection(name), self._shard, name)
+
+    def batch(self):
+        return InstrumentedBatch(self._target.batch(), self._shard)
+
+
+def instrument_client(client, shard: int):
+    """Embrulha um cliente Firestore (None continua None)."""
+    if client is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client, shard)
@@ -0,0 +1,177 @@
+"""
+Cache persistente dos insights de IA do professor.
+
+Chave: (função, modelo, hash das amostras enviadas). Mesmas respostas dos alunos,
+mesmo insight — o modelo só roda de novo quando os dados mudam ou a entrada vence.
+
+- Entrada válida (dentro do TTL): devolvida na hora
+- Entrada vencida (até STALE_MAX_AGE_SECONDS): devolvida na hora e recalculada em
+  segundo plano (stale-while-revalidate); a próxima leitura pega o valor novo
+- refresh=True: recalcula agora (botão "Atualizar" do painel)
+- Falhas do cálculo não são gravadas; numa revalidação, a entrada antiga continua valendo
+
+Gravado em SQLite em ~/.clintutor/insight_cache.db, compartilhado entre sessões e
+processos do servidor e preservado entre reinícios.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+INSIGHT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".clintutor", "insight_cache.db")
+DEFAULT_TTL_SECONDS = 24 * 3600
+# Depois disso a entrada não é mais servida nem como "stale" e é apagada
+STALE_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+
+def samples_fingerprint(samples: Any) -> str:
+    """Hash estável das amostras (listas/dicts serializáveis em JSON)."""
+    raw = json.dumps(samples, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class InsightCache:
+    """Entradas em SQLite, indexadas pela chave e pela função que as gerou."""
+
+    def __init__(self, db_path: str = INSIGHT_CACHE_PATH):
+        self.db_path = db_path
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self._revalidating = set()
+
+    @contextmanager
+    def _transaction(self):
+        if not self._schema_ready:
+            self._create_schema()
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _create_schema(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS insights (
+                    key TEXT PRIMARY KEY,
+                    function TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_insights_function ON insights (function)")
+            conn.execute("DELETE FROM insights WHERE expires_at <= ?", (time.time() - STALE_MAX_AGE_SECONDS,))
+        finally:
+            conn.close()
+        self._schema_ready = True
+
+    @staticmethod
+    def make_key(function: str, model: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{function}|{model}|{fingerprint}".encode("utf-8")).hexdigest()
+
+    def _load(self, key: str) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value, created_at, expires_at FROM insights WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        return {'value': json.loads(row[0]), 'created_at': row[1], 'expires_at': row[2]}
+
+    def _store(self, key: str, function: str, model: str, fingerprint: str, value: Any, ttl: float):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO insights VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, function, model, fingerprint, json.dumps(value, ensure_ascii=False), now, now + ttl)
+            )
+
+    def _compute_and_store(self, key: str, function: str, model: str, fingerprint: str,
+                           compute: Callable[[], Any], ttl: float) -> Any:
+        value = compute()
+        self._store(key, function, model, fingerprint, value, ttl)
+        return value
+
+    def _revalidate_in_background(self, key: str, function: str, model: str, fingerprint: str,
+                                  compute: Callable[[], Any], ttl: float):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def worker():
+            try:
+                self._compute_and_store(key, function, model, fingerprint, compute, ttl)
+            except Exception as e:
+                print(f"INSIGHT CACHE: revalidação de {function} falhou, mantendo valor anterior: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=worker, name=f"insight-revalidate-{function}", daemon=True).start()
+
+    def get_or_compute(self, function: str, model: str, samples: Any, compute: Callable[[], Any],
+                       ttl: float = DEFAULT_TTL_SECONDS, refresh: bool = False) -> Any:
+        """
+        Valor do cache para (função, modelo, amostras), calculando com `compute()` se preciso.
+        Exceções de `compute` propagam quando ele roda na hora (sem entrada ou refresh=True).
+        """
+        fingerprint = samples_fingerprint(samples)
+        key = self.make_key(function, model, fingerprint)
+        if not refresh:
+            try:
+                entry = self._load(key)
+            except sqlite3.Error as e:
+                print(f"INSIGHT CACHE: leitura falhou ({e}), calculando sem cache")
+                return compute()
+            now = time.time()
+            if entry is not None and now - entry['expires_at'] < STALE_MAX_AGE_SECONDS:
+                if now >= entry['expires_at']:
+                    self._revalidate_in_background(key, function, model, fingerprint, compute, ttl)
+                return entry['value']
+        return self._compute_and_store(key, function, model, fingerprint, compute, ttl)
+
+    def invalidate(self, function: str = None) -> int:
+        """Apaga as entradas de uma função (ou todas). Retorna quantas foram apagadas."""
+        with self._transaction() as conn:
+            if function:
+                return conn.execute("DELETE FROM insights WHERE function = ?", (function,)).rowcount
+            return conn.execute("DELETE FROM insights").rowcount
+
+    def purge_expired(self) -> int:
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM insights WHERE expires_at <= ?", (time.time() - STALE_MAX_AGE_SECONDS,)
+            ).rowcount
+
+    def stats(self) -> List[Dict]:
+        """Entradas por função: total, válidas e vencidas (servidas enquanto revalidam)."""
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute("""
+                SELECT function, model, COUNT(*), SUM(expires_at > ?), MAX(created_at)
+                FROM insights GROUP BY function, model ORDER BY function
+            """, (now,)).fetchall()
+        return [
+            {'function': f, 'model': m, 'entries': n, 'fresh': fresh or 0, 'stale': n - (fresh or 0),
+             'last_update': last}
+            for f, m, n, fresh, last in rows
+        ]
+
+
+insight_cache = InsightCache()
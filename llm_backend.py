@@ -0,0 +1,61 @@
+"""
+Backend do LLM usado por logic.get_groq_client().
+
+- "groq" (padrão): API real do Groq, com as chaves de [groq_api]
+- "fake": servidor local compatível com a API do Groq/OpenAI
+  (scripts/fake_llm_server.py), determinístico, para testes de carga sem gastar cota
+
+Seleção por variável de ambiente ou `.streamlit/secrets.toml`:
+
+    CLINTUTOR_LLM_BACKEND=fake
+    CLINTUTOR_LLM_BASE_URL=http://127.0.0.1:8765
+
+    [llm]
+    backend = "fake"
+    base_url = "http://127.0.0.1:8765"
+"""
+
+import os
+import streamlit as st
+from typing import Dict, Optional
+
+from groq import Groq
+
+DEFAULT_FAKE_BASE_URL = "http://127.0.0.1:8765"
+FAKE_API_KEY = "fake-local-key"
+
+
+def get_backend_settings() -> Dict[str, Optional[str]]:
+    """{'backend': 'groq'|'fake', 'base_url': url ou None}"""
+    backend = os.environ.get('CLINTUTOR_LLM_BACKEND', '').strip().lower()
+    base_url = os.environ.get('CLINTUTOR_LLM_BASE_URL') or None
+    if not backend:
+        try:
+            if 'llm' in st.secrets:
+                backend = str(st.secrets['llm'].get('backend', '')).strip().lower()
+                base_url = base_url or st.secrets['llm'].get('base_url')
+        except Exception:
+            pass
+    backend = backend or 'groq'
+    if backend == 'fake':
+        base_url = base_url or DEFAULT_FAKE_BASE_URL
+    return {'backend': backend, 'base_url': base_url}
+
+
+def is_fake_backend() -> bool:
+    return get_backend_settings()['backend'] == 'fake'
+
+
+def make_client(api_key: Optional[str]) -> Optional[Groq]:
+    """
+    Cria o cliente do backend configurado. O servidor fake fala o mesmo protocolo
+    do Groq, então o SDK (streaming, retries, erros) é exercitado de verdade.
+    """
+    settings = get_backend_settings()
+    if settings['backend'] == 'fake':
+        return Groq(api_key=api_key or FAKE_API_KEY, base_url=settings['base_url'])
+    if not api_key:
+        return None
+    if settings['base_url']:
+        return Groq(api_key=api_key, base_url=settings['base_url'])
+    return Groq(api_key=api_key)
@@ -0,0 +1,267 @@
+"""
+Telemetria das chamadas ao LLM (Groq ou servidor fake).
+
+Cada chamada lógica de uma funcionalidade (chat do tutor, insights do professor...)
+vira um registro com modelo, chave usada, tokens de prompt/resposta, tempo até o
+primeiro token (streaming), latência total, tentativas e erros. Os registros das
+últimas 24h ficam num buffer do processo e são agregados por funcionalidade e por
+chave na aba "Uso da IA" do painel do admin.
+
+Uso nas funções do logic.py:
+
+    with llm_call("category_insights", MODEL_NAME) as call:
+        for attempt in range(max_retries):
+            client = get_groq_client()
+            call.attempt(client)
+            try:
+                res = client.chat.completions.create(...)
+                call.success(res.usage)
+                ...
+            except Exception as e:
+                call.failure(e)
+"""
+
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+WINDOW_SECONDS = 24 * 3600
+MAX_RECORDS = 5000
+
+# Preço de referência em US$ por 1M de tokens (entrada, saída); conferir no console do Groq
+MODEL_PRICES_USD_PER_MTOK = {
+    "openai/gpt-oss-20b": (0.075, 0.30),
+    "openai/gpt-oss-120b": (0.15, 0.60),
+    "qwen/qwen3-32b": (0.29, 0.59),
+    "qwen/qwen3.6-27b": (0.29, 0.59),
+}
+
+
+def mask_api_key(key: Optional[str]) -> str:
+    """Identificador seguro da chave para logs e relatórios."""
+    if not key:
+        return "sem chave"
+    if len(key) <= 12:
+        return key
+    return key[:4] + "..." + key[-5:]
+
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    price = MODEL_PRICES_USD_PER_MTOK.get(model)
+    if price is None:
+        return None
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+def _usage_tokens(usage) -> Optional[tuple]:
+    """(prompt, completion) de um objeto usage do SDK ou de um dict; None se ausente."""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return int(usage.get('prompt_tokens') or 0), int(usage.get('completion_tokens') or 0)
+    return int(getattr(usage, 'prompt_tokens', 0) or 0), int(getattr(usage, 'completion_tokens', 0) or 0)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class LLMTelemetry:
+    """Buffer circular thread-safe com os registros das últimas 24h."""
+
+    def __init__(self, window_seconds: int = WINDOW_SECONDS, max_records: int = MAX_RECORDS):
+        self._lock = threading.Lock()
+        self.window_seconds = window_seconds
+        self._records: deque = deque(maxlen=max_records)
+
+    def add(self, record: Dict):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> List[Dict]:
+        """Registros dentro da janela, do mais antigo ao mais recente."""
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            while self._records and self._records[0]['ts'] < cutoff:
+                self._records.popleft()
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    # ------------------------------------------------------------------
+    # Relatórios
+    # ------------------------------------------------------------------
+
+    def feature_table(self) -> List[Dict]:
+        """Uma linha por funcionalidade, com tokens, custo e percentis de latência."""
+        groups: Dict[str, List[Dict]] = {}
+        for r in self.records():
+            groups.setdefault(r['feature'], []).append(r)
+
+        rows = []
+        for feature, recs in groups.items():
+            ok = [r for r in recs if r['status'] == 'ok']
+            ttfts = [r['ttft_ms'] for r in ok if r['ttft_ms'] is not None]
+            costs = [r['cost_usd'] for r in recs if r['cost_usd'] is not None]
+            rows.append({
+                'feature': feature,
+                'models': ", ".join(sorted({r['model'] for r in recs})),
+                'calls': len(recs),
+                'errors': sum(1 for r in recs if r['status'] == 'error'),
+                'retries': sum(len(r['attempts']) - 1 for r in recs),
+                'prompt_tokens': sum(r['prompt_tokens'] for r in recs),
+                'completion_tokens': sum(r['completion_tokens'] for r in recs),
+                'ttft_p50_ms': _percentile(ttfts, 0.50),
+                'ttft_p95_ms': _percentile(ttfts, 0.95),
+                'latency_p50_ms': _percentile([r['latency_ms'] for r in ok], 0.50),
+                'latency_p95_ms': _percentile([r['latency_ms'] for r in ok], 0.95),
+                'cost_usd': sum(costs) if costs else None,
+            })
+        return sorted(rows, key=lambda r: -(r['prompt_tokens'] + r['completion_tokens']))
+
+    def key_table(self) -> List[Dict]:
+        """
+        Uma linha por chave. Tentativas e erros contam cada tentativa (uma chamada
+        pode passar por várias chaves); tokens e custo vão para a última chave usada.
+        """
+        rows: Dict[str, Dict] = {}
+
+        def row_for(key):
+            return rows.setdefault(key, {'key': key, 'attempts': 0, 'errors': 0, 'rate_limited': 0,
+                                         'calls_ok': 0, 'tokens': 0, 'cost_usd': 0.0})
+
+        for r in self.records():
+            for attempt in r['attempts']:
+                row = row_for(attempt['key'])
+                row['attempts'] += 1
+                if attempt['error']:
+                    row['errors'] += 1
+                    if attempt['status_code'] == 429:
+                        row['rate_limited'] += 1
+            if r['status'] == 'ok':
+                row_for(r['key'])['calls_ok'] += 1
+            row = row_for(r['key'])
+            row['tokens'] += r['prompt_tokens'] + r['completion_tokens']
+            row['cost_usd'] += r['cost_usd'] or 0.0
+        return sorted(rows.values(), key=lambda r: -r['attempts'])
+
+    def totals(self) -> Dict:
+        recs = self.records()
+        costs = [r['cost_usd'] for r in recs if r['cost_usd'] is not None]
+        return {
+            'calls': len(recs),
+            'errors': sum(1 for r in recs if r['status'] == 'error'),
+            'tokens': sum(r['prompt_tokens'] + r['completion_tokens'] for r in recs),
+            'cost_usd': sum(costs),
+        }
+
+
+telemetry = LLMTelemetry()
+
+
+class llm_call:
+    """
+    Registra uma chamada lógica ao LLM (todas as tentativas). Só entra no buffer
+    se ao menos uma requisição foi feita.
+    """
+
+    def __init__(self, feature: str, model: str, stream: bool = False):
+        self.feature = feature
+        self.model = model
+        self.stream = stream
+        self.attempts: List[Dict] = []
+        self.key: Optional[str] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.usage_estimated = False
+        self.chunks = 0
+        self.status = 'error'
+        self._t0 = 0.0
+        self._attempt_t0 = 0.0
+        self._ttft_ms: Optional[float] = None
+
+    def __enter__(self) -> 'llm_call':
+        self._t0 = time.perf_counter()
+        return self
+
+    def attempt(self, client):
+        """Início de uma tentativa com o cliente (e a chave) sorteado."""
+        self.key = mask_api_key(getattr(client, 'api_key', None))
+        self.attempts.append({'key': self.key, 'error': None, 'status_code': None})
+        self._attempt_t0 = time.perf_counter()
+        self._ttft_ms = None
+        self.chunks = 0
+
+    def token(self):
+        """Um pedaço de texto recebido no streaming."""
+        if self._ttft_ms is None:
+            self._ttft_ms = (time.perf_counter() - self._attempt_t0) * 1000
+        self.chunks += 1
+
+    def _bill(self, usage):
+        """Soma os tokens da tentativa; sem usage, cada pedaço do stream conta como um token."""
+        tokens = _usage_tokens(usage)
+        if tokens is None:
+            tokens = (0, self.chunks)
+            self.usage_estimated = True
+        self.prompt_tokens += tokens[0]
+        self.completion_tokens += tokens[1]
+        self.chunks = 0
+
+    def success(self, usage=None):
+        """Resposta recebida (os tokens contam mesmo se o pós-processamento falhar depois)."""
+        self._bill(usage)
+        self.status = 'ok'
+
+    def failure(self, exc: BaseException):
+        if not self.attempts:
+            return
+        self.attempts[-1]['error'] = type(exc).__name__
+        self.attempts[-1]['status_code'] = getattr(exc, 'status_code', None)
+        self.status = 'error'
+        if self.chunks:
+            # Stream interrompido no meio: o que chegou foi gerado (e cobrado)
+            self._bill(None)
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.attempts:
+            return False
+        if exc_type is GeneratorExit:
+            # Streaming abandonado pelo consumidor (ex: novo rerun no meio da resposta)
+            self._bill(None)
+            self.status = 'interrupted'
+        elif exc_type is not None:
+            self.failure(exc)
+
+        telemetry.add({
+            'ts': time.time(),
+            'at': datetime.now().isoformat(),
+            'feature': self.feature,
+            'model': self.model,
+            'key': self.key,
+            'stream': self.stream,
+            'status': self.status,
+            'error': next((a['error'] for a in reversed(self.attempts) if a['error']), None),
+            'attempts': self.attempts,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'usage_estimated': self.usage_estimated,
+            'ttft_ms': self._ttft_ms if self.stream else None,
+            'latency_ms': (time.perf_counter() - self._t0) * 1000,
+            'cost_usd': estimate_cost_usd(self.model, self.prompt_tokens, self.completion_tokens),
+        })
+        return False
+
+
+def stream_usage(chunk):
+    """Usage enviado no último chunk do streaming do Groq (x_groq.usage), se houver."""
+    x_groq = getattr(chunk, 'x_groq', None)
+    usage = getattr(x_groq, 'usage', None) if x_groq is not None else None
+    return usage or getattr(chunk, 'usage', None)
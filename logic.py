@@ -1,10 +1,15 @@
 import os
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Any, Generator
 import random
-from groq import Groq
+from llm_backend import make_client, is_fake_backend
+from profiling import profiled
+from llm_telemetry import llm_call, mask_api_key, stream_usage
+from insight_cache import insight_cache
 import streamlit as st  
 import numpy as np
 
@@ -58,12 +63,14 @@ if not GROQ_API_KEYS:
         print(f"Erro no Fallback st.secrets: {e}")
 
 def get_groq_client():
+    """Cliente do backend configurado (Groq real ou servidor fake local, ver llm_backend.py)"""
+    if is_fake_backend():
+        return make_client(None)
     if not GROQ_API_KEYS:
         return None
     key = random.choice(GROQ_API_KEYS)
-    safe_key = key[:10] + "..." + key[-5:]
-    print(f"[IA LOGGER] Requisição enviada. Usando chave Groq: {safe_key}", flush=True)
-    return Groq(api_key=key)
+    print(f"[IA LOGGER] Requisição enviada. Usando chave Groq: {mask_api_key(key)}", flush=True)
+    return make_client(key)
 
 # Modelo Padrão do Groq (para chat socrático rápido e previews)
 MODEL_NAME = "openai/gpt-oss-20b"
@@ -1377,6 +1384,7 @@ def pick_new_case(level: int = 1, used_cases: List[str] = None, current_difficul
     """Função compatível com a assinatura anterior."""
     return pick_adaptive_case(current_difficulty=current_difficulty, used_cases=used_cases, topic_filter=topic_filter)
 
+@profiled("storage")
 def get_case(cid: str) -> Dict[str, Any]:
     """Busca questão por ID."""
     for q in QUESTIONS:
@@ -1447,6 +1455,7 @@ def evaluate_mcq_answer(question: Dict[str, Any], selected_option: str) -> Dict[
         "feedback": feedback_text
     }
 
+@profiled("llm")
 def evaluate_answer_with_ai(question_data: Dict, user_answer: str) -> Dict[str, Any]:
     """Fallback para compatibilidade: se user_answer for uma letra (A, B, C, D), avalia diretamente."""
     clean_ans = user_answer.strip().upper()
@@ -1465,10 +1474,17 @@ def evaluate_answer_with_ai(question_data: Dict, user_answer: str) -> Dict[str,
             "feedback": f"Resposta processada. Gabarito oficial: {gabarito}."
         }
 
-def finalize_question_response(question: Dict[str, Any], user_answer: str, evaluation_result: Dict[str, Any]) -> Dict[str, Any]:
-    """Registra a conclusão da questão e formata o resultado final."""
+def finalize_question_response(question: Dict[str, Any], user_answer: str, evaluation_result: Dict[str, Any], attempt: int = 1) -> Dict[str, Any]:
+    """
+    Registra a conclusão da questão e formata o resultado final.
+    A alternativa marcada, o gabarito e o número da tentativa vão como campos próprios
+    para a análise de distratores não precisar interpretar o texto de user_answer.
+    """
     return {
         "user_answer": user_answer,
+        "selected_option": evaluation_result.get("selected_option"),
+        "correct_option": evaluation_result.get("correct_option", question.get("gabarito")),
+        "attempt": int(attempt),
         "points_gained": evaluation_result.get("points_gained", 0),
         "is_correct": evaluation_result.get("is_correct", False),
         "is_partial": evaluation_result.get("is_partial", False),
@@ -1480,6 +1496,7 @@ def finalize_question_response(question: Dict[str, Any], user_answer: str, evalu
 # =============================
 # TUTOR SOCRÁTICO HELIX.AI (COM REGRA DE 4 INSISTÊNCIAS)
 # =============================
+@profiled("llm")
 def tutor_reply_com_ia(
     question: Dict[str, Any], 
     user_msg: str, 
@@ -1562,29 +1579,36 @@ DIRETRIZES PEDAGÓGICAS:
         
     import time
     max_retries = 3
-    for attempt in range(max_retries):
-        client = get_groq_client()
-        if not client:
-            yield "Erro: Cliente IA não configurado."
-            return
-            
-        try:
-            stream = client.chat.completions.create(
-                model=MODEL_NAME, 
-                messages=messages,
-                temperature=0.2,
-                stream=True
-            )
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-            return 
-        except Exception as e:
-            print(f"[Tutor Chat] Tentativa {attempt+1}/{max_retries} falhou: {e}")
-            if attempt == max_retries - 1:
-                yield f"Erro ao comunicar com a IA: {e}"
+    with llm_call("tutor_chat", MODEL_NAME, stream=True) as call:
+        for attempt in range(max_retries):
+            client = get_groq_client()
+            if not client:
+                yield "Erro: Cliente IA não configurado."
                 return
-            time.sleep(1)
+            
+            call.attempt(client)
+            try:
+                stream = client.chat.completions.create(
+                    model=MODEL_NAME, 
+                    messages=messages,
+                    temperature=0.2,
+                    stream=True
+                )
+                usage = None
+                for chunk in stream:
+                    usage = stream_usage(chunk) or usage
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        call.token()
+                        yield chunk.choices[0].delta.content
+                call.success(usage)
+                return 
+            except Exception as e:
+                call.failure(e)
+                print(f"[Tutor Chat] Tentativa {attempt+1}/{max_retries} falhou: {e}")
+                if attempt == max_retries - 1:
+                    yield f"Erro ao comunicar com a IA: {e}"
+                    return
+                time.sleep(1)
 
 # =============================
 # PERSISTÊNCIA & GAMIFICAÇÃO
@@ -1631,77 +1655,173 @@ def correct_exam_name(n): return n, False
 def normalize_exam_name(n): return n
 def suggest_exam_corrections(n, a): return ""
 
-def generate_category_insights(category_name: str, sample_answers: List[str]) -> str:
-    answers_str = "\n".join([f"- \"{ans}\"" for ans in sample_answers[:5]])
-    prompt = f"""Você é um coordenador pedagógico. Analise o desempenho dos alunos no tópico '{category_name}'.
-Amostras:
-{answers_str if sample_answers else "Sem amostras suficientes."}
+# Amostras por tópico enviadas à IA e orçamento de caracteres por requisição;
+# acima do orçamento os tópicos são divididos em requisições paralelas
+INSIGHT_SAMPLES_PER_TOPIC = 5
+INSIGHT_BATCH_MAX_CHARS = 12000
+INSIGHT_MAX_CONCURRENCY = 4
+INSIGHT_NO_CLIENT = {"insight": "Assistente não configurado.", "preview": "Assistente não configurado."}
+INSIGHT_UNAVAILABLE = {"insight": "Análise temporariamente indisponível.", "preview": "Erro ao gerar preview."}
 
-Escreva 2 a 3 frases sintetizando as principais dificuldades conceituais observadas."""
 
-    import time
-    max_retries = 2
-    for attempt in range(max_retries):
-        client = get_groq_client()
-        if not client: return "Assistente não configurado."
-        try:
-            res = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            return res.choices[0].message.content.strip()
-        except:
-            if attempt == max_retries - 1: return "Análise temporariamente indisponível."
-            time.sleep(1)
+class LLMNotConfigured(Exception):
+    """Nenhum cliente de IA disponível (sem chaves do Groq e sem backend fake)."""
+
+
+def _split_insight_batches(samples_by_topic: Dict[str, List[str]]) -> List[Dict[str, List[str]]]:
+    """Agrupa os tópicos em lotes que cabem em INSIGHT_BATCH_MAX_CHARS (ao menos um tópico por lote)."""
+    batches, current, size = [], {}, 0
+    for topic, samples in samples_by_topic.items():
+        topic_size = len(topic) + sum(len(s) for s in samples)
+        if current and size + topic_size > INSIGHT_BATCH_MAX_CHARS:
+            batches.append(current)
+            current, size = {}, 0
+        current[topic] = samples
+        size += topic_size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _request_insight_batch(batch: Dict[str, List[str]]) -> Dict[str, Dict[str, str]]:
+    """
+    Uma requisição para todos os tópicos do lote. Levanta exceção se a resposta não
+    trouxer insight e preview de todos os tópicos (nada parcial é gravado no cache).
+    """
+    # Rótulos curtos no JSON: os nomes dos tópicos são longos e têm caracteres especiais
+    labels = {f"t{i + 1}": topic for i, topic in enumerate(batch)}
+    blocks = []
+    for label, topic in labels.items():
+        samples = batch[topic]
+        answers_str = "\n".join([f"- \"{ans}\"" for ans in samples]) if samples else "Sem amostras suficientes."
+        blocks.append(f"[{label}] Tópico '{topic}':\n{answers_str}")
+    prompt = f"""Você é um coordenador pedagógico. Analise o desempenho dos alunos em cada tópico abaixo.
+
+{chr(10).join(blocks)}
+
+Para cada tópico, escreva:
+- "insight": 2 a 3 frases sintetizando as principais dificuldades conceituais observadas
+- "preview": UMA frase curta e direta com a principal dúvida dos alunos
+
+Retorne estritamente um JSON no formato {{"t1": {{"insight": "...", "preview": "..."}}, ...}} com as chaves {json.dumps(list(labels))}."""
 
-def generate_difficulty_preview(category_name: str, sample_answers: List[str]) -> str:
-    answers_str = "\n".join([f"- \"{ans}\"" for ans in sample_answers[:5]])
-    prompt = f"""Resuma em UMA frase curta e direta a principal dúvida dos alunos no tópico '{category_name}':
-{answers_str if sample_answers else "Nenhuma amostra disponível."}"""
-    import time
     max_retries = 2
-    for attempt in range(max_retries):
-        client = get_groq_client()
-        if not client: return "Assistente não configurado."
+    with llm_call("class_insights", MODEL_NAME) as call:
+        for attempt in range(max_retries):
+            client = get_groq_client()
+            if not client:
+                raise LLMNotConfigured()
+            call.attempt(client)
+            try:
+                res = client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.3,
+                    max_tokens=400 * len(batch) + 200
+                )
+                call.success(res.usage)
+                data = _extract_json(res.choices[0].message.content.strip())
+                result = {}
+                for label, topic in labels.items():
+                    item = data.get(label) if isinstance(data, dict) else None
+                    if not isinstance(item, dict) or not item.get("insight") or not item.get("preview"):
+                        # Resposta incompleta não vai para o cache: tenta de novo ou falha o lote
+                        raise ValueError(f"tópico {label} ausente ou incompleto na resposta da IA")
+                    result[topic] = {
+                        "insight": str(item["insight"]).strip(),
+                        "preview": str(item["preview"]).strip(),
+                    }
+                return result
+            except Exception as e:
+                call.failure(e)
+                if attempt == max_retries - 1:
+                    raise
+                time.sleep(1)
+
+
+@profiled("llm")
+def generate_class_insights(samples_by_topic: Dict[str, List[str]], refresh: bool = False) -> Dict[str, Dict[str, str]]:
+    """
+    Insight (2-3 frases) e preview (1 frase) de todos os tópicos numa única ida à IA.
+    Retorna {tópico: {"insight": ..., "preview": ...}}.
+
+    Se as amostras não couberem numa requisição, os lotes vão em paralelo. Cada lote
+    fica no insight_cache pelo hash das suas amostras: atualizar os insights sem
+    respostas novas não chama a IA. refresh=True ignora o cache.
+    """
+    trimmed = {topic: [str(s) for s in (samples or [])[:INSIGHT_SAMPLES_PER_TOPIC]]
+               for topic, samples in samples_by_topic.items()}
+
+    def run(batch):
         try:
-            res = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=100
-            )
-            return res.choices[0].message.content.strip()
-        except:
-            if attempt == max_retries - 1: return "Erro ao gerar preview."
-            time.sleep(1)
+            return insight_cache.get_or_compute("class_insights", MODEL_NAME, batch,
+                                                lambda: _request_insight_batch(batch), refresh=refresh)
+        except LLMNotConfigured:
+            return {topic: dict(INSIGHT_NO_CLIENT) for topic in batch}
+        except Exception as e:
+            print(f"[Insights] Lote com {len(batch)} tópicos falhou: {e}")
+            return {topic: dict(INSIGHT_UNAVAILABLE) for topic in batch}
 
-def generate_ai_usage_preview(chat_samples: List[str]) -> str:
-    chat_str = "\n".join([f"- Aluno: \"{ans}\"" for ans in chat_samples[:10]])
+    batches = _split_insight_batches(trimmed)
+    results: Dict[str, Dict[str, str]] = {}
+    if len(batches) == 1:
+        results.update(run(batches[0]))
+    elif batches:
+        with ThreadPoolExecutor(max_workers=min(len(batches), INSIGHT_MAX_CONCURRENCY)) as pool:
+            for batch_result in pool.map(run, batches):
+                results.update(batch_result)
+    return results
+
+
+def generate_category_insights(category_name: str, sample_answers: List[str], refresh: bool = False) -> str:
+    return generate_class_insights({category_name: sample_answers}, refresh)[category_name]["insight"]
+
+
+def generate_difficulty_preview(category_name: str, sample_answers: List[str], refresh: bool = False) -> str:
+    # Mesmo lote (e mesma entrada do cache) de generate_category_insights: não gera nova requisição
+    return generate_class_insights({category_name: sample_answers}, refresh)[category_name]["preview"]
+
+
+def _request_ai_usage_preview(samples: List[str]) -> str:
+    chat_str = "\n".join([f"- Aluno: \"{ans}\"" for ans in samples])
     prompt = f"""Escreva UMA frase curta resumindo como os alunos estão usando o tutor IA:
-{chat_str if chat_samples else "Nenhuma interação registrada."}"""
-    import time
+{chat_str if samples else "Nenhuma interação registrada."}"""
     max_retries = 2
-    for attempt in range(max_retries):
-        client = get_groq_client()
-        if not client: return "Assistente não configurado."
-        try:
-            res = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=100
-            )
-            return res.choices[0].message.content.strip()
-        except:
-            if attempt == max_retries - 1: return "Erro ao gerar preview."
-            time.sleep(1)
+    with llm_call("ai_usage_preview", MODEL_NAME) as call:
+        for attempt in range(max_retries):
+            client = get_groq_client()
+            if not client:
+                raise LLMNotConfigured()
+            call.attempt(client)
+            try:
+                res = client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.2,
+                    max_tokens=100
+                )
+                call.success(res.usage)
+                return res.choices[0].message.content.strip()
+            except Exception as e:
+                call.failure(e)
+                if attempt == max_retries - 1:
+                    raise
+                time.sleep(1)
 
-def generate_class_criteria_analysis(answers_list: List[str]) -> Dict[str, str]:
-    default_resp = {f"{k} — {v}": "Sem dados suficientes para análise profunda." for k, v in TOPICS.items()}
-    if not answers_list:
-        return default_resp
-    answers_str = "\n\n".join([f"Resposta do Aluno {i+1}:\n\"{ans}\"" for i, ans in enumerate(answers_list[:20])])
+@profiled("llm")
+def generate_ai_usage_preview(chat_samples: List[str], refresh: bool = False) -> str:
+    samples = [str(s) for s in chat_samples[:10]]
+    try:
+        return insight_cache.get_or_compute("ai_usage_preview", MODEL_NAME, samples,
+                                            lambda: _request_ai_usage_preview(samples), refresh=refresh)
+    except LLMNotConfigured:
+        return "Assistente não configurado."
+    except Exception:
+        return "Erro ao gerar preview."
+
+
+def _request_class_criteria_analysis(answers: List[str]) -> Dict[str, str]:
+    answers_str = "\n\n".join([f"Resposta do Aluno {i+1}:\n\"{ans}\"" for i, ans in enumerate(answers)])
     prompt = f"""Analise as respostas dos alunos sobre Transporte e Membranas Biológicas e retorne um JSON com os 8 tópicos:
 {json.dumps(list(TOPICS.keys()))}
 
@@ -1709,19 +1829,41 @@ Respostas:
 {answers_str}
 
 Retorne estritamente um JSON com as chaves correspondentes aos 8 tópicos."""
-    import time
-    for attempt in range(3):
-        client = get_groq_client()
-        if not client: return default_resp
-        try:
-            res = client.chat.completions.create(
-                model=EVAL_MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=4096
-            )
-            text = res.choices[0].message.content.strip()
-            return _extract_json(text)
-        except Exception as e:
-            if attempt == 2: return default_resp
-            time.sleep(1)
+    with llm_call("class_criteria_analysis", EVAL_MODEL_NAME) as call:
+        for attempt in range(3):
+            client = get_groq_client()
+            if not client:
+                raise LLMNotConfigured()
+            call.attempt(client)
+            try:
+                res = client.chat.completions.create(
+                    model=EVAL_MODEL_NAME,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.3,
+                    max_tokens=4096
+                )
+                call.success(res.usage)
+                text = res.choices[0].message.content.strip()
+                return _extract_json(text)
+            except Exception as e:
+                call.failure(e)
+                if attempt == 2:
+                    raise
+                time.sleep(1)
+
+@profiled("llm")
+def generate_class_criteria_analysis(answers_list: List[str], refresh: bool = False) -> Dict[str, str]:
+    """
+    Análise por tópico com o modelo analítico (caro). Fica no insight_cache pelo hash
+    das respostas: só roda de novo quando as respostas mudam, a entrada vence
+    (servida enquanto revalida em segundo plano) ou com refresh=True.
+    """
+    default_resp = {f"{k} — {v}": "Sem dados suficientes para análise profunda." for k, v in TOPICS.items()}
+    if not answers_list:
+        return default_resp
+    answers = [str(a) for a in answers_list[:20]]
+    try:
+        return insight_cache.get_or_compute("class_criteria_analysis", EVAL_MODEL_NAME, answers,
+                                            lambda: _request_class_criteria_analysis(answers), refresh=refresh)
+    except Exception:
+        return default_resp
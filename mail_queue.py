@@ -0,0 +1,227 @@
+"""
+Fila de envio de emails em segundo plano.
+
+O cadastro só enfileira a mensagem e retorna na hora; uma thread daemon envia
+pela mesma conexão SMTP enquanto houver mensagens (reconecta se o servidor
+derrubar), com novas tentativas em backoff exponencial. Mensagens que esgotam
+as tentativas vão para um arquivo de dead-letter (JSON por linha).
+
+Configuração em `.streamlit/secrets.toml` (host/porta opcionais, padrão Gmail):
+
+    [email_sender]
+    email = "clintutor.santacasa@gmail.com"
+    password = "senha-de-app"
+    smtp_host = "smtp.gmail.com"
+    smtp_port = 465
+
+Para testar contra um SMTP local (ex: `python -m aiosmtpd -n -l localhost:8025`),
+defina CLINTUTOR_SMTP_HOST=localhost e CLINTUTOR_SMTP_PORT=8025: sem TLS e sem login.
+"""
+
+import os
+import json
+import time
+import heapq
+import uuid
+import smtplib
+import ssl
+import threading
+import streamlit as st
+from datetime import datetime
+from email.message import Message
+from typing import Dict, List, Optional
+
+MAX_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 5.0
+# Conexão ociosa por mais que isso é fechada (o Gmail derruba em ~5 min)
+SMTP_IDLE_SECONDS = 60.0
+SMTP_TIMEOUT_SECONDS = 20.0
+
+DEAD_LETTER_PATH = os.path.join(os.path.expanduser("~"), ".clintutor", "mail_dead_letter.jsonl")
+
+
+def get_smtp_settings() -> Optional[Dict]:
+    """Host, porta, modo (ssl/starttls/plain) e credenciais; None se não configurado."""
+    env_host = os.environ.get('CLINTUTOR_SMTP_HOST')
+    if env_host:
+        return {
+            'host': env_host,
+            'port': int(os.environ.get('CLINTUTOR_SMTP_PORT', '25')),
+            'mode': os.environ.get('CLINTUTOR_SMTP_MODE', 'plain'),
+            'sender': os.environ.get('CLINTUTOR_SMTP_SENDER', 'clintutor@localhost'),
+            'username': os.environ.get('CLINTUTOR_SMTP_USER'),
+            'password': os.environ.get('CLINTUTOR_SMTP_PASSWORD'),
+        }
+    try:
+        if 'email_sender' not in st.secrets:
+            return None
+        conf = st.secrets['email_sender']
+        port = int(conf.get('smtp_port', 465))
+        return {
+            'host': conf.get('smtp_host', 'smtp.gmail.com'),
+            'port': port,
+            'mode': conf.get('smtp_mode', 'ssl' if port == 465 else 'starttls'),
+            'sender': conf['email'],
+            'username': conf['email'],
+            'password': conf['password'],
+        }
+    except Exception:
+        return None
+
+
+class MailQueue:
+    """Fila com agendamento (heap por horário de envio) e um único worker SMTP."""
+
+    def __init__(self, settings_provider=get_smtp_settings, dead_letter_path: str = DEAD_LETTER_PATH):
+        self._settings_provider = settings_provider
+        self.dead_letter_path = dead_letter_path
+        self._heap: List = []   # (due, seq, job)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._conn: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._busy = False
+        self.stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'dead': 0}
+        self._thread = threading.Thread(target=self._run, name="mail-queue", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def enqueue(self, msg: Message) -> str:
+        """Agenda o envio imediato da mensagem e retorna o id do job."""
+        job = {'id': uuid.uuid4().hex, 'msg': msg, 'attempts': 0, 'last_error': None}
+        self._schedule(job, time.time())
+        self.stats['enqueued'] += 1
+        return job['id']
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        """Aguarda a fila esvaziar (usado em scripts e testes)."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if not self.pending() and not self._busy:
+                return True
+            time.sleep(0.05)
+        return False
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def _schedule(self, job: Dict, due: float):
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (due, self._seq, job))
+            self._cond.notify()
+
+    def _next_job(self) -> Optional[Dict]:
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    self._busy = True
+                    return heapq.heappop(self._heap)[2]
+                wait = self._heap[0][0] - now if self._heap else SMTP_IDLE_SECONDS
+                if not self._heap and self._conn is not None and now - self._last_used >= SMTP_IDLE_SECONDS:
+                    return None
+                self._cond.wait(timeout=min(wait, SMTP_IDLE_SECONDS))
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._close()
+                continue
+            try:
+                self._send(job['msg'])
+                self.stats['sent'] += 1
+            except Exception as e:
+                self._close()
+                self._handle_failure(job, e)
+            finally:
+                self._busy = False
+
+    def _handle_failure(self, job: Dict, error: Exception):
+        job['attempts'] += 1
+        job['last_error'] = str(error)
+        if job['attempts'] < MAX_ATTEMPTS:
+            delay = RETRY_BASE_SECONDS * (2 ** (job['attempts'] - 1))
+            print(f"MAIL: falha ao enviar para {job['msg']['To']} ({error}); nova tentativa em {delay:.0f}s")
+            self.stats['retried'] += 1
+            self._schedule(job, time.time() + delay)
+            return
+        print(f"MAIL: desistindo de {job['msg']['To']} após {job['attempts']} tentativas: {error}")
+        self.stats['dead'] += 1
+        self._dead_letter(job)
+
+    def _dead_letter(self, job: Dict):
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter_path), exist_ok=True)
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    'id': job['id'],
+                    'to': job['msg']['To'],
+                    'subject': job['msg']['Subject'],
+                    'attempts': job['attempts'],
+                    'error': job['last_error'],
+                    'failed_at': datetime.now().isoformat(),
+                    'message': job['msg'].as_string(),
+                }, ensure_ascii=False) + '\n')
+        except Exception as e:
+            print(f"MAIL: erro ao gravar dead-letter: {e}")
+
+    # ------------------------------------------------------------------
+    # Conexão SMTP reaproveitada
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> smtplib.SMTP:
+        settings = self._settings_provider()
+        if not settings:
+            raise RuntimeError("Credenciais SMTP não configuradas")
+        if settings['mode'] == 'ssl':
+            conn = smtplib.SMTP_SSL(settings['host'], settings['port'], timeout=SMTP_TIMEOUT_SECONDS,
+                                    context=ssl.create_default_context())
+        else:
+            conn = smtplib.SMTP(settings['host'], settings['port'], timeout=SMTP_TIMEOUT_SECONDS)
+            if settings['mode'] == 'starttls':
+                conn.starttls(context=ssl.create_default_context())
+        if settings.get('username') and settings.get('password'):
+            conn.login(settings['username'], settings['password'])
+        self._sender = settings['sender']
+        return conn
+
+    def _send(self, msg: Message):
+        if self._conn is None:
+            self._conn = self._connect()
+        if not msg['From']:
+            msg['From'] = self._sender
+        try:
+            self._conn.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Servidor fechou a conexão ociosa: reconecta uma vez
+            self._conn = self._connect()
+            self._conn.send_message(msg)
+        self._last_used = time.time()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+
+@st.cache_resource(show_spinner=False)
+def get_mail_queue() -> MailQueue:
+    """Fila única por processo (compartilhada entre sessões)."""
+    return MailQueue()
+
+
+def smtp_configured() -> bool:
+    return get_smtp_settings() is not None
@@ -0,0 +1,181 @@
+"""
+Hash e verificação de senhas.
+
+- Novas senhas usam scrypt (hashlib, memory-hard) com salt aleatório:
+  "scrypt$<n>$<r>$<p>$<salt>$<hash>" (salt e hash em base64)
+- Hashes antigos (SHA-256 hex sem salt) continuam aceitos e são refeitos em
+  scrypt no próximo login bem-sucedido
+- As verificações rodam num pool limitado de threads, para que uma leva de
+  logins no início da aula não trave a thread do Streamlit nem esgote a CPU
+- Falhas seguidas por conta e por IP bloqueiam novas tentativas por alguns minutos
+"""
+
+import os
+import time
+import hmac
+import base64
+import hashlib
+import threading
+import streamlit as st
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Deque, Dict, Optional, Tuple
+
+# Parâmetros do scrypt: ~16 MB de memória e ~60 ms por verificação
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+SALT_BYTES = 16
+
+# Pool de verificação: hashlib.scrypt libera o GIL, então cada worker ocupa um núcleo
+VERIFY_WORKERS = max(2, min(4, os.cpu_count() or 2))
+# Verificações aguardando na fila antes de recusar com "servidor ocupado"
+MAX_PENDING_VERIFICATIONS = 200
+VERIFY_TIMEOUT_SECONDS = 10.0
+
+# Bloqueio após falhas seguidas (janela deslizante)
+MAX_FAILURES_PER_ACCOUNT = 5
+MAX_FAILURES_PER_IP = 20
+FAILURE_WINDOW_SECONDS = 15 * 60
+
+BUSY_MESSAGE = "Muitos acessos simultâneos. Tente novamente em alguns segundos."
+LOCKED_MESSAGE = "Muitas tentativas incorretas. Aguarde alguns minutos e tente novamente."
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=128 * r * (n + p + 2), dklen=dklen)
+
+
+def hash_password(password: str) -> str:
+    """Cria hash scrypt com salt aleatório"""
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P, SCRYPT_DKLEN)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_legacy_hash(stored_hash: str) -> bool:
+    """True para o formato antigo (SHA-256 hex sem salt)"""
+    return bool(stored_hash) and not stored_hash.startswith('scrypt$')
+
+
+def needs_rehash(stored_hash: str) -> bool:
+    """True se o hash é legado ou usa parâmetros diferentes dos atuais"""
+    if is_legacy_hash(stored_hash):
+        return True
+    try:
+        _, n, r, p, _, _ = stored_hash.split('$')
+        return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    except ValueError:
+        return True
+
+
+def verify_password(password: str, stored_hash: str) -> bool:
+    """Compara a senha com o hash salvo (scrypt ou SHA-256 legado) em tempo constante"""
+    if not stored_hash:
+        return False
+    if is_legacy_hash(stored_hash):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored_hash)
+    try:
+        _, n, r, p, salt, digest = stored_hash.split('$')
+        expected = base64.b64decode(digest)
+        computed = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p), len(expected))
+        return hmac.compare_digest(computed, expected)
+    except (ValueError, TypeError):
+        return False
+
+
+class LoginThrottle:
+    """Conta falhas recentes por chave (conta ou IP) numa janela deslizante."""
+
+    def __init__(self, max_failures: int, window_seconds: float = FAILURE_WINDOW_SECONDS):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._failures: Dict[str, Deque[float]] = {}
+
+    def _prune(self, key: str, now: float) -> Deque[float]:
+        failures = self._failures.get(key)
+        if failures is None:
+            return deque()
+        while failures and failures[0] <= now - self.window_seconds:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+        return failures
+
+    def is_blocked(self, key: str) -> bool:
+        if not key:
+            return False
+        with self._lock:
+            return len(self._prune(key, time.monotonic())) >= self.max_failures
+
+    def record_failure(self, key: str):
+        if not key:
+            return
+        with self._lock:
+            self._failures.setdefault(key, deque()).append(time.monotonic())
+
+    def reset(self, key: str):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+class PasswordVerifier:
+    """Executa verificações de senha num pool limitado, com fila máxima e throttling."""
+
+    def __init__(self, workers: int = VERIFY_WORKERS, max_pending: int = MAX_PENDING_VERIFICATIONS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-verify")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.accounts = LoginThrottle(MAX_FAILURES_PER_ACCOUNT)
+        self.ips = LoginThrottle(MAX_FAILURES_PER_IP)
+
+    def _submit(self, fn, *args):
+        """Roda fn no pool e aguarda; None se a fila estiver cheia ou estourar o tempo."""
+        if not self._slots.acquire(timeout=VERIFY_TIMEOUT_SECONDS):
+            return None
+        try:
+            return self._pool.submit(fn, *args).result(timeout=VERIFY_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            return None
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> Optional[str]:
+        return self._submit(hash_password, password)
+
+    def check(self, password: str, stored_hash: str, account: str = None,
+              client_ip: str = None) -> Tuple[bool, Optional[str], str]:
+        """
+        Verifica a senha de uma tentativa de login.
+        Retorna (ok, novo_hash, mensagem_de_erro): novo_hash vem preenchido quando o
+        hash salvo deve ser substituído (formato legado ou parâmetros antigos).
+        """
+        account = (account or '').lower().strip()
+        if self.accounts.is_blocked(account) or self.ips.is_blocked(client_ip):
+            return False, None, LOCKED_MESSAGE
+
+        ok = self._submit(verify_password, password, stored_hash)
+        if ok is None:
+            return False, None, BUSY_MESSAGE
+        if not ok:
+            self.accounts.record_failure(account)
+            self.ips.record_failure(client_ip)
+            return False, None, "Email ou senha incorretos"
+
+        self.accounts.reset(account)
+        new_hash = self.hash(password) if needs_rehash(stored_hash) else None
+        return True, new_hash, ""
+
+
+@st.cache_resource(show_spinner=False)
+def get_password_verifier() -> PasswordVerifier:
+    """Instância única por processo (pool compartilhado entre sessões)"""
+    return PasswordVerifier()
@@ -2,13 +2,16 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import time
 from datetime import datetime
 from typing import Dict, List, Any
 from io import BytesIO
 from fpdf import FPDF
 
 from analytics import (
-    get_all_users_analytics, format_duration
+    get_all_users_analytics, format_duration,
+    get_user_case_analytics_page, get_user_chat_interactions_page,
+    get_all_case_events, get_chat_message_counts, clear_history_page_caches
 )
 from auth_firebase import get_all_users, get_user_by_id
 from logic import QUESTIONS, TOPICS
@@ -16,9 +19,12 @@ from admin_utils import (
     reset_student_analytics, clear_student_chat_interactions,
     reset_all_students_analytics, clear_all_chat_interactions,
     reset_all_student_progress,
-    log_admin_action, get_database_stats
+    log_admin_action, get_database_stats, bulk_progress,
+    get_pending_bulk_jobs, resume_bulk_job, discard_bulk_job, BULK_JOB_LABELS
 )
 from ui_helpers import icon, metric_card
+from profiling import profiled
+from distractor_stats import get_distractor_stats
 
 TOPIC_KEYS = list(TOPICS.keys()) # ['T1', 'T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'T8']
 
@@ -44,11 +50,13 @@ def safe_pdf_str(text: Any) -> str:
 # =========================================================================
 # GERAÇÃO DE RELATÓRIO GERAL DA TURMA EM PDF (COM CHAT COMPLETO)
 # =========================================================================
-def generate_class_full_pdf(students: List[Dict], all_analytics: Dict, category_stats: Dict) -> bytes:
+def generate_class_full_pdf(students: List[Dict], all_analytics: Dict, category_stats: Dict,
+                            top_distractors: Dict = None) -> bytes:
     """
     Gera PDF completo e detalhado da turma com:
     - KPIs Gerais
     - Ranking de Desempenho por Categoria (T1 a T8)
+    - Distrator Mais Escolhido por Tópico (ver distractor_stats)
     - Desempenho por Aluno
     - Histórico Completo de Interações com o Tutor
     """
@@ -119,10 +127,46 @@ def generate_class_full_pdf(students: List[Dict], all_analytics: Dict, category_
         
     pdf.ln(6)
     
+    # ── DISTRATOR MAIS ESCOLHIDO POR TÓPICO ──
+    pdf.set_text_color(16, 185, 129)
+    pdf.set_font('Helvetica', 'B', 16)
+    pdf.cell(0, 10, '2. Distrator Mais Escolhido por Topico', ln=True)
+    pdf.set_text_color(0, 0, 0)
+    pdf.ln(2)
+    
+    if top_distractors:
+        pdf.set_font('Helvetica', 'B', 9)
+        pdf.set_fill_color(241, 245, 249)
+        pdf.cell(20, 8, 'Topico', 1, 0, 'C', True)
+        pdf.cell(30, 8, 'Questao', 1, 0, 'C', True)
+        pdf.cell(25, 8, 'Alternativa', 1, 0, 'C', True)
+        pdf.cell(25, 8, 'Escolhas', 1, 0, 'C', True)
+        pdf.cell(30, 8, '% dos Erros', 1, 0, 'C', True)
+        pdf.cell(25, 8, '1a Tentativa', 1, 0, 'C', True)
+        pdf.cell(25, 8, 'Tempo Medio', 1, 0, 'C', True)
+        pdf.ln()
+        
+        pdf.set_font('Helvetica', '', 8)
+        for tk in sorted(top_distractors):
+            d = top_distractors[tk]
+            pdf.cell(20, 7, d['topico_id'], 1, 0, 'C')
+            pdf.cell(30, 7, safe_pdf_str(d['codigo']), 1, 0, 'C')
+            pdf.cell(25, 7, d['option'], 1, 0, 'C')
+            pdf.cell(25, 7, str(d['count']), 1, 0, 'C')
+            pdf.cell(30, 7, f"{d['share_of_errors'] * 100:.1f}% ({d['count']}/{d['topic_errors']})", 1, 0, 'C')
+            pdf.cell(25, 7, str(d['first_attempt']), 1, 0, 'C')
+            pdf.cell(25, 7, format_duration(d['avg_seconds']), 1, 0, 'C')
+            pdf.ln()
+    else:
+        pdf.set_font('Helvetica', 'I', 10)
+        pdf.cell(0, 8, 'Nenhum erro registrado para a turma ate o momento.', ln=True)
+        
+    pdf.ln(6)
+    
     # ── PÁGINA 3: RESUMO DE DESEMPENHO DOS ALUNOS ──
     pdf.set_text_color(16, 185, 129)
     pdf.set_font('Helvetica', 'B', 16)
-    pdf.cell(0, 10, '2. Desempenho Geral por Aluno', ln=True)
+    pdf.cell(0, 10, '3. Desempenho Geral por Aluno', ln=True)
     pdf.set_text_color(0, 0, 0)
     pdf.ln(2)
     
@@ -158,7 +202,7 @@ def generate_class_full_pdf(students: List[Dict], all_analytics: Dict, category_
     pdf.add_page()
     pdf.set_text_color(59, 130, 246)
     pdf.set_font('Helvetica', 'B', 16)
-    pdf.cell(0, 10, '3. Transcricao de Interacoes com o Tutor Socratico', ln=True)
+    pdf.cell(0, 10, '4. Transcricao de Interacoes com o Tutor Socratico', ln=True)
     pdf.set_text_color(0, 0, 0)
     pdf.ln(2)
     
@@ -320,12 +364,54 @@ def generate_student_pdf(student: Dict, udata: Dict) -> bytes:
 # =========================================================================
 # DASHBOARD PROFESSOR AVANÇADO (MINIMALISTA, MATERIAL ICONS & 8 TÓPICOS)
 # =========================================================================
-def show_advanced_professor_dashboard():
-    all_users = get_all_users()
-    student_users = [u for u in all_users if u.get("user_type") == "aluno"]
-    all_analytics = get_all_users_analytics()
-    
-    # ── AGREGAÇÃO DE DADOS POR CATEGORIA (T1 A T8) ──
+# =========================================================================
+# PAGINAÇÃO "CARREGAR MAIS" DO HISTÓRICO INDIVIDUAL
+# =========================================================================
+# Mesmo prazo do cache das páginas no Firebase (analytics.py)
+HISTORY_REFRESH_SECONDS = 300
+PAGED_HISTORY_KEYS = ("prof_cases_page", "prof_chats_page")
+
+def get_paged_history(state_key: str, uid: str, fetch_page) -> List[Dict]:
+    """
+    Acumula páginas do histórico do aluno em st.session_state.
+    A primeira página é lida ao selecionar o aluno e relida após
+    HISTORY_REFRESH_SECONDS (volta a uma página só); as seguintes só com "Carregar mais".
+    """
+    state = st.session_state.get(state_key)
+    if (not state or state.get("uid") != uid
+            or time.time() - state.get("fetched_at", 0) >= HISTORY_REFRESH_SECONDS):
+        items, cursor = fetch_page(uid)
+        state = {"uid": uid, "items": items, "cursor": cursor, "fetched_at": time.time()}
+        st.session_state[state_key] = state
+    return state["items"]
+
+def reset_paged_history():
+    """Esquece as páginas acumuladas (após resets ou no botão "Atualizar histórico")."""
+    for key in PAGED_HISTORY_KEYS:
+        st.session_state.pop(key, None)
+
+def show_load_more_button(state_key: str, fetch_page, label: str = "Carregar mais"):
+    """Renderiza o botão "Carregar mais" se ainda houver páginas no cursor salvo."""
+    state = st.session_state.get(state_key)
+    if not state or state.get("cursor") is None:
+        return
+    if st.button(label, key=f"{state_key}_more", use_container_width=True, icon=":material/expand_more:"):
+        items, cursor = fetch_page(state["uid"], cursor=state["cursor"])
+        state["items"] = state["items"] + items
+        state["cursor"] = cursor
+        st.rerun()
+
+# =========================================================================
+# AGREGAÇÃO DE DADOS POR CATEGORIA (T1 A T8)
+# =========================================================================
+@profiled("aggregation")
+def aggregate_class_dashboard(all_events: Dict, chat_counts: Dict) -> Dict[str, Any]:
+    """
+    Consolida os eventos de caso da turma por tópico e por questão (tentativas,
+    acertos e tempo) e os totais dos KPIs do painel. A distribuição de alternativas
+    vem dos histogramas de distractor_stats. Separada da interface para poder ser
+    medida em benchmarks/.
+    """
     category_stats = {}
     for tk, tname in TOPICS.items():
         category_stats[tk] = {
@@ -349,28 +435,19 @@ def show_advanced_professor_dashboard():
                 "distratores": q["distratores"],
                 "alternativas": q["alternativas"],
                 "total_attempts": 0,
-                "correct_attempts": 0,
-                "choices_count": {"A": 0, "B": 0, "C": 0, "D": 0}
+                "correct_attempts": 0
             }
 
-    total_chat_messages = 0
     total_answered_cases = 0
     total_correct_cases = 0
     total_time_seconds = 0.0
+    total_chat_messages = sum(c["messages"] for c in chat_counts.values())
 
-    for uid, udata in all_analytics.items():
-        for cdoc in udata.get("chat_interactions", []):
-            if "messages" in cdoc and isinstance(cdoc["messages"], list):
-                total_chat_messages += len(cdoc["messages"])
-            else:
-                total_chat_messages += 1
-                
-        for case in udata.get("case_analytics", []):
-            cid = case.get("case_id")
-            result = case.get("case_result", {})
-            dur = float(case.get("duration_seconds", 0))
-            is_corr = bool(result.get("is_correct", False) or result.get("classification") == "CORRETO" or result.get("points_gained", 0) >= 1.0)
-            user_ans = str(result.get("user_answer", ""))
+    for uid, events in all_events.items():
+        for ev in events:
+            cid = ev.case_id
+            dur = ev.duration
+            is_corr = ev.is_correct or ev.points >= 1.0
             
             total_answered_cases += 1
             if is_corr:
@@ -388,10 +465,32 @@ def show_advanced_professor_dashboard():
                     qdata["total_attempts"] += 1
                     if is_corr:
                         qdata["correct_attempts"] += 1
-                    for opt in ["A", "B", "C", "D"]:
-                        if user_ans.startswith(f"{opt}.") or user_ans.startswith(f"Opção {opt}") or user_ans.startswith(opt):
-                            qdata["choices_count"][opt] += 1
-                            break
+
+    return {
+        "category_stats": category_stats,
+        "total_chat_messages": total_chat_messages,
+        "total_answered_cases": total_answered_cases,
+        "total_correct_cases": total_correct_cases,
+        "total_time_seconds": total_time_seconds,
+    }
+
+@profiled("ui")
+def show_advanced_professor_dashboard():
+    all_users = get_all_users()
+    student_users = [u for u in all_users if u.get("user_type") == "aluno"]
+    # KPIs e rankings usam leituras projetadas (sem textos de feedback/mensagens);
+    # os documentos completos só são lidos ao gerar os PDFs
+    all_events = get_all_case_events()
+    chat_counts = get_chat_message_counts()
+    
+    agg = aggregate_class_dashboard(all_events, chat_counts)
+    category_stats = agg["category_stats"]
+    total_chat_messages = agg["total_chat_messages"]
+    total_answered_cases = agg["total_answered_cases"]
+    total_correct_cases = agg["total_correct_cases"]
+    total_time_seconds = agg["total_time_seconds"]
+    distractors = get_distractor_stats()
+    top_distractors = distractors.most_chosen_distractor_by_topic()
 
     # ── INTERFACE PRINCIPAL ──
     col_t1, col_t2 = st.columns([3, 1.2])
@@ -399,16 +498,19 @@ def show_advanced_professor_dashboard():
         st.markdown("<h2 style='margin-bottom:0;'><span class='material-icons-outlined' style='font-size:26px; vertical-align:middle; color:#10b981;'>dashboard</span> Painel do Professor</h2>", unsafe_allow_html=True)
         st.markdown("<p style='color:#64748b; font-size:0.95rem; margin-top:-0.3rem;'>Acompanhe o desempenho da turma nos 8 tópicos de Transporte & Membranas.</p>", unsafe_allow_html=True)
     with col_t2:
-        pdf_bytes = generate_class_full_pdf(student_users, all_analytics, category_stats)
-        st.download_button(
-            label="Baixar Relatório Geral (PDF)",
-            data=pdf_bytes,
-            file_name=f"Relatorio_Turma_HelixAI_{datetime.now().strftime('%Y%m%d')}.pdf",
-            mime="application/pdf",
-            type="primary",
-            use_container_width=True,
-            icon=":material/download:"
-        )
+        # O PDF precisa das transcrições completas: só lê tudo quando solicitado
+        if st.button("Gerar Relatório Geral (PDF)", type="primary", use_container_width=True, icon=":material/picture_as_pdf:"):
+            st.session_state.class_pdf_bytes = generate_class_full_pdf(student_users, get_all_users_analytics(), category_stats, top_distractors)
+        if st.session_state.get("class_pdf_bytes"):
+            st.download_button(
+                label="Baixar Relatório Geral (PDF)",
+                data=st.session_state.class_pdf_bytes,
+                file_name=f"Relatorio_Turma_HelixAI_{datetime.now().strftime('%Y%m%d')}.pdf",
+                mime="application/pdf",
+                type="primary",
+                use_container_width=True,
+                icon=":material/download:"
+            )
 
     st.markdown("<hr style='margin: 0.5rem 0 1.2rem 0; opacity: 0.2;'>", unsafe_allow_html=True)
 
@@ -461,14 +563,27 @@ def show_advanced_professor_dashboard():
                 with col_c3:
                     avg_dur_cat = (c["total_duration"] / tot) if tot > 0 else 0.0
                     st.markdown(f"**Tempo Médio:** {format_duration(avg_dur_cat)}")
+
+                top = top_distractors.get(c["topico_id"])
+                if top:
+                    st.markdown(
+                        f"<span class='material-icons-outlined' style='font-size:16px; vertical-align:middle; color:#ef4444;'>warning</span> "
+                        f"<b>Distrator mais escolhido:</b> {top['codigo']} — Alternativa <b>{top['option']}</b> "
+                        f"({top['count']} escolha(s), {top['share_of_errors'] * 100:.0f}% dos erros do tópico; "
+                        f"{top['first_attempt']} na 1ª tentativa)",
+                        unsafe_allow_html=True
+                    )
                     
                 st.markdown("---")
                 st.markdown(f"#### <span class='material-icons-outlined' style='font-size:18px; vertical-align:middle;'>search</span> Questões Específicas do Tópico `{c['topico_id']}`:", unsafe_allow_html=True)
                 
                 q_list = list(c["questions"].values())
                 for q in q_list:
-                    q_tot = q["total_attempts"]
-                    q_corr = q["correct_attempts"]
+                    # Taxa e distribuição do cartão vêm da mesma fonte (histogramas ao vivo):
+                    # primeiras respostas para a taxa; tentativas seguintes só na distribuição
+                    hist = distractors.question_histogram(q["id"])
+                    q_tot = sum(h['first_attempt'] for h in hist.values())
+                    q_corr = hist.get(q["gabarito"], {}).get('first_attempt', 0)
                     q_rate = (q_corr / q_tot * 100) if q_tot > 0 else 0.0
                     
                     diff_color_q = "#10b981" if q["dificuldade"] == "Fácil" else ("#f59e0b" if q["dificuldade"] == "Média" else "#ef4444")
@@ -478,7 +593,7 @@ def show_advanced_professor_dashboard():
                         st.markdown(f"""
                         <div style='display:flex; justify-content:space-between; align-items:center;'>
                             <b>{q['codigo']} ({diff_tag})</b>
-                            <span style='font-weight:700; color:{badge_color};'>Taxa de Acerto: {q_rate:.1f}% ({q_corr}/{q_tot} tentativas)</span>
+                            <span style='font-weight:700; color:{badge_color};'>Taxa de Acerto: {q_rate:.1f}% ({q_corr}/{q_tot} respostas)</span>
                         </div>
                         <div style='margin: 0.5rem 0; font-size: 0.95rem; color: var(--text-color);'>
                             {q['pergunta']}
@@ -488,14 +603,16 @@ def show_advanced_professor_dashboard():
                         st.markdown(f"<span class='material-icons-outlined' style='font-size:16px; vertical-align:middle; color:#10b981;'>check_circle</span> <b>Gabarito Oficial:</b> Alternativa <b>{q['gabarito']}</b> — *{q['alternativas'].get(q['gabarito'], '')}*", unsafe_allow_html=True)
                         
                         if q_tot > 0:
-                            st.markdown("**Distribuição das Escolhas dos Alunos:**")
+                            st.markdown("**Distribuição das Escolhas dos Alunos (todas as tentativas):**")
                             cols_opt = st.columns(4)
                             for idx_o, opt_k in enumerate(["A", "B", "C", "D"]):
-                                cnt = q["choices_count"].get(opt_k, 0)
+                                h = hist.get(opt_k, {'count': 0, 'first_attempt': 0, 'avg_seconds': 0.0})
                                 is_gab = (opt_k == q["gabarito"])
                                 with cols_opt[idx_o]:
                                     star_tag = "<span class='material-icons-outlined' style='font-size:14px; vertical-align:middle; color:#10b981;'>star</span> " if is_gab else ""
-                                    st.markdown(f"{star_tag}<b>Opção {opt_k}:</b> {cnt} aluno(s)", unsafe_allow_html=True)
+                                    st.markdown(f"{star_tag}<b>Opção {opt_k}:</b> {h['count']} escolha(s)", unsafe_allow_html=True)
+                                    if h['count'] > 0:
+                                        st.caption(f"{h['first_attempt']} na 1ª tentativa · {format_duration(h['avg_seconds'])} em média")
                                     
                         with st.expander("Ver Análise de Distratores / Erros Conceituais desta Questão"):
                             for opt_k, dist_txt in q["distratores"].items():
@@ -513,26 +630,34 @@ def show_advanced_professor_dashboard():
             sel_student_idx = st.selectbox("Selecione o Aluno:", range(len(student_users)), format_func=lambda i: student_names[i])
             selected_student = student_users[sel_student_idx]
             uid = selected_student["id"]
-            udata = all_analytics.get(uid, {})
-            cases = udata.get("case_analytics", [])
+            user_events = all_events.get(uid, [])
             
-            student_pdf_bytes = generate_student_pdf(selected_student, udata)
-            st.download_button(
-                label=f"Baixar Relatório Individual ({selected_student.get('name', 'Aluno')})",
-                data=student_pdf_bytes,
-                file_name=f"Relatorio_{selected_student.get('ra', 'aluno')}_HelixAI.pdf",
-                mime="application/pdf",
-                type="secondary",
-                icon=":material/download:"
-            )
+            if st.button(f"Gerar Relatório Individual ({selected_student.get('name', 'Aluno')})", type="secondary", icon=":material/picture_as_pdf:"):
+                udata = get_all_users_analytics().get(uid, {})
+                st.session_state.student_pdf = (uid, generate_student_pdf(selected_student, udata))
+            student_pdf = st.session_state.get("student_pdf")
+            if student_pdf and student_pdf[0] == uid:
+                st.download_button(
+                    label=f"Baixar Relatório Individual ({selected_student.get('name', 'Aluno')})",
+                    data=student_pdf[1],
+                    file_name=f"Relatorio_{selected_student.get('ra', 'aluno')}_HelixAI.pdf",
+                    mime="application/pdf",
+                    type="secondary",
+                    icon=":material/download:"
+                )
+            
+            if st.button("Atualizar histórico", key="refresh_student_history", icon=":material/refresh:"):
+                clear_history_page_caches()
+                reset_paged_history()
+                st.rerun()
             
             st.markdown("<div style='margin-top: 1rem;'></div>", unsafe_allow_html=True)
             
-            tot_s = len(cases)
-            corr_s = sum(1 for c in cases if c.get("case_result", {}).get("is_correct", False) or c.get("case_result", {}).get("points_gained", 0) >= 1.0)
+            tot_s = len(user_events)
+            corr_s = sum(1 for ev in user_events if ev.is_correct or ev.points >= 1.0)
             acc_s = (corr_s / tot_s * 100) if tot_s > 0 else 0.0
-            pts_s = sum(float(c.get("case_result", {}).get("points_gained", 0)) for c in cases)
-            dur_s = sum(c.get("duration_seconds", 0) for c in cases)
+            pts_s = sum(ev.points for ev in user_events)
+            dur_s = sum(ev.duration for ev in user_events)
             
             s_kpi1, s_kpi2, s_kpi3, s_kpi4 = st.columns(4)
             with s_kpi1:
@@ -550,6 +675,8 @@ def show_advanced_professor_dashboard():
             
             with col_perf:
                 st.markdown("### <span class='material-icons-outlined' style='font-size:20px; vertical-align:middle;'>assignment</span> Questões Respondidas pelo Aluno", unsafe_allow_html=True)
+                # Lista paginada: lê só a página atual do Firestore (mais recente primeiro)
+                cases = get_paged_history("prof_cases_page", uid, get_user_case_analytics_page)
                 if not cases:
                     st.info("Este aluno ainda não respondeu nenhuma questão.")
                 else:
@@ -585,10 +712,11 @@ def show_advanced_professor_dashboard():
                                     <b>Análise do Distrator (Por que induz ao erro):</b><br>{why_d}
                                 </div>
                                 """, unsafe_allow_html=True)
+                    show_load_more_button("prof_cases_page", get_user_case_analytics_page)
 
             with col_chat:
                 st.markdown("### <span class='material-icons-outlined' style='font-size:20px; vertical-align:middle; color:#3b82f6;'>chat</span> Histórico com o Tutor Helix.AI", unsafe_allow_html=True)
-                chat_docs = udata.get("chat_interactions", [])
+                chat_docs = get_paged_history("prof_chats_page", uid, get_user_chat_interactions_page)
                 if not chat_docs:
                     st.info("Nenhuma conversa com o tutor registrada para este aluno.")
                 else:
@@ -612,6 +740,7 @@ def show_advanced_professor_dashboard():
                                 if b_msg:
                                     with st.chat_message("assistant"):
                                         st.markdown(b_msg)
+                    show_load_more_button("prof_chats_page", get_user_chat_interactions_page)
 
     # =========================================================================
     # TAB 3: ADMIN & LIMPEZA DE DADOS
@@ -627,24 +756,50 @@ def show_advanced_professor_dashboard():
             c_adm1, c_adm2, c_adm3 = st.columns(3)
             with c_adm1:
                 if st.button("Resetar Analytics da Turma", use_container_width=True, icon=":material/delete:"):
-                    res = reset_all_students_analytics()
+                    res = reset_all_students_analytics(progress_callback=bulk_progress(st.progress(0.0)))
                     log_admin_action("reset_analytics", f"Deletados {res['deleted']} registros")
+                    reset_paged_history()
                     st.success(f"Sucesso! {res['deleted']} registros de analytics removidos.")
                     st.rerun()
                     
             with c_adm2:
                 if st.button("Limpar Interações de Chat", use_container_width=True, icon=":material/delete_sweep:"):
-                    res = clear_all_chat_interactions()
+                    res = clear_all_chat_interactions(progress_callback=bulk_progress(st.progress(0.0)))
                     log_admin_action("clear_chats", f"Deletados {res['deleted']} chats")
+                    reset_paged_history()
                     st.success(f"Sucesso! {res['deleted']} interações de chat limpas.")
                     st.rerun()
                     
             with c_adm3:
                 if st.button("Resetar Progresso dos Alunos", use_container_width=True, icon=":material/restart_alt:"):
-                    res = reset_all_student_progress()
+                    res = reset_all_student_progress(progress_callback=bulk_progress(st.progress(0.0)))
                     log_admin_action("reset_progress", f"Resetados {res['updated']} alunos")
                     st.success(f"Sucesso! Progresso resetado para {res['updated']} alunos.")
                     st.rerun()
+
+            # Jobs interrompidos: só continuam por ação explícita
+            pending_jobs = get_pending_bulk_jobs()
+            if pending_jobs:
+                st.markdown("**Operações interrompidas**")
+                for job_id, job in sorted(pending_jobs.items(), key=lambda kv: kv[1].get('started_at', 0)):
+                    done = sum(sh.get('done', 0) for sh in job.get('shards', {}).values())
+                    started = datetime.fromtimestamp(job.get('started_at', 0)).strftime('%d/%m %H:%M')
+                    label = BULK_JOB_LABELS.get(job.get('name'), job.get('name'))
+                    target = job.get('params', {}).get('user_id')
+                    j1, j2, j3 = st.columns([3, 1, 1])
+                    with j1:
+                        st.caption(f"{label}{f' ({target})' if target else ''} — iniciada em {started}, "
+                                   f"{done} documentos processados")
+                    with j2:
+                        if st.button("Retomar", key=f"resume_{job_id}", use_container_width=True):
+                            resume_bulk_job(job_id, progress_callback=bulk_progress(st.progress(0.0)))
+                            log_admin_action("resume_bulk_job", f"Retomado {job_id}")
+                            reset_paged_history()
+                            st.rerun()
+                    with j3:
+                        if st.button("Descartar", key=f"discard_{job_id}", use_container_width=True):
+                            discard_bulk_job(job_id)
+                            st.rerun()
                     
         st.markdown("<div style='margin-top: 1.5rem;'></div>", unsafe_allow_html=True)
         st.markdown("#### Estatísticas do Banco de Dados")
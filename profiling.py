@@ -0,0 +1,276 @@
+"""
+Perfil de execução por rerun do Streamlit (opt-in).
+
+Cada execução de app.main() vira um RerunTrace; as funções de armazenamento,
+LLM e agregação marcadas com @profiled (ou blocos `with span(...)`) registram
+spans com duração e profundidade, e o firestore_metrics soma as operações do
+Firestore feitas durante o rerun. Os últimos reruns de todas as sessões ficam
+num buffer do processo, exibido na aba "Desempenho" do painel do admin e
+exportável em JSON.
+
+Desligado, o custo é uma leitura de thread-local por chamada decorada.
+Spans feitos em threads de pool (ex: workers por shard) não entram no rerun.
+
+Habilitar em `.streamlit/secrets.toml`:
+
+    [debug]
+    profiling = true
+
+ou com a variável de ambiente CLINTUTOR_PROFILING=1.
+"""
+
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+MAX_RERUNS = 200
+# Além disso só os totais por nome continuam sendo somados
+MAX_SPANS_PER_RERUN = 500
+# Exceções do Streamlit usadas como controle de fluxo (st.rerun/st.stop)
+CONTROL_FLOW_EXCEPTIONS = ('RerunException', 'StopException')
+
+_enabled: Optional[bool] = None
+_local = threading.local()
+
+
+def profiling_enabled() -> bool:
+    """True se o perfil foi habilitado por config (lido uma vez por processo)."""
+    global _enabled
+    if _enabled is None:
+        flag = os.environ.get('CLINTUTOR_PROFILING', '').strip().lower()
+        enabled = flag in ('1', 'true', 'yes', 'on')
+        if not enabled:
+            try:
+                import streamlit as st
+                if 'debug' in st.secrets:
+                    enabled = bool(st.secrets['debug'].get('profiling', False))
+            except Exception:
+                pass
+        _enabled = enabled
+    return _enabled
+
+
+class RerunTrace:
+    """Spans e operações do Firestore de um único rerun."""
+
+    def __init__(self, label: str, session: str = '', user_type: str = ''):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.session = session
+        self.user_type = user_type
+        self.started_at = datetime.now()
+        self.total_ms = 0.0
+        self.spans: List[Dict] = []
+        self.totals: Dict[str, Dict] = {}
+        self.firestore: Dict[Tuple[str, str], int] = {}
+        self.dropped = 0
+        self._t0 = time.perf_counter()
+        self._depth = 0
+
+    def add_span(self, name: str, category: str, started: float, elapsed_ms: float, depth: int,
+                 error: Optional[str]):
+        total = self.totals.get(name)
+        if total is None:
+            total = self.totals[name] = {'name': name, 'category': category, 'calls': 0,
+                                         'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0}
+        total['calls'] += 1
+        total['total_ms'] += elapsed_ms
+        total['max_ms'] = max(total['max_ms'], elapsed_ms)
+        if error:
+            total['errors'] += 1
+        if len(self.spans) >= MAX_SPANS_PER_RERUN:
+            self.dropped += 1
+            return
+        self.spans.append({
+            'name': name,
+            'category': category,
+            'start_ms': round((started - self._t0) * 1000, 3),
+            'ms': round(elapsed_ms, 3),
+            'depth': depth,
+            'error': error,
+        })
+
+    def add_firestore(self, collection: str, kind: str, count: int):
+        key = (collection, kind)
+        self.firestore[key] = self.firestore.get(key, 0) + count
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self._t0) * 1000
+
+    def firestore_totals(self) -> Dict[str, int]:
+        totals = {'read': 0, 'write': 0, 'delete': 0}
+        for (_, kind), n in self.firestore.items():
+            totals[kind] = totals.get(kind, 0) + n
+        return totals
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'label': self.label,
+            'session': self.session,
+            'user_type': self.user_type,
+            'started_at': self.started_at.isoformat(),
+            'total_ms': round(self.total_ms, 3),
+            'spans': self.spans,
+            'dropped_spans': self.dropped,
+            'totals': sorted(self.totals.values(), key=lambda t: -t['total_ms']),
+            'firestore': [{'collection': c, 'kind': k, 'count': n} for (c, k), n in sorted(self.firestore.items())],
+        }
+
+
+class TraceStore:
+    """Buffer circular dos últimos reruns do processo (todas as sessões)."""
+
+    def __init__(self, max_reruns: int = MAX_RERUNS):
+        self._lock = threading.Lock()
+        self._traces: deque = deque(maxlen=max_reruns)
+
+    def add(self, trace: RerunTrace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def recent(self) -> List[RerunTrace]:
+        """Mais recentes primeiro."""
+        with self._lock:
+            return list(reversed(self._traces))
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+    def span_summary(self) -> List[Dict]:
+        """Totais por span somando todos os reruns guardados (mais lentos primeiro)."""
+        rows: Dict[str, Dict] = {}
+        traces = self.recent()
+        for trace in traces:
+            for name, t in trace.totals.items():
+                row = rows.setdefault(name, {'name': name, 'category': t['category'], 'reruns': 0,
+                                             'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0})
+                row['reruns'] += 1
+                row['calls'] += t['calls']
+                row['total_ms'] += t['total_ms']
+                row['max_ms'] = max(row['max_ms'], t['max_ms'])
+                row['errors'] += t['errors']
+        for row in rows.values():
+            row['ms_per_rerun'] = row['total_ms'] / row['reruns']
+        return sorted(rows.values(), key=lambda r: -r['total_ms'])
+
+    def export_json(self) -> str:
+        return json.dumps({
+            'exported_at': datetime.now().isoformat(),
+            'reruns': [t.to_dict() for t in self.recent()],
+        }, ensure_ascii=False, indent=2)
+
+
+traces = TraceStore()
+
+
+def current_trace() -> Optional[RerunTrace]:
+    return getattr(_local, 'trace', None)
+
+
+def _session_info() -> Tuple[str, str]:
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        session = ctx.session_id[:8] if ctx else ''
+        return session, st.session_state.get('user_type') or 'anônimo'
+    except Exception:
+        return '', ''
+
+
+class rerun_trace:
+    """Envolve um rerun inteiro: `with rerun_trace("app.main"): main()`."""
+
+    def __init__(self, label: str = 'app'):
+        self.label = label
+        self.trace: Optional[RerunTrace] = None
+
+    def __enter__(self) -> Optional[RerunTrace]:
+        if profiling_enabled():
+            self.trace = RerunTrace(self.label, *_session_info())
+            _local.trace = self.trace
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            self.trace.finish()
+            # O login acontece no meio do rerun: o tipo de usuário é relido no fim
+            self.trace.user_type = _session_info()[1] or self.trace.user_type
+            _local.trace = None
+            traces.add(self.trace)
+        return False
+
+
+class span:
+    """Mede um bloco dentro do rerun atual (sem rerun ativo, não faz nada)."""
+
+    __slots__ = ('name', 'category', '_trace', '_start', '_depth')
+
+    def __init__(self, name: str, category: str = 'app'):
+        self.name = name
+        self.category = category
+        self._trace = None
+
+    def __enter__(self):
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            self._trace = trace
+            self._depth = trace._depth
+            trace._depth += 1
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self._trace
+        if trace is not None:
+            elapsed_ms = (time.perf_counter() - self._start) * 1000
+            trace._depth = self._depth
+            error = None
+            if exc_type is not None and exc_type.__name__ not in CONTROL_FLOW_EXCEPTIONS:
+                error = exc_type.__name__
+            trace.add_span(self.name, self.category, self._start, elapsed_ms, self._depth, error)
+        return False
+
+
+def profiled(category: str = 'app', name: str = None):
+    """
+    Decorador: registra cada chamada como span do rerun atual.
+    Em geradores (ex: streaming do LLM) o span cobre o consumo até o fim.
+    """
+    def decorator(fn):
+        label = name or f"{fn.__module__}.{fn.__name__}"
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                if getattr(_local, 'trace', None) is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                with span(label, category):
+                    yield from fn(*args, **kwargs)
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'trace', None) is None:
+                return fn(*args, **kwargs)
+            with span(label, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def note_firestore(collection: str, kind: str, count: int):
+    """Chamado pelo firestore_metrics a cada operação registrada."""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add_firestore(collection, kind, count)
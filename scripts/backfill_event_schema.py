@@ -0,0 +1,92 @@
+import sys
+import os
+
+# Permite importar arquivos do app principal
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from analytics import (
+    get_all_dbs, is_firebase_connected, to_epoch, EVENT_TS_FIELD,
+    load_analytics_local, save_analytics_local
+)
+
+# Limite de operações por batch do Firestore
+BATCH_SIZE = 400
+
+def _event_ts_update(data: dict) -> dict:
+    """
+    Monta os campos que faltam para o schema canônico do evento.
+    Retorna {} se o documento já está migrado.
+    """
+    update = {}
+    if not isinstance(data.get(EVENT_TS_FIELD), (int, float)):
+        ts = to_epoch(data.get('timestamp'))
+        if ts:
+            update[EVENT_TS_FIELD] = ts
+
+    # Documentos de chat agrupados: cada mensagem também recebe o epoch
+    messages = data.get('messages')
+    if isinstance(messages, list) and any(not isinstance(m.get(EVENT_TS_FIELD), (int, float)) for m in messages):
+        new_messages = []
+        for m in messages:
+            m = dict(m)
+            if not isinstance(m.get(EVENT_TS_FIELD), (int, float)):
+                m[EVENT_TS_FIELD] = to_epoch(m.get('timestamp', data.get('timestamp')))
+            new_messages.append(m)
+        update['messages'] = new_messages
+
+    # Contagem denormalizada de mensagens (agregações usam projeção sem 'messages')
+    if isinstance(messages, list) and data.get('message_count') != len(messages):
+        update['message_count'] = len(messages)
+    return update
+
+def backfill_firebase():
+    if not is_firebase_connected():
+        print("Erro: Firebase nao esta conectado.")
+        return
+
+    for db in get_all_dbs():
+        for collection in ('case_analytics', 'chat_interactions'):
+            docs = db.collection(collection).get()
+            print(f"Lendo {db.project}/{collection} - {len(docs)} registros encontrados.")
+
+            atualizados = 0
+            pulados = 0
+            batch = db.batch()
+            pendentes = 0
+            for doc in docs:
+                update = _event_ts_update(doc.to_dict() or {})
+                if not update:
+                    pulados += 1
+                    continue
+                batch.update(doc.reference, update)
+                pendentes += 1
+                atualizados += 1
+                if pendentes >= BATCH_SIZE:
+                    batch.commit()
+                    batch = db.batch()
+                    pendentes = 0
+            if pendentes:
+                batch.commit()
+
+            print(f"Finalizado {collection}. Atualizados: {atualizados} | Ja migrados: {pulados}\n")
+
+def backfill_local():
+    analytics = load_analytics_local()
+    atualizados = 0
+    for entry in analytics:
+        update = _event_ts_update(entry)
+        if update:
+            entry.update(update)
+            atualizados += 1
+    if atualizados:
+        save_analytics_local(analytics)
+    print(f"Banco local: {atualizados} de {len(analytics)} registros atualizados.")
+
+def run_backfill():
+    print(f"Iniciando backfill dos campos '{EVENT_TS_FIELD}' (epoch) e 'message_count' nos eventos de analytics...")
+    backfill_firebase()
+    backfill_local()
+
+if __name__ == "__main__":
+    run_backfill()
@@ -0,0 +1,186 @@
+"""
+Servidor LLM falso, compatível com POST /openai/v1/chat/completions do Groq.
+
+- Resposta determinística: o texto depende só das mensagens recebidas
+- Streaming SSE com tempo até o primeiro token e taxa de tokens configuráveis
+- Injeção de erros 429/500 com probabilidade configurável (semente fixa)
+
+Uso:
+    python scripts/fake_llm_server.py --port 8765 --tokens-per-sec 60 --ttft-ms 300 --error-429 0.05
+    CLINTUTOR_LLM_BACKEND=fake streamlit run app.py
+"""
+
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VOCABULARY = (
+    "membrana gradiente difusão osmose transporte ativo passivo canal carreador "
+    "bomba sódio potássio ATPase energia concentração soluto solvente lipídio "
+    "proteína polaridade carga equilíbrio saturação cinética seletividade "
+    "observe pense compare alternativa enunciado conceito mecanismo célula"
+).split()
+
+
+class FakeLLMConfig:
+    def __init__(self, tokens_per_sec: float = 50.0, ttft_ms: float = 250.0, jitter_ms: float = 50.0,
+                 error_429: float = 0.0, error_500: float = 0.0, min_tokens: int = 40,
+                 max_tokens: int = 120, seed: int = 42):
+        self.tokens_per_sec = tokens_per_sec
+        self.ttft_ms = ttft_ms
+        self.jitter_ms = jitter_ms
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, '429': 0, '500': 0, 'tokens': 0}
+
+    def draw(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+
+def deterministic_reply(messages) -> list:
+    """Lista de tokens derivada do hash das mensagens (mesma entrada, mesma resposta)."""
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode()).digest()
+    rng = random.Random(digest)
+    size = rng.randint(40, 120)
+    words = [rng.choice(VOCABULARY) for _ in range(size)]
+    words[0] = words[0].capitalize()
+    return [w + ' ' for w in words[:-1]] + [words[-1] + '.']
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Aproximação de ~4 caracteres por token, suficiente para a telemetria."""
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+
+
+def make_handler(config: FakeLLMConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status: int, body: dict, headers: dict = None):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            config.count('requests')
+
+            draw = config.draw()
+            if draw < config.error_429:
+                config.count('429')
+                self._json(429, {"error": {"message": "Rate limit reached (fake)", "type": "tokens"}},
+                           {"retry-after": "1"})
+                return
+            if draw < config.error_429 + config.error_500:
+                config.count('500')
+                self._json(500, {"error": {"message": "Internal error (fake)"}})
+                return
+
+            tokens = deterministic_reply(request.get("messages", []))
+            tokens = tokens[:max(config.min_tokens, min(len(tokens), config.max_tokens))]
+            model = request.get("model", "fake")
+            usage = {"prompt_tokens": estimate_prompt_tokens(request.get("messages", [])),
+                     "completion_tokens": len(tokens)}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            created = int(time.time())
+            ttft = max(0.0, config.ttft_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+            time.sleep(ttft)
+
+            if not request.get("stream"):
+                time.sleep(len(tokens) / config.tokens_per_sec if config.tokens_per_sec > 0 else 0)
+                config.count('tokens', len(tokens))
+                self._json(200, {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(tokens)}}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            interval = 1.0 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+            try:
+                for i, token in enumerate(tokens):
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                             "model": model,
+                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    config.count('tokens')
+                    if interval and i < len(tokens) - 1:
+                        time.sleep(interval)
+                done = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                        "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                        # Como o Groq: usage no último chunk do stream
+                        "x_groq": {"id": "req-fake", "usage": usage}}
+                self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            self.close_connection = True
+
+    return Handler
+
+
+def start_fake_llm_server(port: int = 0, config: FakeLLMConfig = None):
+    """Sobe o servidor numa thread daemon. Retorna (server, base_url)."""
+    config = config or FakeLLMConfig()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor LLM falso (API do Groq) para testes de carga.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--ttft-ms", type=float, default=250.0, help="Tempo até o primeiro token (ms)")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-429", type=float, default=0.0, help="Probabilidade de responder 429")
+    parser.add_argument("--error-500", type=float, default=0.0, help="Probabilidade de responder 500")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    cfg = FakeLLMConfig(args.tokens_per_sec, args.ttft_ms, args.jitter_ms, args.error_429, args.error_500,
+                        seed=args.seed)
+    srv, url = start_fake_llm_server(args.port, cfg)
+    print(f"Servidor LLM falso em {url} (Ctrl+C para sair)")
+    try:
+        while True:
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print(f"\nEstatisticas: {cfg.stats}")
+        srv.shutdown()
+        sys.exit(0)
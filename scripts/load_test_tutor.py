@@ -0,0 +1,131 @@
+"""
+Teste de carga do tutor com N alunos simultâneos.
+
+Cada aluno repete o ciclo: pick_adaptive_case -> tutor_reply_com_ia (streaming)
+-> evaluate_mcq_answer. Por padrão sobe o servidor LLM falso em processo
+(scripts/fake_llm_server.py); com --base-url usa um servidor já rodando.
+
+Uso:
+    python scripts/load_test_tutor.py --students 40 --rounds 3 --error-429 0.05
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+# Permite importar arquivos do app principal
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import FakeLLMConfig, start_fake_llm_server
+
+STUDENT_QUESTIONS = [
+    "Não entendi a diferença entre difusão simples e facilitada.",
+    "Por que a bomba de sódio e potássio gasta ATP?",
+    "O que significa a substância ser lipossolúvel?",
+    "Qual é a resposta certa?",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def run_student(student: int, rounds: int, results: Dict, lock: threading.Lock):
+    from logic import pick_adaptive_case, tutor_reply_com_ia, evaluate_mcq_answer
+
+    rng = random.Random(student)
+    used: List[str] = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        question = pick_adaptive_case("Fácil", used_cases=used)
+        used.append(question["id"])
+
+        first_token_at = None
+        tokens = 0
+        reply = []
+        for piece in tutor_reply_com_ia(question, rng.choice(STUDENT_QUESTIONS), []):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            tokens += 1
+            reply.append(piece)
+        text = "".join(reply)
+        failed = text.startswith("Erro")
+
+        evaluate_mcq_answer(question, rng.choice(["A", "B", "C", "D"]))
+        finished = time.perf_counter()
+
+        with lock:
+            results['loops'] += 1
+            if failed:
+                results['errors'] += 1
+                continue
+            results['tokens'] += tokens
+            results['ttft'].append((first_token_at or finished) - started)
+            results['latency'].append(finished - started)
+
+
+def run_load_test(students: int, rounds: int, base_url: str = None, config: FakeLLMConfig = None) -> Dict:
+    server = None
+    if not base_url:
+        server, base_url = start_fake_llm_server(0, config or FakeLLMConfig())
+    os.environ['CLINTUTOR_LLM_BACKEND'] = 'fake'
+    os.environ['CLINTUTOR_LLM_BASE_URL'] = base_url
+
+    results = {'loops': 0, 'errors': 0, 'tokens': 0, 'ttft': [], 'latency': []}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=students) as pool:
+        futures = [pool.submit(run_student, student, rounds, results, lock) for student in range(students)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'alunos': students,
+        'ciclos': results['loops'],
+        'erros': results['errors'],
+        'segundos': round(elapsed, 2),
+        'ciclos_por_segundo': round(results['loops'] / elapsed, 2),
+        'tokens_por_segundo': round(results['tokens'] / elapsed, 1),
+        'ttft_p50_ms': round(percentile(results['ttft'], 0.50) * 1000),
+        'ttft_p95_ms': round(percentile(results['ttft'], 0.95) * 1000),
+        'latencia_p50_ms': round(percentile(results['latency'], 0.50) * 1000),
+        'latencia_p95_ms': round(percentile(results['latency'], 0.95) * 1000),
+        'latencia_p99_ms': round(percentile(results['latency'], 0.99) * 1000),
+    }
+    if server is not None:
+        report['servidor'] = dict(server.config.stats)
+        server.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga do tutor socrático.")
+    parser.add_argument("--students", type=int, default=30, help="Alunos simultâneos")
+    parser.add_argument("--rounds", type=int, default=3, help="Ciclos por aluno")
+    parser.add_argument("--base-url", default=None, help="Servidor LLM já rodando (senão sobe o fake)")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--ttft-ms", type=float, default=250.0)
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-500", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    cfg = FakeLLMConfig(args.tokens_per_sec, args.ttft_ms, error_429=args.error_429,
+                        error_500=args.error_500, seed=args.seed)
+    print(f"Simulando {args.students} alunos x {args.rounds} ciclos...")
+    report = run_load_test(args.students, args.rounds, args.base_url, cfg)
+    print("\nResultado:")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
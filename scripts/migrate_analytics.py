@@ -1,85 +1,72 @@
 import sys
 import os
-import json
-import time
+import argparse
 
 # Permite importar arquivos do app principal
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parent_dir)
 
-from analytics import get_all_users_analytics_firebase, get_all_dbs, is_firebase_connected
 from logic import QUESTIONS, evaluate_answer_with_ai
+from migration_runner import MigrationRunner
 
 q_map = {q['id']: q for q in QUESTIONS}
 
-def run_migration():
+def rescore_case(doc_id: str, data: dict):
+    """
+    Re-avalia a resposta registrada com o avaliador atual.
+    Retorna o update do documento ou None se não houver o que atualizar.
+    O update usa caminhos pontuados (case_result.<campo>) só com os campos
+    reavaliados: o dict lido no início do shard pode ser de horas atrás, e
+    regravar case_result inteiro apagaria o que chegou depois (ex: retries).
+    """
+    original = data.get("case_result", {}) or {}
+    result = dict(original)
+    q_data = q_map.get(data.get("case_id"))
+    if not q_data:
+        return None
+
+    user_answer = result.get("user_answer", "Ausente ou não registrada")
+    ai_evaluation = evaluate_answer_with_ai(q_data, user_answer)
+
+    if "criterios" in ai_evaluation:
+        result["criterios"] = ai_evaluation["criterios"]
+        # Atualizando os pontos
+        points = 0.0
+        for crit, status in result["criterios"].items():
+            if "Completa" in status:
+                points += 1.0
+            elif "Parcial" in status:
+                points += 0.5
+        if points > 5.0: points = 5.0
+        result["points_gained"] = float(points)
+    elif "points" in ai_evaluation or "points_gained" in ai_evaluation:
+        # Avaliação objetiva (múltipla escolha)
+        result["points_gained"] = float(ai_evaluation.get("points_gained", ai_evaluation.get("points", 0.0)))
+        result["is_correct"] = bool(ai_evaluation.get("is_correct", result["points_gained"] > 0))
+        result["classification"] = ai_evaluation.get("classification", result.get("classification"))
+    else:
+        raise ValueError(f"Falha na avaliacao: {ai_evaluation}")
+
+    result["feedback"] = ai_evaluation.get("feedback", result.get("feedback", ""))
+    return {
+        f"case_result.{field}": value
+        for field, value in result.items()
+        if field not in original or original[field] != value
+    } or None
+
+def run_migration(dry_run: bool = False, workers: int = 4, rate: float = 2.0, restart: bool = False):
     print("Iniciando migracao do banco de dados (avaliando questoes legadas)...")
-    if not is_firebase_connected():
-        print("Erro: Firebase nao esta conectado.")
-        return
-        
-    all_dbs = get_all_dbs()
-    if not all_dbs:
-        print("Erro: Nenhum banco de dados retornado.")
-        return
-        
-    for db in all_dbs:
-        # Busca casos
-        case_docs = db.collection('case_analytics').get()
-        print(f"Lendo base de dados {db.project} - {len(case_docs)} registros encontrados.")
-        
-        atualizados = 0
-        pulados = 0
-        erros = 0
-        
-        for doc in case_docs:
-            data = doc.to_dict()
-            result = data.get("case_result", {})
-            
-            # Re-avalia TODOS os registros com o prompt atualizado (mais rigoroso)
-            # Se já tem criterios, força reavaliação para aplicar o novo prompt
-                
-            cid = data.get("case_id")
-            q_data = q_map.get(cid)
-            
-            if not q_data:
-                pulados += 1
-                continue
-                
-            user_answer = result.get("user_answer", "Ausente ou não registrada")
-            
-            # Pede à IA para reconstruir os criterios para o texto antigo
-            print(f"Re-avaliando resposta do usuario {data.get('user_id')}...")
-            ai_evaluation = evaluate_answer_with_ai(q_data, user_answer)
-            
-            if "criterios" in ai_evaluation:
-                result["criterios"] = ai_evaluation["criterios"]
-                # Atualizando os pontos
-                points = 0.0
-                for crit, status in result["criterios"].items():
-                    if "Completa" in status:
-                        points += 1.0
-                    elif "Parcial" in status:
-                        points += 0.5
-                if points > 5.0: points = 5.0
-                
-                result["points_gained"] = float(points)
-                result["feedback"] = ai_evaluation.get("feedback", result.get("feedback", ""))
-                
-                # Atualiza no firebase
-                try:
-                    db.collection('case_analytics').document(doc.id).update({
-                        "case_result": result
-                    })
-                    atualizados += 1
-                except Exception as e:
-                    print(f"Erro ao atualizar doc {doc.id}: {e}")
-                    erros += 1
-            else:
-                print(f"Falha na IA para a resposta {doc.id}: {ai_evaluation}")
-                erros += 1
-                
-        print(f"\nFinalizado BD. \nAtualizados: {atualizados} | Pulados: {pulados} | Erros de IA: {erros}\n")
+    runner = MigrationRunner('rescore_case_analytics', rescore_case,
+                             workers=workers, rate_per_sec=rate, dry_run=dry_run)
+    if restart:
+        runner.reset_checkpoint()
+    return runner.run('case_analytics')
 
 if __name__ == "__main__":
-    run_migration()
+    parser = argparse.ArgumentParser(description="Re-avalia todos os registros de case_analytics.")
+    parser.add_argument("--dry-run", action="store_true", help="Avalia sem gravar nada no Firestore")
+    parser.add_argument("--workers", type=int, default=4, help="Avaliações em paralelo")
+    parser.add_argument("--rate", type=float, default=2.0, help="Máximo de avaliações por segundo (0 = sem limite)")
+    parser.add_argument("--restart", action="store_true", help="Ignora o checkpoint e recomeça do zero")
+    args = parser.parse_args()
+    run_migration(dry_run=args.dry_run, workers=args.workers, rate=args.rate, restart=args.restart)
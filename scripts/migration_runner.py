@@ -0,0 +1,190 @@
+"""
+Executor genérico de migrações sobre coleções do Firestore.
+
+- Pool de workers para a transformação de cada documento (ex: reavaliação com IA)
+- Limite de taxa compartilhado entre os workers (chamadas por segundo)
+- Escritas em lote (até 500 updates por commit)
+- Checkpoint em arquivo, por id de documento: reiniciar continua de onde parou.
+  Os updates pendentes são gravados e o checkpoint salvo a cada
+  CHECKPOINT_EVERY_DOCS documentos ou CHECKPOINT_EVERY_SECONDS, o que vier antes,
+  para que uma queda não descarte minutos de chamadas pagas à IA
+- Modo dry-run (nada é gravado) e métricas de throughput
+
+Uso:
+    runner = MigrationRunner('rescore', transform, workers=8, rate_per_sec=5)
+    runner.run('case_analytics')
+
+`transform(doc_id, data)` retorna o dict de update do documento ou None para pular.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional
+
+# Permite importar arquivos do app principal
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from firebase_config import get_shards, is_firebase_connected
+
+BATCH_LIMIT = 500
+# Intervalo de checkpoint, independente do tamanho do lote
+CHECKPOINT_EVERY_DOCS = 25
+CHECKPOINT_EVERY_SECONDS = 15.0
+CHECKPOINT_DIR = os.path.join(os.path.expanduser("~"), ".clintutor", "migrations")
+
+
+class RateLimiter:
+    """Token bucket simples e thread-safe (rate_per_sec <= 0 desativa o limite)."""
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class MigrationRunner:
+    """Aplica `transform` a todos os documentos de uma coleção em todos os shards."""
+
+    def __init__(self, name: str, transform: Callable[[str, Dict], Optional[Dict]],
+                 workers: int = 4, rate_per_sec: float = 0, dry_run: bool = False,
+                 checkpoint_path: str = None):
+        self.name = name
+        self.transform = transform
+        self.workers = workers
+        self.limiter = RateLimiter(rate_per_sec)
+        self.dry_run = dry_run
+        self.checkpoint_path = checkpoint_path or os.path.join(CHECKPOINT_DIR, f"{name}.json")
+        self.checkpoint = self._load_checkpoint()
+        self.metrics = {'lidos': 0, 'atualizados': 0, 'pulados': 0, 'ja_migrados': 0, 'erros': 0}
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+
+    def _load_checkpoint(self) -> Dict[str, str]:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_checkpoint(self):
+        if self.dry_run:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def reset_checkpoint(self):
+        self.checkpoint = {}
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    def _evaluate(self, doc_id: str, data: Dict):
+        self.limiter.wait()
+        return self.transform(doc_id, data)
+
+    def _flush(self, db, pending: list):
+        """Grava um lote de updates e salva o checkpoint (inclusive os docs pulados)."""
+        if not pending:
+            self._save_checkpoint()
+            return
+        if not self.dry_run:
+            batch = db.batch()
+            for ref, update, _ in pending:
+                batch.update(ref, update)
+            try:
+                batch.commit()
+            except Exception as e:
+                print(f"Erro ao gravar lote de {len(pending)} docs: {e}")
+                self.metrics['erros'] += len(pending)
+                pending.clear()
+                self._save_checkpoint()
+                return
+        for _, _, key in pending:
+            self.checkpoint[key] = 'done'
+        self.metrics['atualizados'] += len(pending)
+        self._save_checkpoint()
+        pending.clear()
+
+    def run(self, collection: str) -> Dict[str, float]:
+        if not is_firebase_connected():
+            print("Erro: Firebase nao esta conectado.")
+            return self.metrics
+
+        started = time.monotonic()
+        modo = " (DRY-RUN: nada sera gravado)" if self.dry_run else ""
+        print(f"Iniciando migracao '{self.name}' em {collection}{modo}...")
+
+        for shard_idx, db in get_shards():
+            docs = db.collection(collection).get()
+            todo = []
+            for doc in docs:
+                key = f"{shard_idx}/{doc.id}"
+                if key in self.checkpoint:
+                    self.metrics['ja_migrados'] += 1
+                    continue
+                todo.append((key, doc))
+            print(f"Shard {shard_idx}: {len(docs)} registros, {len(todo)} pendentes.")
+
+            pending = []
+            since_flush = 0
+            last_flush = time.monotonic()
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self._evaluate, doc.id, doc.to_dict() or {}): (key, doc) for key, doc in todo}
+                for future in as_completed(futures):
+                    key, doc = futures[future]
+                    self.metrics['lidos'] += 1
+                    try:
+                        update = future.result()
+                    except Exception as e:
+                        print(f"Erro ao transformar doc {doc.id}: {e}")
+                        self.metrics['erros'] += 1
+                    else:
+                        if update:
+                            pending.append((doc.reference, update, key))
+                        else:
+                            self.metrics['pulados'] += 1
+                            self.checkpoint[key] = 'skipped'
+                    since_flush += 1
+                    if (since_flush >= CHECKPOINT_EVERY_DOCS or len(pending) >= BATCH_LIMIT
+                            or time.monotonic() - last_flush >= CHECKPOINT_EVERY_SECONDS):
+                        self._flush(db, pending)
+                        self._print_progress(started)
+                        since_flush = 0
+                        last_flush = time.monotonic()
+            self._flush(db, pending)
+
+        self._print_progress(started, final=True)
+        return self.metrics
+
+    def _print_progress(self, started: float, final: bool = False):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.metrics['segundos'] = round(elapsed, 1)
+        self.metrics['docs_por_segundo'] = round(self.metrics['lidos'] / elapsed, 2)
+        prefixo = "\nFinalizado." if final else "Progresso:"
+        print(f"{prefixo} Lidos: {self.metrics['lidos']} | Atualizados: {self.metrics['atualizados']} | "
+              f"Pulados: {self.metrics['pulados']} | Ja migrados: {self.metrics['ja_migrados']} | "
+              f"Erros: {self.metrics['erros']} | {self.metrics['docs_por_segundo']} docs/s")
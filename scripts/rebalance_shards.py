@@ -0,0 +1,45 @@
+import sys
+import os
+import argparse
+
+# Permite importar arquivos do app principal
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+
+from firebase_config import is_firebase_connected
+from shard_rebalancer import pin_current_routes, plan_moves, move_users, MOVE_CHUNK
+
+def run_rebalance(pin: bool = False, dry_run: bool = False):
+    if not is_firebase_connected():
+        print("Erro: Firebase nao esta conectado.")
+        return
+
+    if pin:
+        pin_current_routes()
+        return
+
+    moves = plan_moves()
+    print(f"{len(moves)} usuarios fora do shard-alvo.")
+    movidos = 0
+    erros = 0
+    if dry_run:
+        for user_id, src_idx, dst_idx in moves:
+            print(f"  {user_id}: {src_idx} -> {dst_idx}")
+        return
+    # Em lotes: cada lote espera os processos do app relerem as rotas antes de apagar a origem
+    for start in range(0, len(moves), MOVE_CHUNK):
+        for user_id, n, error in move_users(moves[start:start + MOVE_CHUNK]):
+            if error is not None:
+                print(f"  Erro ao mover {user_id}: {error}")
+                erros += 1
+            else:
+                print(f"  {user_id}: {n} docs movidos")
+                movidos += 1
+    print(f"\nFinalizado. Movidos: {movidos} | Erros: {erros}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebalanceia usuarios entre os shards do Firestore.")
+    parser.add_argument("--pin", action="store_true", help="Fixa a rota atual de todos os usuarios (rodar antes de mudar a config)")
+    parser.add_argument("--dry-run", action="store_true", help="Apenas lista as movimentacoes")
+    args = parser.parse_args()
+    run_rebalance(pin=args.pin, dry_run=args.dry_run)
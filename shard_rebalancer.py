@@ -0,0 +1,207 @@
+"""
+Rebalanceamento de usuários entre shards do Firestore.
+
+Fluxo para adicionar um novo projeto Firebase sem perder dados:
+1. Com a configuração ATUAL, rodar `pin_current_routes()` — grava em shard_routes
+   o shard onde cada usuário está hoje.
+2. Adicionar firebase_credentials_N e ativar em [firebase_sharding]:
+   strategy = "consistent" e routing_table = true (com mais de 2 shards o app
+   não inicia sem os dois). Usuários fixados continuam
+   lendo do shard antigo; usuários novos já caem no anel.
+3. Iniciar o rebalanceador (`start_background_rebalance()` ou
+   `python scripts/rebalance_shards.py`): ele copia os documentos de cada usuário
+   cuja rota difere do shard-alvo e atualiza a rota; depois espera os processos do
+   app relerem a rota (ROUTE_TTL_SECONDS), relê toda a origem, recopia o que foi
+   criado ou alterado nesse intervalo e só então apaga a origem.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from firebase_config import _manager, get_firestore_db, ROUTE_TTL_SECONDS
+
+# Coleções particionadas por user_id
+SHARDED_COLLECTIONS = ('case_analytics', 'chat_interactions')
+BATCH_LIMIT = 500
+# Espera entre trocar as rotas e apagar a origem: todo processo relê a rota nesse prazo
+ROUTE_SETTLE_SECONDS = ROUTE_TTL_SECONDS + 5
+# Usuários trocados de rota antes de cada espera
+MOVE_CHUNK = 50
+
+
+def pin_current_routes() -> int:
+    """Grava a rota atual de todos os usuários (rodar ANTES de mudar a configuração)."""
+    db = get_firestore_db()
+    routes = _manager.get_routes()
+    pinned = 0
+    batch = db.batch()
+    pending = 0
+    for doc in db.collection('users').select([]).get():
+        if doc.id in routes:
+            continue
+        batch.set(db.collection('shard_routes').document(doc.id),
+                  {'shard': _manager.shard_index_for_user(doc.id)})
+        pending += 1
+        pinned += 1
+        if pending >= BATCH_LIMIT:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    print(f"SHARDS: {pinned} rotas fixadas")
+    return pinned
+
+
+def plan_moves() -> List[Tuple[str, int, int]]:
+    """Lista (user_id, shard_atual, shard_alvo) dos usuários fora do shard-alvo."""
+    return [
+        (uid, current, _manager.target_shard(uid))
+        for uid, current in _manager.get_routes().items()
+        if current != _manager.target_shard(uid)
+    ]
+
+
+def _copy_collection(src, dst, collection: str, user_id: str, copied: Dict[str, Tuple] = None) -> Dict[str, Tuple]:
+    """
+    Copia os documentos do usuário mantendo o mesmo id, sobrescrevendo o destino.
+    Com `copied` (retorno de uma cópia anterior), recopia todo documento da origem
+    que mudou ou surgiu desde então. Retorna {id: (ref de origem, dados copiados)}
+    de todos os documentos que estão na origem agora.
+    """
+    copied = copied or {}
+    current = {}
+    batch = dst.batch()
+    pending = 0
+    for doc in src.collection(collection).where('user_id', '==', user_id).get():
+        data = doc.to_dict()
+        current[doc.id] = (doc.reference, data)
+        previous = copied.get(doc.id)
+        if previous is not None and previous[1] == data:
+            # Igual ao já copiado: regravar só apagaria escritas feitas no destino
+            continue
+        batch.set(dst.collection(collection).document(doc.id), data)
+        pending += 1
+        if pending >= BATCH_LIMIT:
+            batch.commit()
+            batch = dst.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    return current
+
+
+def _delete_refs(db, refs: List):
+    for i in range(0, len(refs), BATCH_LIMIT):
+        batch = db.batch()
+        for ref in refs[i:i + BATCH_LIMIT]:
+            batch.delete(ref)
+        batch.commit()
+
+
+def move_users(moves: List[Tuple[str, int, int]],
+               settle_seconds: float = ROUTE_SETTLE_SECONDS) -> List[Tuple[str, int, Optional[Exception]]]:
+    """
+    Move os dados de vários usuários em três fases:
+    1. copia os documentos de cada um para o destino e troca a rota
+    2. espera os processos do app relerem a rota (até lá eles ainda gravam na origem)
+    3. relê toda a origem, recopia o que foi criado ou alterado desde a primeira
+       cópia e só então apaga a origem
+    Se falhar antes da troca, a rota ainda aponta para a origem e nada se perde.
+    Retorna (user_id, documentos movidos, erro) de cada usuário.
+    """
+    results = []
+    switched = []
+    for user_id, src_idx, dst_idx in moves:
+        src, dst = _manager.dbs[src_idx], _manager.dbs[dst_idx]
+        try:
+            if src is dst:
+                _manager.set_user_route(user_id, dst_idx)
+                results.append((user_id, 0, None))
+                continue
+            copied = {c: _copy_collection(src, dst, c, user_id) for c in SHARDED_COLLECTIONS}
+            _manager.set_user_route(user_id, dst_idx)
+            switched.append((user_id, src, dst, copied))
+        except Exception as e:
+            results.append((user_id, 0, e))
+
+    if switched and settle_seconds > 0:
+        time.sleep(settle_seconds)
+
+    for user_id, src, dst, copied in switched:
+        try:
+            # Relê a origem inteira logo antes de apagar: documentos novos ou
+            # alterados por processos com a rota antiga (ex: ArrayUnion em
+            # case_result.retries) são recopiados por cima do destino
+            final = {c: _copy_collection(src, dst, c, user_id, copied[c]) for c in SHARDED_COLLECTIONS}
+            for docs in final.values():
+                _delete_refs(src, [ref for ref, _ in docs.values()])
+            results.append((user_id, sum(len(docs) for docs in final.values()), None))
+        except Exception as e:
+            # A rota já aponta para o destino e a origem não foi apagada:
+            # move_user(user_id, origem, destino) de novo conclui a movimentação
+            results.append((user_id, 0, e))
+    return results
+
+
+def move_user(user_id: str, src_idx: int, dst_idx: int, settle_seconds: float = ROUTE_SETTLE_SECONDS) -> int:
+    """Move os dados de um usuário (ver move_users). Retorna quantos documentos foram movidos."""
+    (_, moved, error), = move_users([(user_id, src_idx, dst_idx)], settle_seconds)
+    if error is not None:
+        raise error
+    return moved
+
+
+class BackgroundRebalancer:
+    """Executa plan_moves()/move_user() numa thread daemon, com status consultável."""
+
+    def __init__(self, pause_seconds: float = 0.2):
+        self.pause_seconds = pause_seconds
+        self.status: Dict = {'running': False, 'planned': 0, 'moved_users': 0, 'moved_docs': 0, 'errors': 0}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="shard-rebalancer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self.status.update(running=True, moved_users=0, moved_docs=0, errors=0)
+        try:
+            moves = plan_moves()
+            self.status['planned'] = len(moves)
+            for start in range(0, len(moves), MOVE_CHUNK):
+                if self._stop.is_set():
+                    break
+                for user_id, moved, error in move_users(moves[start:start + MOVE_CHUNK]):
+                    if error is not None:
+                        print(f"SHARDS: erro ao mover {user_id}: {error}")
+                        self.status['errors'] += 1
+                    else:
+                        self.status['moved_docs'] += moved
+                        self.status['moved_users'] += 1
+                # Pausa curta entre lotes para não competir com o tráfego do app
+                time.sleep(self.pause_seconds)
+        finally:
+            self.status['running'] = False
+            print(f"SHARDS: rebalanceamento finalizado {self.status}")
+
+
+_rebalancer = BackgroundRebalancer()
+
+
+def start_background_rebalance() -> Dict:
+    """Inicia (se ainda não estiver rodando) o rebalanceador e retorna o status."""
+    _rebalancer.start()
+    return _rebalancer.status
+
+
+def get_rebalance_status() -> Dict:
+    return _rebalancer.status
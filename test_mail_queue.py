@@ -0,0 +1,141 @@
+"""
+Script de teste da fila de emails (mail_queue) contra um SMTP local.
+
+Sobe um servidor SMTP mínimo em 127.0.0.1 (sem TLS e sem login, como o modo
+'plain' de CLINTUTOR_SMTP_HOST) que só guarda as mensagens recebidas, e verifica:
+- envio de várias mensagens pela mesma conexão
+- reconexão quando o servidor derruba a conexão ociosa
+- dead-letter quando o servidor fica indisponível
+"""
+
+import sys
+import os
+import json
+import tempfile
+import threading
+import socketserver
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import mail_queue
+from mail_queue import MailQueue
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Diálogo SMTP suficiente para o smtplib: EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self._reply("220 localhost ClinTutor SMTP de teste")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250 localhost")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 Fim com <CRLF>.<CRLF>")
+                data = []
+                for raw in iter(self.rfile.readline, b""):
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw)
+                server.messages.append(b"".join(data).decode(errors="replace"))
+                self._reply("250 OK")
+                if server.drop_after_message:
+                    # Simula o servidor derrubando a conexão ociosa
+                    return
+            elif command == "QUIT":
+                self._reply("221 Tchau")
+                return
+            else:
+                self._reply("500 Comando desconhecido")
+
+
+class _LocalSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.drop_after_message = False
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+def _message(to: str, subject: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg['To'] = to
+    msg['Subject'] = subject
+    msg.set_content("Mensagem de teste do ClinTutor")
+    return msg
+
+
+def _settings(port: int):
+    return lambda: {'host': '127.0.0.1', 'port': port, 'mode': 'plain',
+                    'sender': 'clintutor@localhost', 'username': None, 'password': None}
+
+
+def test_mail_queue_local_smtp():
+    """Envia pela fila contra o SMTP local"""
+    print("=" * 60)
+    print("🧪 TESTE DA FILA DE EMAILS CONTRA SMTP LOCAL")
+    print("=" * 60)
+
+    server = _LocalSMTPServer()
+    port = server.server_address[1]
+    dead_letter = os.path.join(tempfile.mkdtemp(), "dead_letter.jsonl")
+    queue = MailQueue(settings_provider=_settings(port), dead_letter_path=dead_letter)
+
+    try:
+        # 1. Várias mensagens pela mesma conexão
+        for i in range(3):
+            queue.enqueue(_message(f"aluno{i}@exemplo.com", f"Teste {i}"))
+        assert queue.wait_idle(10), "fila não esvaziou"
+        assert len(server.messages) == 3, server.messages
+        assert server.connections == 1, f"{server.connections} conexões para 3 mensagens"
+        assert all("From: clintutor@localhost" in m for m in server.messages)
+        print(f"\n✅ 3 mensagens enviadas em {server.connections} conexão")
+
+        # 2. Servidor derruba a conexão: a próxima mensagem reconecta
+        server.drop_after_message = True
+        queue.enqueue(_message("aluno3@exemplo.com", "Teste 3"))
+        assert queue.wait_idle(10)
+        queue.enqueue(_message("aluno4@exemplo.com", "Teste 4"))
+        assert queue.wait_idle(10)
+        assert len(server.messages) == 5, server.messages
+        assert queue.stats['retried'] == 0, queue.stats
+        print(f"✅ Reconexão após queda: {server.connections} conexões no total")
+
+        # 3. Servidor fora do ar: tentativas esgotam e a mensagem vai para o dead-letter
+        server.shutdown()
+        server.server_close()
+        attempts, base = mail_queue.MAX_ATTEMPTS, mail_queue.RETRY_BASE_SECONDS
+        mail_queue.MAX_ATTEMPTS, mail_queue.RETRY_BASE_SECONDS = 2, 0.05
+        try:
+            queue._close()
+            queue.enqueue(_message("aluno5@exemplo.com", "Teste 5"))
+            assert queue.wait_idle(10)
+        finally:
+            mail_queue.MAX_ATTEMPTS, mail_queue.RETRY_BASE_SECONDS = attempts, base
+        with open(dead_letter, encoding="utf-8") as f:
+            dead = [json.loads(line) for line in f]
+        assert [d['to'] for d in dead] == ["aluno5@exemplo.com"], dead
+        assert queue.stats['dead'] == 1, queue.stats
+        print(f"✅ Dead-letter após {dead[0]['attempts']} tentativas: {dead[0]['error']}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_mail_queue_local_smtp()
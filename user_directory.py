@@ -0,0 +1,183 @@
+"""
+Diretório de usuários em memória (read-through).
+
+Carrega a coleção `users` (ou o users.json local) uma única vez por processo e
+mantém índices por id, email, user_type e turma. Autenticação por cookie,
+verificação de email no cadastro e listas de alunos passam a ser consultas O(1)
+em memória, sem leitura no Firestore.
+
+O diretório é compartilhado entre sessões via `st.cache_resource` e atualizado
+pelas próprias funções de cadastro/edição/remoção de auth_firebase.py. Alterações
+feitas por outra instância do servidor (ou direto no Firestore) aparecem na
+recarga completa a cada DIRECTORY_TTL_SECONDS; até lá, um id ou email que não esteja
+no índice é buscado no banco e incorporado na hora, e o login sempre relê o
+documento do usuário antes de conferir a senha.
+"""
+
+import time
+import threading
+import streamlit as st
+from typing import Callable, Dict, List, Optional, Set
+
+# Recarga completa da coleção de usuários (enxerga cadastros/edições de outras instâncias)
+DIRECTORY_TTL_SECONDS = 300
+
+
+def _normalize_email(email: str) -> str:
+    return (email or '').lower().strip()
+
+
+class UserDirectory:
+    """Índices em memória da coleção de usuários (thread-safe)."""
+
+    def __init__(self, loader: Callable[[], List[Dict]], ttl_seconds: float = DIRECTORY_TTL_SECONDS):
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._expires_at = 0.0
+        self._by_id: Dict[str, Dict] = {}
+        self._by_email: Dict[str, str] = {}          # email -> id
+        self._by_type: Dict[str, Set[str]] = {}      # user_type -> ids
+        self._by_turma: Dict[str, Set[str]] = {}     # turma -> ids
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def _ensure_loaded(self):
+        if self._loaded and time.monotonic() < self._expires_at:
+            return
+        with self._lock:
+            if self._loaded and time.monotonic() < self._expires_at:
+                return
+            try:
+                users = self._loader()
+            except Exception as e:
+                if self._loaded:
+                    # Mantém os índices atuais e tenta de novo só no próximo prazo
+                    self._expires_at = time.monotonic() + self.ttl_seconds
+                    print(f"USERS: erro ao recarregar diretório, mantendo o atual: {e}")
+                else:
+                    # Não marca como carregado: a próxima consulta tenta de novo
+                    print(f"USERS: erro ao carregar diretório: {e}")
+                return
+            # Monta os índices à parte e troca de uma vez: consultas sem lock nunca
+            # veem o diretório pela metade durante a recarga
+            staging = UserDirectory(self._loader, self.ttl_seconds)
+            for user in users:
+                staging._index(user)
+            self._by_id, self._by_email = staging._by_id, staging._by_email
+            self._by_type, self._by_turma = staging._by_type, staging._by_turma
+            self._loaded = True
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            print(f"USERS: diretório carregado com {len(self._by_id)} usuários")
+
+    def is_ready(self) -> bool:
+        """True se os índices já estão em memória (não dispara a carga)."""
+        return self._loaded
+
+    def is_loaded(self) -> bool:
+        self._ensure_loaded()
+        return self._loaded
+
+    def reload(self):
+        """Descarta os índices; a próxima consulta recarrega do banco."""
+        with self._lock:
+            self._by_id.clear()
+            self._by_email.clear()
+            self._by_type.clear()
+            self._by_turma.clear()
+            self._loaded = False
+
+    # ------------------------------------------------------------------
+    # Manutenção dos índices
+    # ------------------------------------------------------------------
+
+    def _index(self, user: Dict):
+        uid = str(user['id'])
+        self._unindex(uid)
+        self._by_id[uid] = user
+        email = _normalize_email(user.get('email'))
+        if email:
+            self._by_email[email] = uid
+        self._by_type.setdefault(user.get('user_type'), set()).add(uid)
+        if user.get('turma'):
+            self._by_turma.setdefault(user['turma'], set()).add(uid)
+
+    def _unindex(self, uid: str):
+        old = self._by_id.pop(uid, None)
+        if old is None:
+            return
+        email = _normalize_email(old.get('email'))
+        if self._by_email.get(email) == uid:
+            del self._by_email[email]
+        self._by_type.get(old.get('user_type'), set()).discard(uid)
+        if old.get('turma'):
+            self._by_turma.get(old['turma'], set()).discard(uid)
+
+    def upsert(self, user: Dict):
+        """Insere ou substitui um usuário (cadastro ou leitura pontual)."""
+        with self._lock:
+            self._index(dict(user))
+
+    def update(self, user_id, fields: Dict):
+        """Aplica um update parcial a um usuário já indexado."""
+        with self._lock:
+            current = self._by_id.get(str(user_id))
+            if current is None:
+                return
+            merged = dict(current)
+            merged.update(fields)
+            self._index(merged)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._unindex(str(user_id))
+
+    # ------------------------------------------------------------------
+    # Consultas (retornam cópias para não vazar o estado interno; ids no tipo
+    # original: str no Firebase, int no banco local)
+    # ------------------------------------------------------------------
+
+    def get_by_id(self, user_id) -> Optional[Dict]:
+        self._ensure_loaded()
+        user = self._by_id.get(str(user_id))
+        return dict(user) if user else None
+
+    def get_by_email(self, email: str) -> Optional[Dict]:
+        self._ensure_loaded()
+        uid = self._by_email.get(_normalize_email(email))
+        return self.get_by_id(uid) if uid else None
+
+    def email_exists(self, email: str) -> bool:
+        self._ensure_loaded()
+        return _normalize_email(email) in self._by_email
+
+    def ids_by_type(self, user_type: str) -> List[str]:
+        self._ensure_loaded()
+        with self._lock:
+            return [self._by_id[uid]['id'] for uid in self._by_type.get(user_type, ())]
+
+    def ids_by_turma(self, turma: str) -> List[str]:
+        self._ensure_loaded()
+        with self._lock:
+            return [self._by_id[uid]['id'] for uid in self._by_turma.get(turma, ())]
+
+    def all_users(self) -> List[Dict]:
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(u) for u in self._by_id.values()]
+
+
+@st.cache_resource(show_spinner=False)
+def _get_directory(backend: str) -> UserDirectory:
+    """Uma instância por backend ('firebase' ou 'local') e por processo."""
+    from auth_firebase import load_all_users_firebase, load_users_local
+    loader = load_all_users_firebase if backend == 'firebase' else load_users_local
+    return UserDirectory(loader)
+
+
+def get_user_directory() -> UserDirectory:
+    from firebase_config import is_firebase_connected
+    return _get_directory('firebase' if is_firebase_connected() else 'local')